@@ -0,0 +1,247 @@
+"""
+asyncio counterpart of `AuthSession`, built on httpx. Requires the `async` extra:
+pip install annotell-auth[async]
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Optional, Union
+
+try:
+    import httpx
+except ImportError as e:
+    raise ImportError("The async clients require httpx, install with `pip install annotell-auth[async]`") from e
+
+from .authsession import DEFAULT_HOST, DEFAULT_REFRESH_MARGIN
+from .credentials_parser import resolve_credentials
+from .token_cache import TokenCache
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+log = logging.getLogger(__name__)
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_http_client(http2: Optional[bool] = None,
+                       max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                       max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                       timeout: Union[float, httpx.Timeout] = DEFAULT_TIMEOUT) -> httpx.AsyncClient:
+    """
+    Pooled async http client. With HTTP/2, many concurrent requests to the same host share a
+    single connection.
+
+    :param http2: use HTTP/2 when the server supports it, defaults to True if the h2 package is installed
+    :param max_connections: max number of open connections
+    :param max_keepalive_connections: max number of idle connections kept open for reuse
+    :param timeout: seconds, or an httpx.Timeout
+    """
+    if http2 is None:
+        http2 = http2_available()
+    limits = httpx.Limits(max_connections=max_connections,
+                          max_keepalive_connections=max_keepalive_connections)
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+
+
+class AsyncAuthSession:
+    """
+    Sends authenticated requests with a pooled httpx client, fetching and refreshing the token as
+    needed. Concurrent requests share a single token fetch. One AsyncAuthSession can be shared by
+    several async API clients by passing it as their `auth` parameter. Use it in one event loop only.
+    """
+    def __init__(self, *,
+                 auth=None,
+                 client_id: Optional[str] = None,
+                 client_secret: Optional[str] = None,
+                 host: str = DEFAULT_HOST,
+                 refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+                 token_cache: Optional[TokenCache] = None,
+                 http_client: Optional[httpx.AsyncClient] = None):
+        """
+        :param auth: authentication credentials
+        :param client_id: client id for authentication
+        :param client_secret: client secret for authentication
+        :param host: base url for authentication server
+        :param refresh_margin: seconds before a token expires that a new token is fetched
+        :param token_cache: cache to share tokens with other processes, defaults to a cache in the
+        directory given by env ANNOTELL_TOKEN_CACHE if set
+        :param http_client: client used for all requests, defaults to `create_http_client()`
+        """
+        self.host = host
+        self.refresh_margin = refresh_margin
+        self.token_url = "%s/v1/auth/oauth/token" % self.host
+
+        client_id, client_secret = resolve_credentials(auth, client_id, client_secret)
+        self.client_id = client_id
+        self._client_secret = client_secret
+        self.token_cache = token_cache if token_cache is not None else TokenCache.from_env()
+        self.http_client = http_client if http_client is not None else create_http_client()
+
+        self._token = None
+        self._expires_at = None
+        # created on first use, so that it belongs to the running event loop
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def _token_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @staticmethod
+    async def _run_blocking(fun, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, fun, *args)
+
+    def _set_token(self, token):
+        self._token = token
+        self._expires_at = datetime.utcfromtimestamp(token['expires_at'])
+        log.info(f"Got new token, with ttl={token['expires_in']} and expires {self._expires_at} UTC")
+
+    async def _request_token(self) -> dict:
+        data = dict(grant_type="client_credentials",
+                    client_id=self.client_id,
+                    client_secret=self._client_secret)
+        resp = await self.http_client.post(self.token_url, data=data, headers={"Accept": "application/json"})
+        resp.raise_for_status()
+        token = resp.json()
+        if 'expires_at' not in token:
+            token['expires_at'] = int(time.time()) + int(token['expires_in'])
+        return token
+
+    async def _fetch_token(self):
+        if self.token_cache is None:
+            log.debug("Fetching token")
+            self._set_token(await self._request_token())
+            return
+
+        # the file lock is held from loading the cached token until the new one is saved, like in
+        # `AuthSession.fetch_token`, so that processes starting at the same time fetch a single token.
+        # It is taken and released in threads, so waiting for it does not block the event loop.
+        cache_lock = self.token_cache.lock(self.client_id, self.host)
+        await self._run_blocking(cache_lock.__enter__)
+        try:
+            token = await self._run_blocking(self.token_cache.load, self.client_id, self.host, self.refresh_margin)
+            if token is None or token.get('access_token') == self.access_token:
+                log.debug("Fetching token")
+                token = await self._request_token()
+                await self._run_blocking(self.token_cache.save, self.client_id, self.host, token)
+            else:
+                log.debug("Using token from token cache")
+        finally:
+            await self._run_blocking(cache_lock.__exit__, None, None, None)
+        self._set_token(token)
+
+    async def fetch_token(self):
+        async with self._token_lock:
+            await self._fetch_token()
+
+    def _needs_token(self) -> bool:
+        token = self._token
+        return token is None or token['expires_at'] - self.refresh_margin <= time.time()
+
+    async def ensure_token(self):
+        """Fetches a new token if there is none, or if the current one is about to expire"""
+        if self._needs_token():
+            async with self._token_lock:
+                # another task may have fetched a token while we waited for the lock
+                if self._needs_token():
+                    await self._fetch_token()
+
+    async def refresh_token(self, stale_token=None):
+        """
+        Fetches a new token to replace `stale_token`. If another task has already replaced it,
+        that token is used instead of fetching yet another one.
+        """
+        async with self._token_lock:
+            if stale_token is None or self._token is stale_token:
+                if self.token_cache is not None and stale_token is not None:
+                    await self._run_blocking(self.token_cache.invalidate, self.client_id, self.host, stale_token)
+                await self._fetch_token()
+            return self._token
+
+    @property
+    def token(self):
+        return self._token
+
+    @property
+    def access_token(self):
+        return self._token.get('access_token') if self._token is not None else None
+
+    async def request(self, method: str, url: str, *,
+                      headers: Optional[dict] = None,
+                      stream: bool = False,
+                      **kwargs) -> httpx.Response:
+        """
+        Sends an authenticated request, refreshing the token and retrying once if it is rejected.
+        Takes the same keyword arguments as `httpx.AsyncClient.build_request`. A request with a streamed
+        `content`, e.g. an async generator, can not be sent again, so its rejected response is returned
+        after the token has been refreshed.
+
+        :param stream: If True the body is not read, and the response must be closed with `aclose()`
+        """
+        await self.ensure_token()
+        token = self._token
+        resp = await self._send(method, url, token, headers, stream, kwargs)
+        if resp.status_code == 401:
+            # the token can be revoked before it expires
+            log.warning("Got invalid token, refreshing token")
+            if not _is_replayable(kwargs.get("content")):
+                await self.refresh_token(stale_token=token)
+                log.warning(f"Not sending the request to {url} again, its streamed content has been consumed")
+                return resp
+            await resp.aclose()
+            token = await self.refresh_token(stale_token=token)
+            resp = await self._send(method, url, token, headers, stream, kwargs)
+        return resp
+
+    async def _send(self, method: str, url: str, token: dict, headers: Optional[dict], stream: bool,
+                    kwargs: dict) -> httpx.Response:
+        headers = {**(headers or {}), "Authorization": f"Bearer {token['access_token']}"}
+        request = self.http_client.build_request(method, url, headers=headers, **kwargs)
+        return await self.http_client.send(request, stream=stream)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+def _is_replayable(content) -> bool:
+    """True if the request content can be sent again, which iterators and generators can not"""
+    return content is None or isinstance(content, (bytes, bytearray, str))
+
+
+def resolve_async_auth_session(auth=None, host: str = DEFAULT_HOST) -> AsyncAuthSession:
+    """Returns `auth` if it is already an AsyncAuthSession, so it can be shared, otherwise creates a new one"""
+    if isinstance(auth, AsyncAuthSession):
+        return auth
+    return AsyncAuthSession(auth=auth, host=host)
@@ -1,25 +1,38 @@
 import logging
+import threading
+import time
 from datetime import datetime
 from typing import Optional
 import requests
 from authlib.integrations.requests_client import OAuth2Session
 from authlib.common.errors import AuthlibBaseError
 from .credentials_parser import resolve_credentials
+from .token_cache import TokenCache
+from .connection_pool import (
+    mount_connection_pool, Timeout, DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE
+)
 
 DEFAULT_HOST = "https://user.annotell.com"
 
+# refresh tokens this many seconds before they expire, so no request is sent with an expired token
+DEFAULT_REFRESH_MARGIN = 60
+
 log = logging.getLogger(__name__)
 
 # https://docs.authlib.org/en/latest/client/oauth2.html
 class AuthSession:
     """
-    Not thread safe
+    Thread safe. Tokens are fetched by one thread at a time, so threads sharing a session never
+    fetch more than one new token for the same expired one. One AuthSession can be shared by
+    several API clients by passing it as their `auth` parameter.
     """
     def __init__(self, *,
                  auth=None,
                  client_id: Optional[str] = None,
                  client_secret: Optional[str] = None,
-                 host: str = DEFAULT_HOST):
+                 host: str = DEFAULT_HOST,
+                 refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+                 token_cache: Optional[TokenCache] = None):
         """
         There is a variety of ways to setup the authentication. See
         https://github.com/annotell/annotell-python/tree/master/annotell-auth
@@ -27,11 +40,17 @@ class AuthSession:
         :param client_id: client id for authentication
         :param client_secret: client secret for authentication
         :param host: base url for authentication server
+        :param refresh_margin: seconds before a token expires that a new token is fetched
+        :param token_cache: cache to share tokens with other processes, defaults to a cache in the
+        directory given by env ANNOTELL_TOKEN_CACHE if set
         """
         self.host = host
+        self.refresh_margin = refresh_margin
         self.token_url = "%s/v1/auth/oauth/token" % self.host
 
         client_id, client_secret = resolve_credentials(auth, client_id, client_secret)
+        self.client_id = client_id
+        self.token_cache = token_cache if token_cache is not None else TokenCache.from_env()
 
         self.oauth_session = OAuth2Session(
             client_id=client_id,
@@ -43,24 +62,70 @@ class AuthSession:
 
         self._token = None
         self._expires_at = None
+        self._lock = threading.RLock()
 
     def _log_new_token(self):
         log.info(f"Got new token, with ttl={self._token['expires_in']} and expires {self._expires_at} UTC")
 
-    def _update_token(self, token, access_token=None, refresh_token=None):
+    def _set_token(self, token):
         self._token = token
+        self._expires_at = datetime.utcfromtimestamp(token['expires_at'])
         self._log_new_token()
 
+    def _update_token(self, token, access_token=None, refresh_token=None):
+        with self._lock:
+            self._set_token(token)
+            if self.token_cache is not None:
+                with self.token_cache.lock(self.client_id, self.host):
+                    self.token_cache.save(self.client_id, self.host, token)
+
     def init(self):
-        # maybe support loading from file?
-        # for now, just fetch a new token
+        # loads a token from the token cache if there is one, otherwise fetches a new token
         self.fetch_token()
 
     def fetch_token(self):
-        log.debug("Fetching token")
-        self._token = self.oauth_session.fetch_access_token(url=self.token_url)
-        self._expires_at = datetime.utcfromtimestamp(self._token['expires_at'])
-        self._log_new_token()
+        with self._lock:
+            if self.token_cache is None:
+                log.debug("Fetching token")
+                self._set_token(self.oauth_session.fetch_access_token(url=self.token_url))
+                return
+
+            with self.token_cache.lock(self.client_id, self.host):
+                token = self.token_cache.load(self.client_id, self.host, min_ttl=self.refresh_margin)
+                current_access_token = self.access_token
+                if token is None or token.get('access_token') == current_access_token:
+                    log.debug("Fetching token")
+                    token = self.oauth_session.fetch_access_token(url=self.token_url)
+                    self.token_cache.save(self.client_id, self.host, token)
+                else:
+                    log.debug("Using token from token cache")
+                    self.oauth_session.token = token
+                    token = self.oauth_session.token
+            self._set_token(token)
+
+    def _needs_token(self) -> bool:
+        token = self._token
+        return token is None or token['expires_at'] - self.refresh_margin <= time.time()
+
+    def ensure_token(self):
+        """Fetches a new token if there is none, or if the current one is about to expire"""
+        if self._needs_token():
+            with self._lock:
+                # another thread may have fetched a token while we waited for the lock
+                if self._needs_token():
+                    self.fetch_token()
+
+    def refresh_token(self, stale_token=None):
+        """
+        Fetches a new token to replace `stale_token`. If another thread has already replaced it,
+        that token is used instead of fetching yet another one.
+        """
+        with self._lock:
+            if stale_token is None or self._token is stale_token:
+                if self.token_cache is not None and stale_token is not None:
+                    self.token_cache.invalidate(self.client_id, self.host, stale_token)
+                self.fetch_token()
+            return self._token
 
     @property
     def token(self):
@@ -72,17 +137,60 @@ class AuthSession:
 
     @property
     def session(self):
-        if not self._token:
-            self.init()
+        self.ensure_token()
         return self.oauth_session.session
 
 
+def resolve_auth_session(auth=None, host: str = DEFAULT_HOST) -> AuthSession:
+    """Returns `auth` if it is already an AuthSession, so it can be shared, otherwise creates a new one"""
+    if isinstance(auth, AuthSession):
+        return auth
+    return AuthSession(auth=auth, host=host)
+
+
 class FaultTolerantAuthRequestSession:
     """An object that can be used like a Request session that handles token refresh"""
-    def __init__(self, auth=None, host=DEFAULT_HOST):
+    def __init__(self, auth=None, host=DEFAULT_HOST, *,
+                 pool_connections: Optional[int] = None,
+                 pool_maxsize: Optional[int] = None,
+                 pool_block: bool = False,
+                 tcp_keepalive: bool = False,
+                 timeout: Timeout = None):
+        """
+        The connection pool is only configured if any of its parameters are given, and only if the AuthSession
+        is created here. The pool of an AuthSession shared with other clients is left as it is, configure it
+        once with `mount_connection_pool(auth_session.oauth_session, ...)`. The timeout is applied to each
+        request, so it is kept per client either way.
+
+        :param auth: authentication credentials, or an AuthSession to share with other clients
+        :param host: base url for authentication server
+        :param pool_connections: number of hosts to keep a pool of connections for, defaults to 10
+        :param pool_maxsize: max number of connections kept open per host, defaults to 10. Set it to at
+        least the number of threads sending requests, or connections are closed after use.
+        :param pool_block: wait for a free connection instead of opening more than `pool_maxsize` per host
+        :param tcp_keepalive: send TCP keep-alive probes on idle connections
+        :param timeout: timeout for requests sent without one, in seconds or as (connect, read)
+        """
         self.auth = auth
         self.host = host
-        self._oauth_session = AuthSession(auth=auth, host=host)
+        self.timeout = timeout
+        self._oauth_session = resolve_auth_session(auth=auth, host=host)
+        configures_pool = pool_connections is not None or pool_maxsize is not None or pool_block or tcp_keepalive
+        if self._oauth_session is auth:
+            if configures_pool:
+                log.warning("Not changing the connection pool of the shared AuthSession, "
+                            "configure it once with mount_connection_pool(auth_session.oauth_session, ...)")
+        elif configures_pool or timeout is not None:
+            mount_connection_pool(self._oauth_session.oauth_session,
+                                  pool_connections=pool_connections or DEFAULT_POOL_CONNECTIONS,
+                                  pool_maxsize=pool_maxsize or DEFAULT_POOL_MAXSIZE,
+                                  pool_block=pool_block,
+                                  tcp_keepalive=tcp_keepalive,
+                                  timeout=timeout)
+
+    @property
+    def auth_session(self) -> AuthSession:
+        return self._oauth_session
 
     @property
     def request_session(self) -> requests.Session:
@@ -104,14 +212,17 @@ class FaultTolerantAuthRequestSession:
         return self._query(self.request_session.delete, *args, **kwargs)
 
     def _query(self, fun, *args, **kwargs):
+        if self.timeout is not None:
+            kwargs.setdefault("timeout", self.timeout)
         # add retry if the token has expired, this can happen when the session
         # is left open for many hours without any queries
+        token = self._oauth_session.token
         try:
             resp = fun(*args, **kwargs)
         except AuthlibBaseError as e:
             if e.error == "invalid_token":
-                log.warning("Got invalid token, resetting auth session")
-                self._oauth_session = AuthSession(auth=self.auth, host=self.host)
+                log.warning("Got invalid token, refreshing token")
+                self._oauth_session.refresh_token(stale_token=token)
                 resp = fun(*args, **kwargs)
             else:
                 raise
@@ -0,0 +1,79 @@
+"""Connection pool settings for the `requests` sessions used by the API clients"""
+import socket
+from typing import Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
+from urllib3.connection import HTTPConnection
+
+# number of hosts with a pool of their own, and connections kept open per host, the requests defaults
+DEFAULT_POOL_CONNECTIONS = DEFAULT_POOLSIZE
+DEFAULT_POOL_MAXSIZE = DEFAULT_POOLSIZE
+
+# seconds, or a (connect, read) tuple
+Timeout = Union[float, Tuple[float, float], None]
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with a default timeout for requests sent without one, and optional TCP keep-alive
+    probes, so that idle pooled connections are not silently dropped by proxies and load balancers.
+    """
+    __attrs__ = HTTPAdapter.__attrs__ + ["timeout", "tcp_keepalive"]
+
+    def __init__(self, timeout: Timeout = None, tcp_keepalive: bool = False, **kwargs):
+        # set before calling super, which creates the pool manager
+        self.timeout = timeout
+        self.tcp_keepalive = tcp_keepalive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.tcp_keepalive:
+            kwargs["socket_options"] = HTTPConnection.default_socket_options + \
+                [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout if timeout is not None else self.timeout, **kwargs)
+
+
+def mount_connection_pool(session: requests.Session,
+                          pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                          pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                          pool_block: bool = False,
+                          tcp_keepalive: bool = False,
+                          timeout: Timeout = None) -> None:
+    """
+    Replaces the http and https adapters of the session.
+
+    :param session: session to configure
+    :param pool_connections: number of hosts to keep a pool of connections for
+    :param pool_maxsize: max number of connections kept open per host. Requests beyond this open
+    new connections that are closed after use, unless `pool_block` is set.
+    :param pool_block: wait for a free connection instead of opening more than `pool_maxsize` per host
+    :param tcp_keepalive: send TCP keep-alive probes on idle connections
+    :param timeout: timeout for requests sent without one, in seconds or as (connect, read)
+    """
+    adapter = PooledHTTPAdapter(timeout=timeout,
+                                tcp_keepalive=tcp_keepalive,
+                                pool_connections=pool_connections,
+                                pool_maxsize=pool_maxsize,
+                                pool_block=pool_block)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def create_session(pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                   pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                   pool_block: bool = False,
+                   tcp_keepalive: bool = False,
+                   timeout: Timeout = None) -> requests.Session:
+    """Unauthenticated session with its own connection pool, see `mount_connection_pool`"""
+    session = requests.Session()
+    mount_connection_pool(session,
+                          pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize,
+                          pool_block=pool_block,
+                          tcp_keepalive=tcp_keepalive,
+                          timeout=timeout)
+    return session
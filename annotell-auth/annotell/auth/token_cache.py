@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_CACHE_DIR = "~/.cache/annotell/tokens"
+TOKEN_CACHE_ENV = "ANNOTELL_TOKEN_CACHE"
+
+log = logging.getLogger(__name__)
+
+
+@contextmanager
+def _file_lock(path: Path):
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class TokenCache:
+    """
+    Stores access tokens on disk, keyed by client id and auth host, so that processes using the
+    same credentials can reuse a token instead of each fetching a new one. Access is serialized
+    with a file lock, so parallel processes starting at the same time fetch a single token.
+    """
+
+    def __init__(self, directory: Union[str, Path] = DEFAULT_CACHE_DIR):
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    @staticmethod
+    def from_env() -> Optional["TokenCache"]:
+        """Token cache in the directory given by env ANNOTELL_TOKEN_CACHE, if set"""
+        directory = os.getenv(TOKEN_CACHE_ENV)
+        return TokenCache(directory) if directory else None
+
+    def _key(self, client_id: str, host: str) -> str:
+        return hashlib.sha256(f"{host}|{client_id}".encode("utf-8")).hexdigest()[:32]
+
+    def _path(self, client_id: str, host: str) -> Path:
+        return self.directory / f"{self._key(client_id, host)}.json"
+
+    @contextmanager
+    def lock(self, client_id: str, host: str):
+        """Exclusive lock on the token of the client, across threads and processes"""
+        with _file_lock(self.directory / f"{self._key(client_id, host)}.lock"):
+            yield
+
+    def load(self, client_id: str, host: str, min_ttl: float = 0) -> Optional[dict]:
+        """Returns the cached token if it is valid for at least `min_ttl` more seconds"""
+        try:
+            with open(self._path(client_id, host)) as f:
+                token = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            log.warning(f"Ignoring corrupt cached token: {e}")
+            return None
+
+        if token.get("expires_at", 0) - min_ttl <= time.time():
+            return None
+        return token
+
+    def save(self, client_id: str, host: str, token: dict) -> None:
+        # only readable by the user, and written atomically so other processes never read a partial token
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(dict(token), f)
+            os.replace(tmp_path, self._path(client_id, host))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def invalidate(self, client_id: str, host: str, token: Optional[dict] = None) -> None:
+        """
+        Removes the cached token, only if it is `token` when given, so a newer token is kept.
+        Takes the lock of the token, so must not be called while holding it.
+        """
+        with self.lock(client_id, host):
+            cached_token = self.load(client_id, host)
+            if token is not None and cached_token is not None and \
+                    cached_token.get("access_token") != token.get("access_token"):
+                return
+            try:
+                os.remove(self._path(client_id, host))
+            except FileNotFoundError:
+                pass
@@ -41,6 +41,9 @@ setup(
         'requests>=2.20,<3',
         'authlib>=0.14.1,<1'
     ],
+    extras_require={
+        'async': ['httpx[http2]>=0.18,<1']
+    },
     python_requires='~=3.6',
     include_package_data=True,
     package_data={
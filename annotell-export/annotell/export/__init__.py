@@ -3,4 +3,4 @@ from logging import NullHandler
 
 logging.getLogger(__name__).addHandler(NullHandler())
 
-__version__ = "0.2.0"
+__version__ = "0.3.0"
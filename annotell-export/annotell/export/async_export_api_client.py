@@ -0,0 +1,53 @@
+"""
+asyncio client for the Export API. Requires the `async` extra: pip install annotell-export[async]
+"""
+from annotell.auth.authsession import DEFAULT_HOST as DEFAULT_AUTH_HOST
+from annotell.auth.async_authsession import httpx, AsyncAuthSession, resolve_async_auth_session
+
+from .export_api_client import DEFAULT_HOST
+
+
+class AsyncExportApiClient:
+    """Like `ExportApiClient`, but with coroutines. Close the client with `aclose()`."""
+
+    def __init__(self, *,
+                 auth=None,
+                 host: str = DEFAULT_HOST,
+                 auth_host: str = DEFAULT_AUTH_HOST):
+        """
+        :param auth: auth credentials, see https://github.com/annotell/annotell-python/tree/master/annotell-auth,
+        or an AsyncAuthSession to share with other clients
+        :param host: override for export api host
+        :param auth_host: override for authentication host
+        """
+        self.host = host
+        self._owns_auth_session = not isinstance(auth, AsyncAuthSession)
+        self.auth_session = resolve_async_auth_session(host=auth_host, auth=auth)
+        self.headers = {
+            "Accept-Encoding": "gzip",
+            "Accept": "application/json"
+        }
+
+    async def aclose(self) -> None:
+        if self._owns_auth_session:
+            await self.auth_session.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def post_annotation_feedback(self,
+                                       customer_callback_id: str,
+                                       feedback: dict) -> httpx.Response:
+        """
+        See `ExportApiClient.post_annotation_feedback`
+
+        :param customer_callback_id: customer callback id
+        :param feedback: the feedback on the annotation
+        """
+        url = f"{self.host}/v1/feedback/annotations/{customer_callback_id}"
+        resp = await self.auth_session.post(url, json=feedback, headers=self.headers)
+        resp.raise_for_status()
+        return resp
@@ -1,5 +1,5 @@
 import requests
-from annotell.auth.authsession import AuthSession, DEFAULT_HOST as DEFAULT_AUTH_HOST
+from annotell.auth.authsession import resolve_auth_session, DEFAULT_HOST as DEFAULT_AUTH_HOST
 
 DEFAULT_HOST = "https://export.annotell.com"
 
@@ -11,13 +11,14 @@ class ExportApiClient:
                  host: str = DEFAULT_HOST,
                  auth_host: str = DEFAULT_AUTH_HOST):
         """
-        :param auth: auth credentials, see https://github.com/annotell/annotell-python/tree/master/annotell-auth
+        :param auth: auth credentials, see https://github.com/annotell/annotell-python/tree/master/annotell-auth,
+        or an AuthSession to share with other clients
         :param host: override for input api host
         :param auth_host: override for authentication host
         """
 
         self.host = host
-        self.oauth_session = AuthSession(host=auth_host, auth=auth)
+        self.oauth_session = resolve_auth_session(host=auth_host, auth=auth)
         self.headers = {
             "Accept-Encoding": "gzip",
             "Accept": "application/json"
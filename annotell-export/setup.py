@@ -36,9 +36,12 @@ setup(
     download_url='%s/tarball/%s' % (URL, version),
     keywords=['API', 'Annotell'],
     install_requires=[
-        'annotell-auth>=1.5.0,<2',
+        'annotell-auth>=1.6.0,<2',
         'requests>=2.23.0,<3',
     ],
+    extras_require={
+        'async': ['annotell-auth[async]>=1.6.0,<2']
+    },
     python_requires='~=3.6',
     include_package_data=True,
     package_data={
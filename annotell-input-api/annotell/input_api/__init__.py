@@ -3,4 +3,4 @@ from logging import NullHandler
 
 logging.getLogger(__name__).addHandler(NullHandler())
 
-__version__ = "0.4.1"
\ No newline at end of file
+__version__ = "0.5.0"
\ No newline at end of file
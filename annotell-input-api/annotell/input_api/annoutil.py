@@ -1,11 +1,14 @@
-from annotell.apiclients.input_api_client import create_input_api_client
+from itertools import islice
+from pathlib import Path
 from typing import Optional, List
 from tabulate import tabulate
 from .input_api_client import InputApiClient
+from .ingest import SceneLayout, IngestJournal, IngestProgress, ingest as ingest_scenes
 from pprint import pprint
 
 import click
 import os
+import time
 
 env = os.getenv("ANNOTELL_CLIENT_ORGANIZATION_ID", None)
 if env:
@@ -43,10 +46,22 @@ def _tabulate(body, headers, title=None):
 def _get_table(sequence, headers, title=None):
     body = []
     for p in sequence:
-        body.append([vars(p)[h] for h in headers])
+        body.append([getattr(p, h) for h in headers])
     return _tabulate(body, headers, title)
 
 
+def _print_tables(sequence, headers, title=None, rows_per_table=100):
+    """Prints the sequence as it is consumed, as one table per `rows_per_table` rows"""
+    iterator = iter(sequence)
+    rows = list(islice(iterator, rows_per_table))
+    if not rows:
+        print(_get_table(rows, headers, title))
+    while rows:
+        print(_get_table(rows, headers, title))
+        title = None
+        rows = list(islice(iterator, rows_per_table))
+
+
 @click.group()
 def cli():
     """A CLI wrapper for Annotell utilities"""
@@ -95,15 +110,14 @@ def inputs(project, batch, external_ids, include_invalidated, view):
         tab = _tabulate(body, headers, title="VIEW LINKS FOR INPUTS")
         print(tab)
     else:
-        inputs = client.get_inputs(project, batch, include_invalidated=include_invalidated)
+        inputs = client.iter_inputs(project, batch, include_invalidated=include_invalidated)
         headers = ["internal_id",
                    "external_id",
                    "batch",
                    "input_type",
                    "status",
                    "error_message"]
-        tab = _get_table(inputs, headers, "INPUTS")
-        print(tab)
+        _print_tables(inputs, headers, "INPUTS")
 
 
 @click.command()
@@ -142,10 +156,79 @@ def calibration(id, external_id, raw):
         print(tab)
 
 
+@click.command()
+@click.argument('root', nargs=1, required=True, type=click.Path(exists=True, file_okay=False))
+@click.option('--layout', required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--project', nargs=1, default=None, required=False, type=str)
+@click.option('--batch', nargs=1, default=None, required=False, type=str)
+@click.option('--input-list-id', nargs=1, default=None, required=False, type=int)
+@click.option('--calibration-id', nargs=1, default=None, required=False, type=int)
+@click.option('--processes', nargs=1, default=None, required=False, type=int)
+@click.option('--journal', nargs=1, default="annoutil-ingest.journal", type=click.Path(dir_okay=False))
+@click.option('--validate-point-clouds', is_flag=True)
+@click.option('--point-cloud-format', default=None, required=False,
+              type=click.Choice(["binary", "binary_compressed"]))
+@click.option('--progress-interval', nargs=1, default=5.0, type=float)
+@click.option('--dryrun', is_flag=True)
+def ingest(root, layout, project, batch, input_list_id, calibration_id, processes, journal,
+           validate_point_clouds, point_cloud_format, progress_interval, dryrun):
+    """
+    Creates one input per scene directory under ROOT, as described by the json scene layout, see
+    `annotell.input_api.ingest.SceneLayout`. Scenes in the journal are skipped, and each created
+    input is added to it, so that an interrupted ingestion continues where it stopped. The uploads
+    of scenes that failed are recorded in upload manifests in the directory JOURNAL.manifests, so
+    that ingesting them again skips the files already uploaded.
+    """
+    print()
+    root = Path(root).expanduser().resolve()
+    scene_layout = SceneLayout.load(layout)
+    if calibration_id is not None:
+        scene_layout.calibration_id = calibration_id
+    try:
+        scene_layout.validate()
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    ingest_journal = IngestJournal(journal)
+
+    scenes = []
+    num_invalid = 0
+    for scene_dir in scene_layout.find_scenes(root):
+        scene = str(scene_dir)
+        if scene in ingest_journal:
+            continue
+        try:
+            scenes.append((scene, scene_layout.scene_spec(root, scene_dir, project, batch, input_list_id)))
+        except ValueError as e:
+            num_invalid += 1
+            print(f"Skipping scene {scene}: {e}")
+    print(f"{len(scenes)} scenes to ingest, {len(ingest_journal.completed)} already in the journal, "
+          f"{num_invalid} invalid")
+
+    client_kwargs = dict(auth=None,
+                         client_organization_id=org_id,
+                         validate_point_clouds=validate_point_clouds,
+                         point_cloud_format=point_cloud_format)
+    progress = IngestProgress(len(scenes))
+    printed_at = time.monotonic()
+    manifest_dir = Path(f"{journal}.manifests")
+    for result in ingest_scenes(scenes, client_kwargs, processes=processes, dryrun=dryrun,
+                                manifest_dir=manifest_dir):
+        progress.add(result)
+        if not result.ok:
+            print(f"Failed scene {result.scene}: {result.error}")
+        elif not dryrun:
+            ingest_journal.add(result)
+        if time.monotonic() - printed_at >= progress_interval:
+            print(progress)
+            printed_at = time.monotonic()
+    print(progress)
+
+
 cli.add_command(projects)
 cli.add_command(inputs)
 cli.add_command(calibration)
 cli.add_command(view)
+cli.add_command(ingest)
 
 
 def main():
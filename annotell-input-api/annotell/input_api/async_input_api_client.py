@@ -0,0 +1,618 @@
+"""
+asyncio client for the Input API, with the same models as `InputApiClient`. Requires the `async` extra:
+pip install annotell-input-api[async]
+"""
+import asyncio
+import logging
+import time
+from itertools import islice
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+from uuid import uuid4 as uuid
+
+from annotell.auth.authsession import DEFAULT_HOST as DEFAULT_AUTH_HOST
+from annotell.auth.async_authsession import (
+    httpx, AsyncAuthSession, create_http_client, resolve_async_auth_session
+)
+
+from . import input_api_model as IAM
+from .calibration_cache import CalibrationCache
+from .input_api_client import (
+    InputApiClient, DEFAULT_HOST, DEFAULT_PAGE_SIZE, DEFAULT_LOOKUP_WORKERS,
+    DEFAULT_EXPORT_BATCH_SIZE, DEFAULT_EXPORT_WORKERS, STREAM_CHUNK_SIZE
+)
+from .input_status import AsyncInputStatusTracker
+from .retry import RetryPolicy, RetryMetrics
+from .util import filter_none
+
+DEFAULT_MAX_CONCURRENT_UPLOADS = 100
+# how often an upload paused by the circuit breaker checks if it may continue
+CIRCUIT_POLL_INTERVAL = 0.5
+
+log = logging.getLogger(__name__)
+
+
+async def _run_blocking(fun, *args):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, fun, *args)
+
+
+async def _read_chunks(path: Path, chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    # reads in a thread, so that slow disks do not block the event loop
+    with path.open("rb") as file:
+        while True:
+            chunk = await _run_blocking(file.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+class AsyncInputApiClient:
+    """
+    Creates Annotell inputs from local files, like `InputApiClient` but with coroutines. All requests
+    of the client share a connection pool, using HTTP/2 when available, so many inputs can be created
+    and checked concurrently in one event loop. Close the client with `aclose()`, or use it as an
+    async context manager.
+    """
+
+    def __init__(self, *,
+                 auth=None,
+                 host: str = DEFAULT_HOST,
+                 auth_host: str = DEFAULT_AUTH_HOST,
+                 client_organization_id: int = None,
+                 max_upload_retry_attempts: int = 23,
+                 max_upload_retry_wait_time: int = 60,
+                 max_concurrent_uploads: int = DEFAULT_MAX_CONCURRENT_UPLOADS,
+                 upload_retry_policy: Optional[RetryPolicy] = None,
+                 calibration_cache: Optional[CalibrationCache] = None,
+                 http2: Optional[bool] = None):
+        """
+        :param auth: auth credentials, see
+        https://github.com/annotell/annotell-python/tree/master/annotell-auth,
+        or an AsyncAuthSession to share with other clients
+        :param host: override for input api url
+        :param auth_host: override for authentication url
+        :param client_organization_id: Overrides your users organization id.
+        Only works with an Annotell user.
+        :param max_upload_retry_attempts: Max number of attempts to retry uploading a file to GCS.
+        :param max_upload_retry_wait_time:  Max with time before retrying an upload to GCS.
+        :param max_concurrent_uploads: Max number of files uploaded to GCS at the same time, for all
+        inputs created by the client.
+        :param upload_retry_policy: Overrides the retry policy shared by all uploads, including its retry budget
+        and circuit breaker. By default built from `max_upload_retry_attempts` and `max_upload_retry_wait_time`.
+        :param calibration_cache: If given, identical calibrations are only created once, and calibrations
+        fetched by id are served from the cache until it needs revalidation.
+        :param http2: Use HTTP/2 for uploads, defaults to True if the h2 package is installed
+        """
+        self.host = host
+        self._owns_auth_session = not isinstance(auth, AsyncAuthSession)
+        self.auth_session = resolve_async_auth_session(auth=auth, host=auth_host)
+        # upload urls are signed, so uploads are sent without the token
+        self.storage_client = create_http_client(http2=http2, max_connections=max_concurrent_uploads)
+        self.headers = {
+            "Accept-Encoding": "gzip",
+            "Accept": "application/json"
+        }
+        self.dryrun_header = {"X-Dryrun": ""}
+
+        self.max_concurrent_uploads = max_concurrent_uploads
+        if upload_retry_policy is None:
+            upload_retry_policy = RetryPolicy(max_attempts=max_upload_retry_attempts,
+                                              max_wait_time=max_upload_retry_wait_time)
+        self.upload_retry_policy = upload_retry_policy
+        self.calibration_cache = calibration_cache
+        # created on first use, so that it belongs to the running event loop
+        self._upload_semaphore: Optional[asyncio.Semaphore] = None
+        if client_organization_id is not None:
+            self.headers["X-Organization-Id"] = str(client_organization_id)
+            log.info(f"WARNING: You will now act as if you are part of organization: {client_organization_id}. "
+                     f"This will not work unless you are an Annotell user.")
+
+    @property
+    def upload_retry_metrics(self) -> RetryMetrics:
+        """Number of upload attempts and retries, and time spent waiting, for all uploads of the client"""
+        return self.upload_retry_policy.metrics
+
+    async def aclose(self) -> None:
+        await self.storage_client.aclose()
+        if self._owns_auth_session:
+            await self.auth_session.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    @staticmethod
+    def _raise_on_error(resp: httpx.Response) -> httpx.Response:
+        try:
+            resp.raise_for_status()
+        except httpx.HTTPStatusError as exception:
+            if resp.status_code == 400:
+                try:
+                    message = resp.json()["message"]
+                except ValueError:
+                    message = resp.text
+                raise RuntimeError(message) from exception
+
+            raise exception from None
+        return resp
+
+    async def _request(self, method: str, url: str, headers: Optional[dict] = None, **kwargs) -> httpx.Response:
+        headers = self.headers if headers is None else headers
+        resp = await self.auth_session.request(method, url, headers=headers, **kwargs)
+        return self._raise_on_error(resp)
+
+    async def _get_upload_urls(self, files_to_upload: IAM.FilesToUpload) -> IAM.UploadUrlsResponse:
+        """Get upload urls to cloud storage"""
+        url = f"{self.host}/v1/inputs/upload-urls"
+        resp = await self._request("GET", url, json=files_to_upload.to_dict())
+        return IAM.UploadUrlsResponse.from_json(resp.json())
+
+    async def _set_images_dimensions(self, folder: Path, images: List[IAM.Image]) -> None:
+        await _run_blocking(InputApiClient._set_images_dimensions, folder, images)
+
+    async def _wait_for_circuit_breaker(self) -> None:
+        """Like `RetryPolicy.before_attempt`, but waits without blocking the event loop"""
+        circuit_breaker = self.upload_retry_policy.circuit_breaker
+        started_at = time.monotonic()
+        while not circuit_breaker.try_acquire():
+            await asyncio.sleep(CIRCUIT_POLL_INTERVAL)
+        self.upload_retry_policy.record_attempt(circuit_wait_time=time.monotonic() - started_at)
+
+    async def _upload_file(self, upload_url: str, file_path: Path, headers: Dict[str, str]) -> None:
+        """
+        Upload the file to GCS, retries if the upload fails with some specific status codes.
+        """
+        log.info(f"Uploading file={file_path}")
+        headers = {**headers, "Content-Length": str(file_path.stat().st_size)}
+        retry_policy = self.upload_retry_policy
+        upload_attempt = 1
+        while True:
+            await self._wait_for_circuit_breaker()
+            try:
+                resp = await self.storage_client.put(upload_url, content=_read_chunks(file_path), headers=headers)
+            except httpx.TransportError as e:
+                # e.g. connection errors, timeouts and dropped connections, retried like in `InputApiClient`
+                log.error(f"On upload attempt ({upload_attempt}/{retry_policy.max_attempts}) to GCS "
+                          f"got error: {e!r}")
+                retry_policy.record_failure()
+                if not retry_policy.should_retry(upload_attempt):
+                    raise
+
+                wait_time = retry_policy.get_wait_time(upload_attempt)
+                log.info(f"Waiting {int(wait_time)} seconds before retrying")
+                await asyncio.sleep(wait_time)
+                retry_policy.record_retry(wait_time)
+                upload_attempt += 1
+                continue
+            except BaseException:
+                retry_policy.record_failure()
+                raise
+
+            if resp.is_error:
+                log.error(f"On upload attempt ({upload_attempt}/{retry_policy.max_attempts}) to GCS "
+                          f"got response:\n{resp.status_code}: {resp.content}")
+                retry_policy.record_failure(resp.status_code)
+                if not retry_policy.should_retry(upload_attempt, resp.status_code):
+                    resp.raise_for_status()
+
+                wait_time = retry_policy.get_wait_time(upload_attempt, resp)
+                log.info(f"Waiting {int(wait_time)} seconds before retrying")
+                await asyncio.sleep(wait_time)
+                retry_policy.record_retry(wait_time)
+                upload_attempt += 1
+                continue
+
+            retry_policy.record_success()
+            return
+
+    async def _upload_files(self, folder: Path, url_map: Mapping[str, str]) -> None:
+        """
+        Upload all files to cloud storage, with at most `max_concurrent_uploads` files in flight for the
+        whole client. Every file is attempted even if some fail, the failures are then raised together.
+        """
+        if self._upload_semaphore is None:
+            self._upload_semaphore = asyncio.Semaphore(self.max_concurrent_uploads)
+
+        async def _upload(filename: str, upload_url: str) -> None:
+            file_path = folder.joinpath(filename).expanduser()
+            headers = {"Content-Type": InputApiClient._get_content_type(filename)}
+            async with self._upload_semaphore:
+                await self._upload_file(upload_url, file_path, headers)
+
+        filenames = list(url_map.keys())
+        results = await asyncio.gather(*[_upload(filename, url_map[filename]) for filename in filenames],
+                                       return_exceptions=True)
+        failed_uploads = dict()
+        for (filename, result) in zip(filenames, results):
+            if isinstance(result, Exception):
+                log.error(f"Failed to upload file={filename}: {result}")
+                failed_uploads[filename] = result
+
+        if failed_uploads:
+            raise IAM.FileUploadError(failed_uploads)
+
+    def _resolve_request_url(self,
+                             resource_path: str,
+                             project: Optional[str] = None,
+                             batch: Optional[str] = None) -> str:
+        url = f"{self.host}/v1/inputs/"
+        if project is not None:
+            url += f"project/{project}/"
+            if batch is not None:
+                url += f"batch/{batch}/"
+        return url + resource_path
+
+    async def _post_input_request(self, resource_path: str,
+                                  input_request: dict,
+                                  project: Optional[str],
+                                  batch: Optional[str],
+                                  input_list_id: Optional[int],
+                                  dryrun: bool = False) -> Optional[IAM.CreateInputJobResponse]:
+        if dryrun:
+            headers = {**self.headers, **self.dryrun_header}
+        else:
+            headers = {**self.headers}
+
+        if input_list_id is not None:
+            input_request['inputListId'] = input_list_id
+
+        request_url = self._resolve_request_url(resource_path, project, batch)
+        resp = await self._request("POST", request_url, json=input_request, headers=headers)
+        json_resp = InputApiClient._unwrap_enveloped_json(resp.json())
+        if not dryrun:
+            return IAM.CreateInputJobResponse.from_json(json_resp)
+
+    async def _create_input(self, resource_path: str,
+                            folder: Path,
+                            files: Union[IAM.ImagesFiles, IAM.PointCloudFiles, IAM.PointCloudsWithImages],
+                            metadata: IAM.SceneMetaData,
+                            project: Optional[str],
+                            batch: Optional[str],
+                            input_list_id: Optional[int],
+                            dryrun: bool,
+                            upload: bool = True) -> Optional[IAM.CreateInputJobResponse]:
+        """Sets image dimensions, validates the input, uploads the files and creates the input"""
+        images = getattr(files, "images", [])
+        point_clouds = getattr(files, "point_clouds", [])
+        filenames = [image.filename for image in images] + [pc.filename for pc in point_clouds]
+
+        await self._set_images_dimensions(folder, images)
+        upload_urls_response = await self._get_upload_urls(IAM.FilesToUpload(filenames))
+        assert set(filenames) == set(upload_urls_response.files_to_url.keys())
+
+        js = dict(files=files.to_dict(),
+                  internalId=upload_urls_response.internal_id,
+                  metadata=metadata.to_dict())
+        await self._post_input_request(resource_path, dict(js), project=project, batch=batch,
+                                       input_list_id=input_list_id, dryrun=True)
+        if dryrun:
+            return None
+
+        if upload:
+            await self._upload_files(folder, upload_urls_response.files_to_url)
+        create_input_response = await self._post_input_request(resource_path, js, project=project, batch=batch,
+                                                               input_list_id=input_list_id)
+        if create_input_response:
+            log.info(f"Creating input for files with internal_id={create_input_response.internal_id}")
+        return create_input_response
+
+    async def create_inputs_images(
+            self, folder: Path,
+            images_files: IAM.ImagesFiles,
+            metadata: IAM.SceneMetaData = IAM.SceneMetaData(external_id=str(uuid())),
+            project: Optional[str] = None,
+            batch: Optional[str] = None,
+            input_list_id: Optional[int] = None,
+            dryrun: bool = False) -> Optional[IAM.CreateInputJobResponse]:
+        """See `InputApiClient.create_inputs_images`"""
+        return await self._create_input('images', folder, images_files, metadata,
+                                        project, batch, input_list_id, dryrun)
+
+    async def create_inputs_point_clouds(
+            self, folder: Path,
+            point_clouds: IAM.PointCloudFiles,
+            metadata: IAM.SceneMetaData = IAM.SceneMetaData(external_id=str(uuid())),
+            project: Optional[str] = None,
+            batch: Optional[str] = None,
+            input_list_id: Optional[int] = None,
+            dryrun: bool = False) -> Optional[IAM.CreateInputJobResponse]:
+        """
+        See `InputApiClient.create_inputs_point_clouds`. Like it, the point clouds are not uploaded
+        by the client.
+        """
+        return await self._create_input('pointclouds', folder, point_clouds, metadata,
+                                        project, batch, input_list_id, dryrun, upload=False)
+
+    async def create_inputs_point_cloud_with_images(
+            self, folder: Path,
+            point_clouds_with_images: IAM.PointCloudsWithImages,
+            metadata: IAM.CalibratedSceneMetaData,
+            project: Optional[str] = None,
+            batch: Optional[str] = None,
+            input_list_id: Optional[int] = None,
+            dryrun: bool = False) -> Optional[IAM.CreateInputJobResponse]:
+        """See `InputApiClient.create_inputs_point_cloud_with_images`"""
+        return await self._create_input('pointclouds-with-images', folder, point_clouds_with_images, metadata,
+                                        project, batch, input_list_id, dryrun)
+
+    async def create_slam_input_job(self, slam_files: IAM.SlamFiles,
+                                    metadata: IAM.SlamMetaData,
+                                    project: Optional[str] = None,
+                                    batch: Optional[str] = None,
+                                    input_list_id: Optional[int] = None,
+                                    dryrun=False) -> Optional[IAM.CreateInputJobResponse]:
+        """See `InputApiClient.create_slam_input_job`"""
+        slam_json = dict(files=slam_files.to_dict(),
+                         metadata=metadata.to_dict(), inputListId=input_list_id)
+        return await self._post_input_request('slam', slam_json, project=project, batch=batch,
+                                              input_list_id=input_list_id, dryrun=dryrun)
+
+    async def update_completed_slam_input_job(self, pointcloud_uri: str,
+                                              trajectory: IAM.Trajectory,
+                                              job_id: str) -> None:
+        """See `InputApiClient.update_completed_slam_input_job`"""
+        url = f"{self.host}/v1/inputs/progress"
+        update_json = dict(files=dict(pointClouds=pointcloud_uri),
+                           metadata=dict(trajectory=trajectory.to_dict()),
+                           jobId=job_id)
+        await self._request("POST", url, json=update_json)
+
+    async def update_failed_slam_input_job(self, job_id: str, message: str) -> None:
+        """See `InputApiClient.update_failed_slam_input_job`"""
+        url = f"{self.host}/v1/inputs/progress"
+        await self._request("POST", url, json=dict(jobId=job_id, message=message))
+
+    async def _fetch_inputs(self,
+                            project: str,
+                            batch: Optional[str],
+                            external_ids: Optional[List[str]],
+                            include_invalidated: bool,
+                            offset: Optional[int] = None,
+                            limit: Optional[int] = None) -> List[IAM.Input]:
+        url = f"{self.host}/v1/inputs"
+        external_ids_query_string = ",".join(external_ids) if external_ids is not None else None
+        params = {
+            "project": project,
+            "batch": batch,
+            "externalIds": external_ids_query_string,
+            "invalidated": include_invalidated,
+            "offset": offset,
+            "limit": limit
+        }
+        resp = await self._request("GET", url, params=filter_none(params))
+        json_resp = InputApiClient._unwrap_enveloped_json(resp.json())
+        return [IAM.Input.from_json(js) for js in json_resp]
+
+    async def get_inputs(self,
+                         project: str,
+                         batch: Optional[str] = None,
+                         external_ids: Optional[List[str]] = None,
+                         include_invalidated: bool = False) -> List[IAM.Input]:
+        """See `InputApiClient.get_inputs`"""
+        if not external_ids:
+            return await self._fetch_inputs(project, batch, None, include_invalidated)
+
+        lookup = await self.get_inputs_by_external_ids(project, external_ids, batch=batch,
+                                                       include_invalidated=include_invalidated)
+        return lookup.inputs
+
+    async def get_inputs_by_external_ids(self,
+                                         project: str,
+                                         external_ids: List[str],
+                                         batch: Optional[str] = None,
+                                         include_invalidated: bool = False,
+                                         max_workers: int = DEFAULT_LOOKUP_WORKERS) -> IAM.InputsByExternalIds:
+        """
+        See `InputApiClient.get_inputs_by_external_ids`
+
+        :param max_workers: Max number of chunks fetched concurrently
+        """
+        unique_external_ids = list(dict.fromkeys(external_ids))
+        chunks = InputApiClient._chunk_external_ids(unique_external_ids)
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def _fetch(chunk: List[str]) -> List[IAM.Input]:
+            async with semaphore:
+                return await self._fetch_inputs(project, batch, chunk, include_invalidated)
+
+        results = await asyncio.gather(*[_fetch(chunk) for chunk in chunks])
+
+        inputs_by_internal_id: Dict[str, IAM.Input] = dict()
+        for inputs in results:
+            for input in inputs:
+                inputs_by_internal_id.setdefault(input.internal_id, input)
+        inputs = list(inputs_by_internal_id.values())
+
+        found_external_ids = {input.external_id for input in inputs}
+        not_found_external_ids = [external_id for external_id in unique_external_ids
+                                  if external_id not in found_external_ids]
+        return IAM.InputsByExternalIds(inputs, not_found_external_ids)
+
+    async def iter_inputs(self,
+                          project: str,
+                          batch: Optional[str] = None,
+                          external_ids: Optional[List[str]] = None,
+                          include_invalidated: bool = False,
+                          page_size: int = DEFAULT_PAGE_SIZE) -> AsyncIterator[IAM.Input]:
+        """See `InputApiClient.iter_inputs`, use with `async for`"""
+        if not external_ids:
+            chunks = [None]
+        else:
+            chunks = InputApiClient._chunk_external_ids(list(dict.fromkeys(external_ids)))
+        for chunk in chunks:
+            pages = self._iter_input_pages(project, batch, chunk, include_invalidated, page_size)
+            try:
+                async for input in pages:
+                    yield input
+            finally:
+                await pages.aclose()
+
+    async def _iter_input_pages(self,
+                                project: str,
+                                batch: Optional[str],
+                                external_ids: Optional[List[str]],
+                                include_invalidated: bool,
+                                page_size: int,
+                                offset: int = 0) -> AsyncIterator[IAM.Input]:
+        previous_first_id = None
+        while True:
+            inputs = await self._fetch_inputs(project, batch, external_ids, include_invalidated,
+                                              offset=offset, limit=page_size)
+            if inputs and inputs[0].internal_id == previous_first_id:
+                # the same page again, the server does not paginate
+                return
+            previous_first_id = inputs[0].internal_id if inputs else None
+            for input in inputs:
+                yield input
+
+            # a full page might be followed by more, more than a full page means everything was returned
+            if len(inputs) != page_size:
+                return
+            offset += len(inputs)
+
+    def track_inputs(self,
+                     project: str,
+                     internal_ids: Iterable[str],
+                     batch: Optional[str] = None,
+                     **kwargs) -> AsyncInputStatusTracker:
+        """See `InputApiClient.track_inputs`, iterate over the tracker with `async for` or await `wait()`"""
+        tracker = AsyncInputStatusTracker(self, **kwargs)
+        tracker.track(internal_ids, project, batch)
+        return tracker
+
+    async def invalidate_inputs(self,
+                                input_internal_ids: List[str],
+                                invalidated_reason: IAM.InvalidatedReasonInput) -> IAM.InvalidatedInputsResponse:
+        """See `InputApiClient.invalidate_inputs`"""
+        url = f"{self.host}/v1/inputs/invalidate"
+        invalidated_json = dict(inputIds=input_internal_ids, invalidatedReason=invalidated_reason)
+        resp = await self._request("POST", url, json=invalidated_json)
+        return IAM.InvalidatedInputsResponse.from_json(InputApiClient._unwrap_enveloped_json(resp.json()))
+
+    async def get_projects(self) -> List[IAM.Project]:
+        """See `InputApiClient.get_projects`"""
+        resp = await self._request("GET", f"{self.host}/v1/projects")
+        return [IAM.Project.from_json(js) for js in InputApiClient._unwrap_enveloped_json(resp.json())]
+
+    async def get_project_batches(self, project: str) -> List[IAM.InputBatch]:
+        """See `InputApiClient.get_project_batches`"""
+        resp = await self._request("GET", f"{self.host}/v1/projects/{project}/batches")
+        return [IAM.InputBatch.from_json(js) for js in InputApiClient._unwrap_enveloped_json(resp.json())]
+
+    async def get_calibration_data(
+        self, id: Optional[int] = None, external_id: Optional[str] = None
+    ) -> List[Union[IAM.CalibrationNoContent, IAM.CalibrationWithContent]]:
+        """See `InputApiClient.get_calibration_data`"""
+        if id and self.calibration_cache is not None:
+            cached_calibration = self.calibration_cache.get_calibration(id)
+            if cached_calibration is not None:
+                return [cached_calibration]
+
+        url = f"{self.host}/v1/calibrations"
+        if id:
+            params = dict(id=id)
+        elif external_id:
+            params = dict(externalId=external_id)
+        else:
+            params = None
+
+        resp = await self._request("GET", url, params=params)
+        json_resp = InputApiClient._unwrap_enveloped_json(resp.json())
+        if params is None:
+            return [IAM.CalibrationNoContent.from_json(js) for js in json_resp]
+        elif id is not None:
+            calibration = IAM.CalibrationWithContent.from_json(json_resp)
+            if self.calibration_cache is not None:
+                self.calibration_cache.put_calibration(calibration)
+            return [calibration]
+        else:
+            return [IAM.CalibrationWithContent.from_json(js) for js in json_resp]
+
+    async def _get_cached_calibration(
+            self, calibration_spec: IAM.CalibrationSpec) -> Optional[IAM.CalibrationNoContent]:
+        """See `InputApiClient._get_cached_calibration`"""
+        cache = self.calibration_cache
+        calibration = cache.get_created(calibration_spec)
+        if calibration is not None:
+            return calibration
+
+        calibration = cache.get_created(calibration_spec, include_expired=True)
+        if calibration is None:
+            return None
+
+        if not await self._calibration_exists(calibration.id):
+            log.info(f"Cached calibration with id={calibration.id} no longer exists")
+            cache.discard_calibration(calibration.id)
+            cache.discard_created(calibration_spec)
+            return None
+
+        cache.put_created(calibration_spec, calibration)
+        return calibration
+
+    async def _calibration_exists(self, id: int) -> bool:
+        """See `InputApiClient._calibration_exists`"""
+        resp = await self.auth_session.get(f"{self.host}/v1/calibrations", params=dict(id=id), headers=self.headers)
+        if resp.status_code == 404:
+            return False
+        json_resp = InputApiClient._unwrap_enveloped_json(self._raise_on_error(resp).json())
+        self.calibration_cache.put_calibration(IAM.CalibrationWithContent.from_json(json_resp))
+        return True
+
+    async def create_calibration_data(
+        self, calibration_spec: IAM.CalibrationSpec
+    ) -> IAM.CalibrationNoContent:
+        """See `InputApiClient.create_calibration_data`"""
+        if self.calibration_cache is not None:
+            cached_calibration = await self._get_cached_calibration(calibration_spec)
+            if cached_calibration is not None:
+                log.info(f"Using existing calibration with id={cached_calibration.id}")
+                return cached_calibration
+
+        url = f"{self.host}/v1/inputs/calibration-data"
+        resp = await self._request("POST", url, json=calibration_spec.to_dict())
+        calibration = IAM.CalibrationNoContent.from_json(resp.json())
+        if self.calibration_cache is not None:
+            self.calibration_cache.put_created(calibration_spec, calibration)
+        return calibration
+
+    async def download_annotations(
+        self, internal_ids: List[str]
+    ) -> Dict[str, List[IAM.ExportAnnotation]]:
+        """See `InputApiClient.download_annotations`"""
+        resp = await self._request("GET", f"{self.host}/v1/inputs/export", json=internal_ids)
+        return {internal_id: InputApiClient._parse_export_annotations(js)
+                for (internal_id, js) in resp.json().items()}
+
+    async def iter_annotations(
+        self, internal_ids: Iterable[str],
+        batch_size: int = DEFAULT_EXPORT_BATCH_SIZE,
+        max_workers: int = DEFAULT_EXPORT_WORKERS
+    ) -> AsyncIterator[Tuple[str, List[IAM.ExportAnnotation]]]:
+        """See `InputApiClient.iter_annotations`, use with `async for`"""
+        internal_ids = iter(internal_ids)
+
+        def _next_batch() -> List[str]:
+            return list(islice(internal_ids, batch_size))
+
+        pending = set()
+        try:
+            batch = _next_batch()
+            while batch or pending:
+                while batch and len(pending) < max_workers:
+                    pending.add(asyncio.ensure_future(self.download_annotations(batch)))
+                    batch = _next_batch()
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    for item in future.result().items():
+                        yield item
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def get_view_links(self, internal_ids: List[str]) -> Dict[str, str]:
+        """See `InputApiClient.get_view_links`"""
+        return {internal_id: f"https://app.annotell.com/input-view/{internal_id}" for internal_id in internal_ids}
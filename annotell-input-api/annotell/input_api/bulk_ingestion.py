@@ -0,0 +1,226 @@
+"""Pipelined creation of many inputs, see `InputApiClient.create_inputs_bulk`"""
+import logging
+import queue
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from . import input_api_model as IAM
+
+log = logging.getLogger(__name__)
+
+SceneFiles = Union[IAM.ImagesFiles, IAM.PointCloudFiles, IAM.PointCloudsWithImages]
+
+STAGE_UPLOAD_URLS = "upload-urls"
+STAGE_VALIDATE = "validate"
+STAGE_UPLOAD = "upload"
+STAGE_CREATE = "create"
+
+
+@dataclass
+class SceneSpec:
+    """Everything needed to create one input, as given to the `create_inputs_*` methods"""
+    folder: Path
+    files: SceneFiles
+    metadata: IAM.SceneMetaData
+    project: Optional[str] = None
+    batch: Optional[str] = None
+    input_list_id: Optional[int] = None
+
+    @property
+    def resource_path(self) -> str:
+        if isinstance(self.files, IAM.ImagesFiles):
+            return 'images'
+        elif isinstance(self.files, IAM.PointCloudsWithImages):
+            return 'pointclouds-with-images'
+        elif isinstance(self.files, IAM.PointCloudFiles):
+            return 'pointclouds'
+        raise ValueError(f"Unsupported scene files {type(self.files).__name__}")
+
+    @property
+    def images(self) -> List[IAM.Image]:
+        return getattr(self.files, "images", [])
+
+    @property
+    def point_clouds(self) -> List[IAM.PointCloud]:
+        return getattr(self.files, "point_clouds", [])
+
+    @property
+    def filenames(self) -> List[str]:
+        return [image.filename for image in self.images] + [pc.filename for pc in self.point_clouds]
+
+
+@dataclass
+class SceneOutcome:
+    """The result of creating one input. If `error` is set, `failed_stage` tells where it failed."""
+    spec: SceneSpec
+    internal_id: Optional[str] = None
+    response: Optional[IAM.CreateInputJobResponse] = None
+    error: Optional[Exception] = None
+    failed_stage: Optional[str] = None
+    files_to_url: Optional[Dict[str, str]] = field(default=None, repr=False)
+    point_cloud_conversion: Optional[object] = field(default=None, repr=False)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+_DONE = object()
+
+
+class _Stage:
+    def __init__(self, name: str, work: Callable[[SceneOutcome], None], workers: int, queue_size: int):
+        self.name = name
+        self.work = work
+        self.workers = workers
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._running = workers
+        self._lock = threading.Lock()
+
+    def worker_done(self) -> bool:
+        """Returns True for the last worker of the stage to finish"""
+        with self._lock:
+            self._running -= 1
+            return self._running == 0
+
+
+class BulkIngestion:
+    """
+    Runs scenes through the stages of input creation: getting upload urls, validating the input with
+    a dryrun, uploading the files and creating the input. Each stage has its own workers and the
+    stages are connected by bounded queues, so different scenes are in different stages at the same
+    time while only a bounded number of scenes are held in memory.
+    """
+
+    def __init__(self, client, dryrun: bool = False, api_workers: int = 4, upload_workers: int = 2,
+                 queue_size: int = 8):
+        self.client = client
+        stages = [
+            _Stage(STAGE_UPLOAD_URLS, self._get_upload_urls, api_workers, queue_size),
+            _Stage(STAGE_VALIDATE, self._validate, api_workers, queue_size),
+        ]
+        if not dryrun:
+            stages += [
+                _Stage(STAGE_UPLOAD, self._upload, upload_workers, queue_size),
+                _Stage(STAGE_CREATE, self._create, api_workers, queue_size),
+            ]
+        self.stages = stages
+        self._outcomes: queue.Queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._feed_error: Optional[Exception] = None
+
+    def _get_upload_urls(self, outcome: SceneOutcome) -> None:
+        spec = outcome.spec
+        spec.resource_path  # raises for unsupported scene files, before anything is uploaded
+        outcome.point_cloud_conversion = self.client._prepare_point_clouds(spec.folder, spec.point_clouds)
+        self.client._set_images_dimensions(spec.folder, spec.images)
+        upload_urls_response = self.client._get_upload_urls(IAM.FilesToUpload(spec.filenames), spec.folder)
+        if set(spec.filenames) != set(upload_urls_response.files_to_url.keys()):
+            raise RuntimeError("Got upload urls for other files than the ones in the scene")
+        outcome.internal_id = upload_urls_response.internal_id
+        outcome.files_to_url = upload_urls_response.files_to_url
+
+    def _post(self, outcome: SceneOutcome, dryrun: bool) -> Optional[IAM.CreateInputJobResponse]:
+        spec = outcome.spec
+        js = dict(files=spec.files.to_dict(),
+                  internalId=outcome.internal_id,
+                  metadata=spec.metadata.to_dict())
+        return self.client._post_input_request(spec.resource_path, js,
+                                               project=spec.project,
+                                               batch=spec.batch,
+                                               input_list_id=spec.input_list_id,
+                                               dryrun=dryrun)
+
+    def _validate(self, outcome: SceneOutcome) -> None:
+        self._post(outcome, dryrun=True)
+
+    def _upload(self, outcome: SceneOutcome) -> None:
+        conversion = outcome.point_cloud_conversion
+        self.client._upload_files(outcome.spec.folder, outcome.files_to_url, outcome.internal_id,
+                                  local_paths=conversion.paths if conversion is not None else None)
+
+    def _create(self, outcome: SceneOutcome) -> None:
+        outcome.response = self._post(outcome, dryrun=False)
+        log.info(f"Creating input with internal_id={outcome.internal_id}")
+
+    def _feed(self, scenes: Iterable[SceneSpec]) -> None:
+        first_queue = self.stages[0].queue
+        try:
+            for spec in scenes:
+                if self._stopped.is_set():
+                    break
+                first_queue.put(SceneOutcome(spec=spec))
+        except Exception as e:
+            self._feed_error = e
+        finally:
+            for _ in range(self.stages[0].workers):
+                first_queue.put(_DONE)
+
+    @staticmethod
+    def _release(outcome: SceneOutcome) -> None:
+        """Removes the converted point clouds of the scene, and restores their filenames"""
+        if outcome.point_cloud_conversion is not None:
+            outcome.point_cloud_conversion.close()
+            outcome.point_cloud_conversion = None
+
+    def _finish(self, outcome: SceneOutcome) -> None:
+        self._release(outcome)
+        self._outcomes.put(outcome)
+
+    def _run_stage(self, index: int) -> None:
+        stage = self.stages[index]
+        is_last = index == len(self.stages) - 1
+        while True:
+            outcome = stage.queue.get()
+            if outcome is _DONE:
+                break
+            if self._stopped.is_set():
+                self._release(outcome)
+                continue
+
+            try:
+                stage.work(outcome)
+            except Exception as e:
+                log.error(f"Scene with external_id={outcome.spec.metadata.external_id} failed "
+                          f"in stage {stage.name}: {e}")
+                outcome.error = e
+                outcome.failed_stage = stage.name
+                self._finish(outcome)
+                continue
+
+            if is_last:
+                self._finish(outcome)
+            else:
+                self.stages[index + 1].queue.put(outcome)
+
+        if stage.worker_done():
+            if is_last:
+                self._outcomes.put(_DONE)
+            else:
+                next_stage = self.stages[index + 1]
+                for _ in range(next_stage.workers):
+                    next_stage.queue.put(_DONE)
+
+    def run(self, scenes: Iterable[SceneSpec]) -> Iterator[SceneOutcome]:
+        threads = [threading.Thread(target=self._feed, args=(scenes,), daemon=True)]
+        for (index, stage) in enumerate(self.stages):
+            threads += [
+                threading.Thread(target=self._run_stage, args=(index,), daemon=True)
+                for _ in range(stage.workers)
+            ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                outcome = self._outcomes.get()
+                if outcome is _DONE:
+                    break
+                yield outcome
+        finally:
+            self._stopped.set()
+
+        if self._feed_error is not None:
+            raise self._feed_error
@@ -0,0 +1,142 @@
+"""Client side cache of calibrations, see `InputApiClient(calibration_cache=...)`"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from . import input_api_model as IAM
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60 * 60  # seconds
+
+_SPEC_PREFIX = "spec-"
+_CALIBRATION_PREFIX = "calibration-"
+
+# (time cached, calibration json as returned by the input api)
+_Entry = Tuple[float, dict]
+
+
+class CalibrationCache:
+    """
+    Remembers which calibration was created for a `CalibrationSpec`, and the content of fetched
+    calibrations. Entries older than `ttl` seconds are revalidated against the Input API before use.
+    Thread safe. With a `directory` the cache is also stored on disk, and can be shared between
+    processes and runs.
+    """
+
+    def __init__(self, directory: Optional[Union[str, Path]] = None, ttl: float = DEFAULT_TTL):
+        """
+        :param directory: directory to store the cache in, in memory only if None
+        :param ttl: seconds until an entry has to be revalidated
+        """
+        self.directory = Path(directory).expanduser() if directory is not None else None
+        self.ttl = ttl
+        self._entries: Dict[str, _Entry] = dict()
+        self._lock = threading.Lock()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def spec_hash(calibration_spec: IAM.CalibrationSpec) -> str:
+        """Hash of the canonical JSON of the spec, independent of key order"""
+        canonical = json.dumps(calibration_spec.to_dict(), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _is_fresh(self, entry: _Entry) -> bool:
+        cached_at, _ = entry
+        return time.time() - cached_at < self.ttl
+
+    def _get(self, key: str, include_expired: bool) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.directory is not None:
+            entry = self._read(key)
+            if entry is not None:
+                with self._lock:
+                    self._entries[key] = entry
+
+        if entry is None or not (include_expired or self._is_fresh(entry)):
+            return None
+        return entry[1]
+
+    def _put(self, key: str, js: dict) -> None:
+        entry = (time.time(), js)
+        with self._lock:
+            self._entries[key] = entry
+        if self.directory is not None:
+            self._write(key, entry)
+
+    def _discard(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.directory is not None:
+            try:
+                os.remove(self.directory / f"{key}.json")
+            except FileNotFoundError:
+                pass
+
+    def _read(self, key: str) -> Optional[_Entry]:
+        try:
+            with open(self.directory / f"{key}.json") as f:
+                js = json.load(f)
+            return js["cachedAt"], js["calibration"]
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            log.warning(f"Ignoring corrupt calibration cache entry {key}: {e}")
+            return None
+
+    def _write(self, key: str, entry: _Entry) -> None:
+        cached_at, calibration_js = entry
+        # write to a temporary file first, so other processes never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(dict(cachedAt=cached_at, calibration=calibration_js), f)
+            os.replace(tmp_path, self.directory / f"{key}.json")
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get_created(self, calibration_spec: IAM.CalibrationSpec,
+                    include_expired: bool = False) -> Optional[IAM.CalibrationNoContent]:
+        """Returns the calibration created from an identical spec, if any"""
+        js = self._get(_SPEC_PREFIX + self.spec_hash(calibration_spec), include_expired)
+        return IAM.CalibrationNoContent.from_json(js) if js is not None else None
+
+    def put_created(self, calibration_spec: IAM.CalibrationSpec,
+                    calibration: IAM.CalibrationNoContent) -> None:
+        js = dict(id=calibration.id,
+                  externalId=calibration.external_id,
+                  created=calibration.created.isoformat())
+        self._put(_SPEC_PREFIX + self.spec_hash(calibration_spec), js)
+
+    def discard_created(self, calibration_spec: IAM.CalibrationSpec) -> None:
+        self._discard(_SPEC_PREFIX + self.spec_hash(calibration_spec))
+
+    def get_calibration(self, id: int, include_expired: bool = False) -> Optional[IAM.CalibrationWithContent]:
+        js = self._get(f"{_CALIBRATION_PREFIX}{id}", include_expired)
+        return IAM.CalibrationWithContent.from_json(js) if js is not None else None
+
+    def put_calibration(self, calibration: IAM.CalibrationWithContent) -> None:
+        js = dict(id=calibration.id,
+                  externalId=calibration.external_id,
+                  created=calibration.created.isoformat(),
+                  calibration=calibration.calibration)
+        self._put(f"{_CALIBRATION_PREFIX}{calibration.id}", js)
+
+    def discard_calibration(self, id: int) -> None:
+        self._discard(f"{_CALIBRATION_PREFIX}{id}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.directory is not None:
+            for path in self.directory.glob("*.json"):
+                path.unlink()
@@ -0,0 +1,125 @@
+"""
+Reads image dimensions from the file header for JPEG, PNG and WebP images, without decoding
+the image. Other formats are opened with PIL.
+"""
+import logging
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from PIL import Image as PILImage
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PROBE_WORKERS = 8
+CACHE_SIZE = 4096
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SOI = b"\xff\xd8"
+# Start Of Frame markers, except DHT (C4), JPG (C8) and DAC (CC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9}
+
+Dimensions = Tuple[int, int]
+
+
+def _png_dimensions(header: bytes) -> Optional[Dimensions]:
+    if len(header) < 24 or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+
+def _webp_dimensions(header: bytes) -> Optional[Dimensions]:
+    chunk = header[12:16]
+    if chunk == b"VP8 " and len(header) >= 30 and header[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    elif chunk == b"VP8L" and len(header) >= 25 and header[20] == 0x2F:
+        bits = int.from_bytes(header[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    elif chunk == b"VP8X" and len(header) >= 30:
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+        return width, height
+    return None
+
+
+def _jpeg_dimensions(file: BinaryIO) -> Optional[Dimensions]:
+    file.seek(2)
+    while True:
+        byte = file.read(1)
+        if not byte:
+            return None
+        if byte != b"\xff":
+            continue
+        marker = file.read(1)
+        while marker == b"\xff":  # fill bytes
+            marker = file.read(1)
+        if not marker:
+            return None
+
+        marker_code = marker[0]
+        if marker_code in JPEG_STANDALONE_MARKERS or marker_code == 0x00:
+            continue
+
+        length_bytes = file.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker_code in JPEG_SOF_MARKERS:
+            segment = file.read(5)
+            if len(segment) < 5:
+                return None
+            height, width = struct.unpack(">HH", segment[1:5])
+            return width, height
+        file.seek(length - 2, os.SEEK_CUR)
+
+
+def _read_header_dimensions(path: str) -> Optional[Dimensions]:
+    with open(path, "rb") as file:
+        header = file.read(32)
+        if header.startswith(PNG_SIGNATURE):
+            return _png_dimensions(header)
+        elif header.startswith(JPEG_SOI):
+            return _jpeg_dimensions(file)
+        elif header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+            return _webp_dimensions(header)
+    return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _cached_dimensions(path: str, mtime_ns: int, size: int) -> Dimensions:
+    dimensions = None
+    try:
+        dimensions = _read_header_dimensions(path)
+    except (OSError, struct.error) as e:
+        log.debug(f"Could not read dimensions from header of image={path}: {e}")
+
+    if dimensions is None:
+        with PILImage.open(path) as im:
+            dimensions = im.size
+    return dimensions
+
+
+def get_image_dimensions(image_path: Union[str, Path]) -> Dimensions:
+    """
+    Returns (width, height) of the image. Results are cached on path, modification time and size,
+    so the file is only read again if it has changed.
+    """
+    path = os.fspath(Path(image_path).expanduser())
+    stat = os.stat(path)
+    return _cached_dimensions(path, stat.st_mtime_ns, stat.st_size)
+
+
+def get_images_dimensions(image_paths: List[Union[str, Path]],
+                          max_workers: int = DEFAULT_PROBE_WORKERS) -> List[Dimensions]:
+    """Returns (width, height) for each image, reading the images in parallel"""
+    if len(image_paths) <= 1:
+        return [get_image_dimensions(image_path) for image_path in image_paths]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(get_image_dimensions, image_paths))
@@ -0,0 +1,331 @@
+"""Creating inputs for a directory tree of scenes in parallel processes, see `annoutil ingest`"""
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from annotell.auth.authsession import DEFAULT_HOST as DEFAULT_AUTH_HOST, AuthSession
+from annotell.auth.token_cache import DEFAULT_CACHE_DIR, TOKEN_CACHE_ENV, TokenCache
+
+from . import input_api_model as IAM
+from .bulk_ingestion import SceneSpec
+from .upload_manifest import UploadManifest
+
+log = logging.getLogger(__name__)
+
+INPUT_TYPE_IMAGES = "images"
+INPUT_TYPE_POINT_CLOUD_WITH_IMAGES = "point_cloud_with_images"
+INPUT_TYPES = [INPUT_TYPE_IMAGES, INPUT_TYPE_POINT_CLOUD_WITH_IMAGES]
+
+DEFAULT_SCENE_GLOB = "*"
+DEFAULT_EXTERNAL_ID = "{scene}"
+
+
+class SceneLayout:
+    """
+    Where the scenes and their files are in a directory tree, read from a json config like
+
+        {
+          "inputType": "point_cloud_with_images",
+          "scenes": "*/*",
+          "images": {"RFC01": "camera_front/*.jpg", "RFC02": "camera_rear/*.jpg"},
+          "pointClouds": {"lidar": "lidar/*.pcd"},
+          "externalId": "{scene}",
+          "calibrationId": 1
+        }
+
+    Each directory matching `scenes` under the root is a scene, and one input is created per scene.
+    `images` and `pointClouds` map each source to a glob of its files in the scene directory.
+    `externalId` is formatted with `scene`, the path of the scene relative to the root, and `name`,
+    the name of the scene directory.
+    """
+
+    def __init__(self,
+                 input_type: str,
+                 images: Optional[Dict[str, str]] = None,
+                 point_clouds: Optional[Dict[str, str]] = None,
+                 scene_glob: str = DEFAULT_SCENE_GLOB,
+                 external_id: str = DEFAULT_EXTERNAL_ID,
+                 calibration_id: Optional[int] = None):
+        """
+        :param input_type: `images` or `point_cloud_with_images`
+        :param images: source -> glob of the images of the source, relative to the scene directory
+        :param point_clouds: source -> glob of the point clouds of the source, relative to the scene directory
+        :param scene_glob: glob of the scene directories, relative to the root
+        :param external_id: template of the external id of each scene
+        :param calibration_id: calibration of the scenes, required for point clouds with images
+        """
+        if input_type not in INPUT_TYPES:
+            raise ValueError(f"Unsupported input type {input_type}, expected one of {', '.join(INPUT_TYPES)}")
+        self.input_type = input_type
+        self.images = images or dict()
+        self.point_clouds = point_clouds or dict()
+        self.scene_glob = scene_glob
+        self.external_id = external_id
+        self.calibration_id = calibration_id
+
+    def validate(self) -> None:
+        if not self.images and self.input_type == INPUT_TYPE_IMAGES:
+            raise ValueError("The scene layout has no images")
+        if self.input_type == INPUT_TYPE_POINT_CLOUD_WITH_IMAGES:
+            if not self.point_clouds:
+                raise ValueError("The scene layout has no point clouds")
+            if self.calibration_id is None:
+                raise ValueError("Point clouds with images need a calibration id")
+
+    @staticmethod
+    def from_dict(js: dict) -> "SceneLayout":
+        return SceneLayout(input_type=js["inputType"],
+                           images=js.get("images"),
+                           point_clouds=js.get("pointClouds"),
+                           scene_glob=js.get("scenes", DEFAULT_SCENE_GLOB),
+                           external_id=js.get("externalId", DEFAULT_EXTERNAL_ID),
+                           calibration_id=js.get("calibrationId"))
+
+    @staticmethod
+    def load(path: Union[str, Path]) -> "SceneLayout":
+        with open(Path(path).expanduser()) as f:
+            return SceneLayout.from_dict(json.load(f))
+
+    def find_scenes(self, root: Path) -> List[Path]:
+        """The scene directories under `root`, in sorted order"""
+        return sorted(path for path in root.glob(self.scene_glob) if path.is_dir())
+
+    @staticmethod
+    def _find_files(scene_dir: Path, source_globs: Dict[str, str]) -> List[Tuple[str, str]]:
+        files = []
+        for (source, pattern) in source_globs.items():
+            matches = sorted(path for path in scene_dir.glob(pattern) if path.is_file())
+            if not matches:
+                raise ValueError(f"No files matching {pattern} for source {source}")
+            files += [(path.relative_to(scene_dir).as_posix(), source) for path in matches]
+        return files
+
+    def scene_spec(self, root: Path, scene_dir: Path,
+                   project: Optional[str] = None,
+                   batch: Optional[str] = None,
+                   input_list_id: Optional[int] = None) -> SceneSpec:
+        """The files and metadata of a scene, raises ValueError if a source has no files"""
+        scene = scene_dir.relative_to(root).as_posix()
+        external_id = self.external_id.format(scene=scene, name=scene_dir.name)
+        images = [IAM.Image(filename, source=source) for (filename, source) in self._find_files(scene_dir, self.images)]
+        if self.input_type == INPUT_TYPE_IMAGES:
+            files = IAM.ImagesFiles(images)
+            metadata = IAM.SceneMetaData(external_id)
+        else:
+            point_clouds = [IAM.PointCloud(filename, source=source)
+                            for (filename, source) in self._find_files(scene_dir, self.point_clouds)]
+            files = IAM.PointCloudsWithImages(images, point_clouds)
+            metadata = IAM.CalibratedSceneMetaData(external_id, self.calibration_id)
+        return SceneSpec(folder=scene_dir, files=files, metadata=metadata,
+                         project=project, batch=batch, input_list_id=input_list_id)
+
+
+@dataclass
+class SceneResult:
+    """
+    The result of creating the input of one scene, `error` describes why it failed. `source_bytes` is the
+    size of the files of the scene on disk, before any point clouds are converted for the upload.
+    """
+    scene: str
+    external_id: str
+    internal_id: Optional[str] = None
+    error: Optional[str] = None
+    source_bytes: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class IngestJournal:
+    """
+    The scenes that inputs have been created for, as json lines appended to as each input is created,
+    so that an interrupted ingestion can be resumed without creating the inputs again
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path).expanduser()
+        # scene -> internal id
+        self.completed: Dict[str, Optional[str]] = dict()
+        try:
+            with self.path.open() as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.completed[record["scene"]] = record.get("internalId")
+                    except (ValueError, KeyError) as e:
+                        # e.g. the last line, if the process was killed while writing it
+                        log.warning(f"Ignoring corrupt journal record: {e}")
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, scene: str) -> bool:
+        return scene in self.completed
+
+    def add(self, result: SceneResult) -> None:
+        self.completed[result.scene] = result.internal_id
+        with self.path.open("a") as f:
+            f.write(json.dumps(dict(scene=result.scene,
+                                    externalId=result.external_id,
+                                    internalId=result.internal_id)) + "\n")
+
+
+class IngestProgress:
+    """Throughput of an ingestion so far, and the estimated time until it is done"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.num_created = 0
+        self.num_failed = 0
+        self.source_bytes = 0
+        self.started_at = time.monotonic()
+
+    def add(self, result: SceneResult) -> None:
+        if result.ok:
+            self.num_created += 1
+            self.source_bytes += result.source_bytes
+        else:
+            self.num_failed += 1
+
+    @property
+    def num_done(self) -> int:
+        return self.num_created + self.num_failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def scenes_per_second(self) -> float:
+        return self.num_done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def source_bytes_per_second(self) -> float:
+        """Size of the scene files read per second, see `SceneResult.source_bytes`"""
+        return self.source_bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds until all scenes are done at the current rate, None before any scene is done"""
+        if self.scenes_per_second == 0:
+            return None
+        return (self.total - self.num_done) / self.scenes_per_second
+
+    def __str__(self):
+        eta = str(timedelta(seconds=round(self.eta))) if self.eta is not None else "-"
+        return f"{self.num_done}/{self.total} scenes ({self.num_failed} failed), " \
+               f"{self.scenes_per_second:.2f} scenes/s, {self.source_bytes_per_second / 2 ** 20:.1f} MiB/s read, ETA {eta}"
+
+
+# the client of each worker process, created by its first scene
+_worker_client = None
+
+
+def _source_bytes(spec: SceneSpec) -> int:
+    return sum(spec.folder.joinpath(filename).stat().st_size for filename in spec.filenames)
+
+
+def _create_worker_client(client_kwargs: dict, token_cache_dir: str):
+    from .input_api_client import InputApiClient
+    auth = AuthSession(auth=client_kwargs.get("auth"),
+                       host=client_kwargs.get("auth_host", DEFAULT_AUTH_HOST),
+                       token_cache=TokenCache(token_cache_dir))
+    return InputApiClient(**dict(client_kwargs, auth=auth))
+
+
+def _create_input(scene: str, spec: SceneSpec, client_kwargs: dict, dryrun: bool,
+                  token_cache_dir: str, manifest_dir: Optional[Path]) -> SceneResult:
+    """Runs in a worker process, errors are returned as text since not all exceptions can be pickled"""
+    global _worker_client
+    result = SceneResult(scene, spec.metadata.external_id)
+    manifest_path = None
+    try:
+        if _worker_client is None:
+            _worker_client = _create_worker_client(client_kwargs, token_cache_dir)
+        if manifest_dir is not None:
+            # a manifest per scene, so that no manifest is used by two processes at the same time
+            manifest_path = manifest_dir / f"{UploadManifest.scene_key(spec.folder, spec.filenames)}.manifest"
+            _worker_client.upload_manifest = UploadManifest(manifest_path)
+        result.source_bytes = _source_bytes(spec)
+        if isinstance(spec.files, IAM.PointCloudsWithImages):
+            response = _worker_client.create_inputs_point_cloud_with_images(
+                spec.folder, spec.files, spec.metadata, project=spec.project, batch=spec.batch,
+                input_list_id=spec.input_list_id, dryrun=dryrun)
+        else:
+            response = _worker_client.create_inputs_images(
+                spec.folder, spec.files, spec.metadata, project=spec.project, batch=spec.batch,
+                input_list_id=spec.input_list_id, dryrun=dryrun)
+        result.internal_id = response.internal_id if response is not None else None
+        if manifest_path is not None:
+            # the input has been created, so there is nothing left to reuse
+            try:
+                manifest_path.unlink()
+            except FileNotFoundError:
+                pass
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        if _worker_client is not None:
+            _worker_client.upload_manifest = None
+    return result
+
+
+def ingest(scenes: Iterable[Tuple[str, SceneSpec]],
+           client_kwargs: Optional[dict] = None,
+           processes: Optional[int] = None,
+           dryrun: bool = False,
+           token_cache_dir: Optional[Union[str, Path]] = None,
+           manifest_dir: Optional[Union[str, Path]] = None) -> Iterator[SceneResult]:
+    """
+    Creates the inputs of the scenes in a pool of processes, each with its own client, and yields the
+    result of each scene as it is done. At most two scenes per process are submitted ahead. The processes
+    share their access token through a token cache, so that it is fetched once rather than by every process.
+
+    :param scenes: pairs of a key of the scene, e.g. its path, and its SceneSpec
+    :param client_kwargs: arguments of the InputApiClient of each process, except `upload_manifest`. `auth` must
+    be credentials, not an AuthSession, since the arguments are sent to the processes and a session cannot be.
+    :param processes: number of processes, the number of CPUs if None
+    :param dryrun: If True the files/metadata will be validated but no input will be created
+    :param token_cache_dir: directory of the token cache of the processes, defaults to `ANNOTELL_TOKEN_CACHE`
+    or else `~/.cache/annotell/tokens`
+    :param manifest_dir: If given, each scene has an upload manifest in this directory while its input is
+    created, so that ingesting a failed scene again reuses its uploaded files, see `UploadManifest`
+    """
+    client_kwargs = client_kwargs or dict()
+    if "upload_manifest" in client_kwargs:
+        raise ValueError("An upload manifest cannot be shared by the processes, use manifest_dir instead")
+    if isinstance(client_kwargs.get("auth"), AuthSession):
+        raise ValueError("An AuthSession cannot be sent to the processes, pass the credentials as auth instead. "
+                         "The processes share their tokens through the token cache.")
+    token_cache_dir = str(token_cache_dir or os.environ.get(TOKEN_CACHE_ENV) or DEFAULT_CACHE_DIR)
+    manifest_dir = Path(manifest_dir).expanduser() if manifest_dir is not None else None
+    processes = processes or os.cpu_count() or 1
+    scenes = iter(scenes)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = set()
+
+        def _submit_next() -> None:
+            next_scene = next(scenes, None)
+            if next_scene is not None:
+                (scene, spec) = next_scene
+                pending.add(executor.submit(_create_input, scene, spec, client_kwargs, dryrun,
+                                            token_cache_dir, manifest_dir))
+
+        try:
+            for _ in range(2 * processes):
+                _submit_next()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    _submit_next()
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
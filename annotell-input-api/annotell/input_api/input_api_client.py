@@ -1,27 +1,44 @@
 """Client for communicating with the Annotell platform."""
 import logging
 import mimetypes
-import random
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from itertools import islice
 from pathlib import Path
-from typing import List, Mapping, Optional, Union, Dict, BinaryIO
+from typing import Iterable, Iterator, List, Mapping, Optional, Tuple, Union, Dict, BinaryIO
+from urllib.parse import quote
 from uuid import uuid4 as uuid
-from annotell.input_api.util import filter_none
+from annotell.input_api.util import filter_none, iter_json_array, iter_json_object
 
 import requests
 import time
-from PIL import Image
 from annotell.auth.authsession import (
     FaultTolerantAuthRequestSession, DEFAULT_HOST as DEFAULT_AUTH_HOST
 )
+from annotell.auth.connection_pool import create_session, Timeout
 
 from . import input_api_model as IAM
+from .calibration_cache import CalibrationCache
+from .image_dimensions import get_images_dimensions
+from .bulk_ingestion import BulkIngestion, SceneSpec, SceneOutcome
+from .resumable_upload import ResumableUpload, DEFAULT_CHUNK_SIZE
+from .retry import RetryPolicy, RetryMetrics, RETRYABLE_STATUS_CODES
+from .input_status import InputStatusTracker
+from .upload_manifest import UploadManifest, FileFingerprint
+from .upload_body import UploadBody
 
 DEFAULT_HOST = "https://input.annotell.com"
 
-log = logging.getLogger(__name__)
+DEFAULT_PAGE_SIZE = 1000
+# keeps request urls well below the common 8 KB limit of servers and proxies
+MAX_EXTERNAL_IDS_QUERY_LENGTH = 4000
+DEFAULT_LOOKUP_WORKERS = 8
+DEFAULT_EXPORT_BATCH_SIZE = 100
+DEFAULT_EXPORT_WORKERS = 4
+# scenes uploading files at the same time in `create_inputs_bulk` by default
+DEFAULT_BULK_UPLOAD_WORKERS = 2
+STREAM_CHUNK_SIZE = 64 * 1024
 
-RETRYABLE_STATUS_CODES = [408, 429, 500, 501, 502, 503,
-                          504, 505, 506, 507, 508, 509, 510, 511, 598, 599]
+log = logging.getLogger(__name__)
 
 
 class InputApiClient:
@@ -33,28 +50,82 @@ class InputApiClient:
                  auth_host: str = DEFAULT_AUTH_HOST,
                  client_organization_id: int = None,
                  max_upload_retry_attempts: int = 23,
-                 max_upload_retry_wait_time: int = 60):
+                 max_upload_retry_wait_time: int = 60,
+                 max_upload_workers: int = 8,
+                 resumable_upload_threshold: Optional[int] = None,
+                 resumable_upload_chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 upload_retry_policy: Optional[RetryPolicy] = None,
+                 calibration_cache: Optional[CalibrationCache] = None,
+                 pool_maxsize: Optional[int] = None,
+                 storage_pool_maxsize: Optional[int] = None,
+                 tcp_keepalive: bool = False,
+                 timeout: Timeout = None,
+                 upload_manifest: Optional[UploadManifest] = None,
+                 validate_point_clouds: bool = False,
+                 point_cloud_format: Optional[str] = None):
         """
         :param auth: auth credentials, see
-        https://github.com/annotell/annotell-python/tree/master/annotell-auth
+        https://github.com/annotell/annotell-python/tree/master/annotell-auth,
+        or an AuthSession to share with other clients
         :param host: override for input api url
         :param auth_host: override for authentication url
         :param client_organization_id: Overrides your users organization id.
         Only works with an Annotell user.
         :param max_upload_retry_attempts: Max number of attempts to retry uploading a file to GCS.
         :param max_upload_retry_wait_time:  Max with time before retrying an upload to GCS.
+        :param max_upload_workers: Max number of files uploaded to GCS in parallel.
+        :param resumable_upload_threshold: Files of at least this many bytes are uploaded in chunks,
+        resuming from the last acknowledged byte on failure. If None all files are uploaded in a single request.
+        :param resumable_upload_chunk_size: Bytes sent per request in resumable uploads, multiple of 256 KiB.
+        :param upload_retry_policy: Overrides the retry policy shared by all uploads, including its retry budget
+        and circuit breaker. By default built from `max_upload_retry_attempts` and `max_upload_retry_wait_time`.
+        :param calibration_cache: If given, identical calibrations are only created once, and calibrations
+        fetched by id are served from the cache until it needs revalidation.
+        :param pool_maxsize: Max number of connections kept open to the Input API, defaults to 10. Not applied to
+        an AuthSession given as `auth`, whose connection pool is shared with other clients.
+        :param storage_pool_maxsize: Max number of connections kept open to GCS, separate from the ones to
+        the Input API so that uploads do not starve API calls. Defaults to enough for `create_inputs_bulk`
+        with default settings.
+        :param tcp_keepalive: Send TCP keep-alive probes on idle connections
+        :param timeout: Timeout for requests, in seconds or as (connect, read). Waits forever if None.
+        :param upload_manifest: If given, creating an input again for the same files, after it failed, reuses the
+        upload urls of the earlier attempt and skips the files that were already uploaded and have not changed.
+        :param validate_point_clouds: Read the point clouds before anything is uploaded, and raise a PointCloudError
+        if one would fail to be converted by the Input API. Requires numpy.
+        :param point_cloud_format: If `binary` or `binary_compressed`, CSV and ascii PCD point clouds are converted
+        to PCD files in this format before they are uploaded, and binary PCD files too if `binary_compressed`.
+        Requires numpy.
         """
 
         self.host = host
-        self._auth_req_session = FaultTolerantAuthRequestSession(host=auth_host, auth=auth)
+        self._auth_req_session = FaultTolerantAuthRequestSession(host=auth_host,
+                                                                 auth=auth,
+                                                                 pool_maxsize=pool_maxsize,
+                                                                 tcp_keepalive=tcp_keepalive,
+                                                                 timeout=timeout)
+        if storage_pool_maxsize is None:
+            storage_pool_maxsize = max_upload_workers * DEFAULT_BULK_UPLOAD_WORKERS
+        # upload urls are signed, so uploads are sent without the token
+        self._storage_session = create_session(pool_maxsize=storage_pool_maxsize,
+                                               tcp_keepalive=tcp_keepalive,
+                                               timeout=timeout)
         self.headers = {
             "Accept-Encoding": "gzip",
             "Accept": "application/json"
         }
         self.dryrun_header = {"X-Dryrun": ""}
 
-        self.MAX_NUM_UPLOAD_RETRIES = max_upload_retry_attempts
-        self.MAX_RETRY_WAIT_TIME = max_upload_retry_wait_time  # seconds
+        self.MAX_UPLOAD_WORKERS = max_upload_workers
+        self.RESUMABLE_UPLOAD_THRESHOLD = resumable_upload_threshold
+        self.RESUMABLE_UPLOAD_CHUNK_SIZE = resumable_upload_chunk_size
+        if upload_retry_policy is None:
+            upload_retry_policy = RetryPolicy(max_attempts=max_upload_retry_attempts,
+                                              max_wait_time=max_upload_retry_wait_time)
+        self.upload_retry_policy = upload_retry_policy
+        self.calibration_cache = calibration_cache
+        self.upload_manifest = upload_manifest
+        self.validate_point_clouds = validate_point_clouds
+        self.point_cloud_format = point_cloud_format
         if client_organization_id is not None:
             self.headers["X-Organization-Id"] = str(client_organization_id)
             c_org_id = client_organization_id
@@ -65,6 +136,16 @@ class InputApiClient:
     def session(self):
         return self._auth_req_session
 
+    @property
+    def storage_session(self) -> requests.Session:
+        """Session for uploads to signed cloud storage urls"""
+        return self._storage_session
+
+    @property
+    def upload_retry_metrics(self) -> RetryMetrics:
+        """Number of upload attempts and retries, and time spent waiting, for all uploads of the client"""
+        return self.upload_retry_policy.metrics
+
     @staticmethod
     def _raise_on_error(resp: requests.Response) -> requests.Response:
         try:
@@ -81,25 +162,63 @@ class InputApiClient:
             raise exception from None
         return resp
 
-    def _get_upload_urls(self, files_to_upload: IAM.FilesToUpload):
-        """Get upload urls to cloud storage"""
+    def _get_upload_urls(self, files_to_upload: IAM.FilesToUpload, folder: Optional[Path] = None):
+        """Get upload urls to cloud storage, those of an earlier job for the same files in `folder` if possible"""
+        scene_key = None
+        if self.upload_manifest is not None and folder is not None:
+            scene_key = UploadManifest.scene_key(folder, files_to_upload.files)
+            earlier_job = self.upload_manifest.get_job(scene_key, files_to_upload.files)
+            if earlier_job is not None:
+                (internal_id, files_to_url) = earlier_job
+                log.info(f"Reusing the upload urls of job internal_id={internal_id}")
+                return IAM.UploadUrlsResponse(files_to_url, internal_id)
+
         url = f"{self.host}/v1/inputs/upload-urls"
         resp = self.session.get(url, json=files_to_upload.to_dict(), headers=self.headers)
         json_resp = self._raise_on_error(resp).json()
-        return IAM.UploadUrlsResponse.from_json(json_resp)
+        upload_urls_response = IAM.UploadUrlsResponse.from_json(json_resp)
+        if scene_key is not None:
+            self.upload_manifest.add_job(scene_key, upload_urls_response.internal_id,
+                                         upload_urls_response.files_to_url)
+        return upload_urls_response
 
     @staticmethod
     def _set_images_dimensions(folder: Path, images: List[IAM.Image]) -> None:
         def _is_image_missing_dimensions(img: IAM.Image):
             return img.width is None or img.height is None
 
-        for image in images:
-            if _is_image_missing_dimensions(image):
-                fi = folder.joinpath(image.filename).expanduser()
-                with Image.open(fi) as im:
-                    width, height = im.size
-                    image.height = height
-                    image.width = width
+        images = [image for image in images if _is_image_missing_dimensions(image)]
+        image_paths = [folder.joinpath(image.filename).expanduser() for image in images]
+        for (image, (width, height)) in zip(images, get_images_dimensions(image_paths)):
+            image.height = height
+            image.width = width
+
+    def _prepare_point_clouds(self, folder: Path, point_clouds: List[IAM.PointCloud], convert: bool = True):
+        """
+        Reads and validates the point clouds if `validate_point_clouds` is set, and converts them if
+        `point_cloud_format` is set and `convert`. Returns the PointCloudConversion, which renames the
+        converted point clouds until it is closed, or None if nothing is converted. Raises a ValueError
+        if a converted point cloud would be uploaded with the same filename as another point cloud.
+        """
+        point_cloud_format = self.point_cloud_format if convert else None
+        if not self.validate_point_clouds and point_cloud_format is None:
+            return None
+        from .point_cloud import PointCloudConversion, read_point_cloud
+
+        conversion = PointCloudConversion(point_cloud_format) if point_cloud_format is not None else None
+        try:
+            for point_cloud in point_clouds:
+                path = folder.joinpath(point_cloud.filename).expanduser()
+                cloud = read_point_cloud(path, validate=self.validate_point_clouds)
+                if conversion is not None and conversion.needs_conversion(cloud):
+                    conversion.convert(cloud, point_cloud)
+            if conversion is not None:
+                conversion.check_filenames(point_clouds)
+        except BaseException:
+            if conversion is not None:
+                conversion.close()
+            raise
+        return conversion
 
     @staticmethod
     def _unwrap_enveloped_json(js: dict) -> dict:
@@ -118,56 +237,157 @@ class InputApiClient:
 
         return content_type
 
-    def _get_wait_time(self, upload_attempt: int) -> int:
-        """
-        Calculates the wait time before attempting another file upload to GCS
-
-        :param upload_attempt: How many attempts to upload that have been made
-        :return: int: The time to wait before retrying upload
-        """
-        max_wait_time = pow(2, upload_attempt - 1)
-        wait_time = random.random()*max_wait_time
-        wait_time = wait_time if wait_time < self.MAX_RETRY_WAIT_TIME else self.MAX_RETRY_WAIT_TIME
-        return wait_time
-
-    #  Using similar retry strategy as gsutil
-    #  https://cloud.google.com/storage/docs/gsutil/addlhelp/RetryHandlingStrategy
-    def _upload_file(
-            self, upload_url: str, file: BinaryIO, headers: Dict[str, str],
-            upload_attempt: int = 1) -> None:
+    def _upload_file(self, upload_url: str, file: Union[BinaryIO, UploadBody], headers: Dict[str, str]) -> None:
         """
         Upload the file to GCS, retries if the upload fails with some specific status codes.
+        An UploadBody is sent as a single buffer, and again as is on retries.
         """
         log.info(f"Uploading file={file.name}")
-        resp = self.session.put(upload_url, data=file, headers=headers)
-        try:
-            resp.raise_for_status()
-        except requests.HTTPError as e:
-            log.error(f"On upload attempt ({upload_attempt}/{self.MAX_NUM_UPLOAD_RETRIES}) to GCS "
-                      f"got response:\n{resp.status_code}: {resp.content}")
-
-            attempt_cond = upload_attempt < self.MAX_NUM_UPLOAD_RETRIES
-            status_code_cond = resp.status_code in RETRYABLE_STATUS_CODES
-
-            if attempt_cond and status_code_cond:
-                wait_time = self._get_wait_time(upload_attempt)
-                log.info(f"Waiting {int(wait_time)} seconds before retrying")
-                time.sleep(wait_time)
-                self._upload_file(upload_url, file, headers, upload_attempt + 1)
-            else:
-                raise e
-
-        except Exception as e:
-            raise e
-
-    def _upload_files(self, folder: Path, url_map: Mapping[str, str]) -> None:
-        """Upload all files to cloud storage"""
-        for (filename, upload_url) in url_map.items():
-            file_path = folder.joinpath(filename).expanduser()
-            with file_path.open('rb') as file:
+        retry_policy = self.upload_retry_policy
+        upload_attempt = 1
+        while True:
+            retry_policy.before_attempt()
+            data = file.view() if isinstance(file, UploadBody) else file
+            try:
+                resp = self.storage_session.put(upload_url, data=data, headers=headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                log.error(f"On upload attempt ({upload_attempt}/{retry_policy.max_attempts}) to GCS "
+                          f"got error: {e}")
+                retry_policy.record_failure()
+                if not retry_policy.should_retry(upload_attempt):
+                    raise
+
+                retry_policy.sleep_before_retry(upload_attempt)
+                if not isinstance(file, UploadBody):
+                    file.seek(0)
+                upload_attempt += 1
+                continue
+            except BaseException:
+                retry_policy.record_failure()
+                raise
+
+            try:
+                resp.raise_for_status()
+            except requests.HTTPError:
+                log.error(f"On upload attempt ({upload_attempt}/{retry_policy.max_attempts}) to GCS "
+                          f"got response:\n{resp.status_code}: {resp.content}")
+                retry_policy.record_failure(resp.status_code)
+                if not retry_policy.should_retry(upload_attempt, resp.status_code):
+                    raise
+
+                retry_policy.sleep_before_retry(upload_attempt, resp)
+                if not isinstance(file, UploadBody):
+                    file.seek(0)
+                upload_attempt += 1
+                continue
+
+            retry_policy.record_success()
+            return
+
+    def _upload_file_resumable(self, upload_url: str, file: Union[BinaryIO, UploadBody],
+                               headers: Dict[str, str]) -> None:
+        """
+        Upload the file to GCS in chunks. Failed chunks are retried with the same wait times as
+        `_upload_file`, continuing from the last byte persisted by GCS. The attempt count is reset
+        whenever a chunk makes progress. Falls back to `_upload_file` if the upload url does not
+        allow resumable uploads.
+        """
+        log.info(f"Uploading file={file.name} in chunks")
+        upload = ResumableUpload(self.storage_session, upload_url, file, headers,
+                                 chunk_size=self.RESUMABLE_UPLOAD_CHUNK_SIZE)
+        retry_policy = self.upload_retry_policy
+        upload_attempt = 1
+        while not upload.complete:
+            offset = upload.offset
+            retry_policy.before_attempt()
+            try:
+                if upload.session_url is None:
+                    upload.initiate()
+                else:
+                    upload.upload_next_chunk()
+            except requests.RequestException as e:
+                status_code = e.response.status_code if e.response is not None else None
+                retry_policy.record_failure(status_code)
+                if upload.session_url is None and status_code is not None and \
+                        status_code not in RETRYABLE_STATUS_CODES:
+                    log.warning(f"Could not start resumable upload of file={file.name}, got {status_code}. "
+                                f"Uploading the file in a single request instead")
+                    if not isinstance(file, UploadBody):
+                        file.seek(0)
+                    return self._upload_file(upload_url, file, headers)
+
+                log.error(f"On upload attempt ({upload_attempt}/{retry_policy.max_attempts}) of file={file.name} "
+                          f"at byte {upload.offset}/{upload.total_size} got error: {e}")
+                if status_code in (404, 410):
+                    # the upload session has expired, start over with a new one
+                    upload.session_url = None
+                    status_code = None
+                if not retry_policy.should_retry(upload_attempt, status_code):
+                    raise
+
+                retry_policy.sleep_before_retry(upload_attempt, e.response)
+                upload_attempt += 1
+                if upload.session_url is not None:
+                    try:
+                        upload.sync_offset()
+                    except requests.RequestException as sync_error:
+                        log.warning(f"Could not get upload progress of file={file.name}: {sync_error}")
+                continue
+            except BaseException:
+                # e.g. an unexpected response, the attempt must still end, or a half open circuit stays half open
+                retry_policy.record_failure()
+                raise
+
+            retry_policy.record_success()
+            if upload.offset > offset:
+                upload_attempt = 1
+
+    def _upload_files(self, folder: Path, url_map: Mapping[str, str], internal_id: Optional[str] = None,
+                      local_paths: Optional[Mapping[str, Path]] = None) -> None:
+        """
+        Upload all files to cloud storage, with at most `MAX_UPLOAD_WORKERS` files in flight.
+        Every file is attempted even if some fail, the failures are then raised together.
+        With an upload manifest, files already uploaded for the job `internal_id` are skipped.
+        Files in `local_paths`, e.g. converted point clouds, are uploaded from there instead of `folder`.
+        """
+        manifest = self.upload_manifest if internal_id is not None else None
+        local_paths = local_paths or dict()
+
+        def _upload(filename: str, upload_url: str) -> None:
+            file_path = local_paths.get(filename) or folder.joinpath(filename).expanduser()
+            fingerprint = None
+            if manifest is not None:
+                if manifest.is_uploaded(internal_id, filename, file_path):
+                    log.info(f"Skipping file={filename}, already uploaded")
+                    return
+                fingerprint = FileFingerprint.of(file_path)
+            with UploadBody.open(file_path) as file:
                 content_type = self._get_content_type(filename)
                 headers = {"Content-Type": content_type}
-                self._upload_file(upload_url, file, headers)
+                threshold = self.RESUMABLE_UPLOAD_THRESHOLD
+                if threshold is not None and file.size >= threshold:
+                    self._upload_file_resumable(upload_url, file, headers)
+                else:
+                    self._upload_file(upload_url, file, headers)
+            if fingerprint is not None:
+                manifest.add_upload(internal_id, filename, fingerprint)
+
+        failed_uploads = dict()
+        with ThreadPoolExecutor(max_workers=self.MAX_UPLOAD_WORKERS) as executor:
+            futures = {
+                executor.submit(_upload, filename, upload_url): filename
+                for (filename, upload_url) in url_map.items()
+            }
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    log.error(f"Failed to upload file={filename}: {e}")
+                    failed_uploads[filename] = e
+
+        if failed_uploads:
+            raise IAM.FileUploadError(failed_uploads)
 
     def _resolve_request_url(self,
                              resource_path: str,
@@ -205,6 +425,8 @@ class InputApiClient:
         resp = self.session.post(request_url, json=input_request, headers=headers)
         json_resp = self._unwrap_enveloped_json(self._raise_on_error(resp).json())
         if not dryrun:
+            if self.upload_manifest is not None and "internalId" in input_request:
+                self.upload_manifest.complete_job(input_request["internalId"])
             return IAM.CreateInputJobResponse.from_json(json_resp)
 
     def _create_inputs_point_cloud_with_images(
@@ -311,7 +533,7 @@ class InputApiClient:
         self._set_images_dimensions(folder, images_files.images)
 
         filenames = [image.filename for image in images_files.images]
-        upload_url_resp = self._get_upload_urls(IAM.FilesToUpload(filenames))
+        upload_url_resp = self._get_upload_urls(IAM.FilesToUpload(filenames), folder)
 
         internal_id = upload_url_resp.internal_id
         self._create_images_input_job(images_files=images_files,
@@ -326,7 +548,7 @@ class InputApiClient:
         assert set(filenames) == set(files_in_response)
 
         if not dryrun:
-            self._upload_files(folder, upload_url_resp.files_to_url)
+            self._upload_files(folder, upload_url_resp.files_to_url, internal_id)
             input_job_created_message = self._create_images_input_job(images_files=images_files,
                                                                       metadata=metadata,
                                                                       internal_id=internal_id,
@@ -370,12 +592,15 @@ class InputApiClient:
         The job is successful once it converts the pointcloud file into potree, at which time an
         input of type 'point_cloud' is created for the designated `project` `batch` or
         `input_list_id`. If the input_job fails (cannot perform conversion) the input is not added.
-        To see if conversion was successful please see the method `get_input_jobs_status`.
+        To wait for the conversion, use `track_inputs` with the internal id of the returned job.
         """
 
+        # the point clouds are not uploaded here, so they are only validated
+        self._prepare_point_clouds(folder, point_clouds.point_clouds, convert=False)
+
         files_on_disk = [pc.filename for pc in point_clouds.point_clouds]
 
-        upload_urls_response = self._get_upload_urls(IAM.FilesToUpload(files_on_disk))
+        upload_urls_response = self._get_upload_urls(IAM.FilesToUpload(files_on_disk), folder)
 
         files_in_response = list(upload_urls_response.files_to_url.keys())
         assert set(files_on_disk) == set(files_in_response)
@@ -435,43 +660,78 @@ class InputApiClient:
         The job is successful once it converts the pointcloud file into potree, at which time an
         input of type 'point_cloud_with_image' is created for the designated `project` `batch` or
         `input_list_id`. If the input_job fails (cannot perform conversion) the input is not added.
-        To see if conversion was successful please see the method `get_input_jobs_status`.
+        To wait for the conversion, use `track_inputs` with the internal id of the returned job.
         """
 
-        files_on_disk = [image.filename for image in point_clouds_with_images.images] + \
-                        [pc.filename for pc in point_clouds_with_images.point_clouds]
-
-        upload_urls_response = self._get_upload_urls(IAM.FilesToUpload(files_on_disk))
-
-        files_in_response = list(upload_urls_response.files_to_url.keys())
-        assert set(files_on_disk) == set(files_in_response)
-
-        self._set_images_dimensions(folder, point_clouds_with_images.images)
-        self._create_inputs_point_cloud_with_images(point_clouds_with_images,
-                                                    upload_urls_response.internal_id,
-                                                    metadata,
-                                                    project=project,
-                                                    batch=batch,
-                                                    input_list_id=input_list_id,
-                                                    dryrun=True)
-        if not dryrun:
-            self._upload_files(folder, upload_urls_response.files_to_url)
-
-            create_input_response = self._create_inputs_point_cloud_with_images(
-                point_clouds_with_images,
-                upload_urls_response.internal_id,
-                metadata,
-                project=project,
-                batch=batch,
-                input_list_id=input_list_id,
-            )
-
-            if create_input_response:
-                log.info(
-                    f"Creating inputs for files with job_id={create_input_response.internal_id}"
+        conversion = self._prepare_point_clouds(folder, point_clouds_with_images.point_clouds)
+        try:
+            files_on_disk = [image.filename for image in point_clouds_with_images.images] + \
+                            [pc.filename for pc in point_clouds_with_images.point_clouds]
+
+            upload_urls_response = self._get_upload_urls(IAM.FilesToUpload(files_on_disk), folder)
+
+            files_in_response = list(upload_urls_response.files_to_url.keys())
+            assert set(files_on_disk) == set(files_in_response)
+
+            self._set_images_dimensions(folder, point_clouds_with_images.images)
+            self._create_inputs_point_cloud_with_images(point_clouds_with_images,
+                                                        upload_urls_response.internal_id,
+                                                        metadata,
+                                                        project=project,
+                                                        batch=batch,
+                                                        input_list_id=input_list_id,
+                                                        dryrun=True)
+            if not dryrun:
+                self._upload_files(folder, upload_urls_response.files_to_url, upload_urls_response.internal_id,
+                                   local_paths=conversion.paths if conversion is not None else None)
+
+                create_input_response = self._create_inputs_point_cloud_with_images(
+                    point_clouds_with_images,
+                    upload_urls_response.internal_id,
+                    metadata,
+                    project=project,
+                    batch=batch,
+                    input_list_id=input_list_id,
                 )
-            return create_input_response
-        return None
+
+                if create_input_response:
+                    log.info(
+                        f"Creating inputs for files with job_id={create_input_response.internal_id}"
+                    )
+                return create_input_response
+            return None
+        finally:
+            if conversion is not None:
+                conversion.close()
+
+    def create_inputs_bulk(
+            self, scenes: Iterable[SceneSpec],
+            dryrun: bool = False,
+            api_workers: int = 4,
+            upload_workers: int = DEFAULT_BULK_UPLOAD_WORKERS,
+            queue_size: int = 8) -> Iterator[SceneOutcome]:
+        """
+        Creates one input per scene, like `create_inputs_images`, `create_inputs_point_clouds` and
+        `create_inputs_point_cloud_with_images` would. Getting upload urls, validating, uploading files
+        and creating the input are run as pipelined stages, so that many scenes are processed at once.
+        A failing scene does not stop the others.
+
+        :param scenes: SceneSpecs to create inputs for, can be a lazy iterable
+        :param dryrun: If True the files/metadata will be validated but no files are uploaded and
+        no input jobs are created.
+        :param api_workers: Number of scenes per stage that talk to the Input API at the same time
+        :param upload_workers: Number of scenes uploading files at the same time, each uploading
+        at most `max_upload_workers` files in parallel
+        :param queue_size: Max number of scenes waiting between two stages
+        :returns Iterator: A SceneOutcome for each scene, in the order they are done. Failed scenes
+        have `error` and `failed_stage` set.
+        """
+        bulk_ingestion = BulkIngestion(self,
+                                       dryrun=dryrun,
+                                       api_workers=api_workers,
+                                       upload_workers=upload_workers,
+                                       queue_size=queue_size)
+        return bulk_ingestion.run(scenes)
 
     def create_slam_input_job(self, slam_files: IAM.SlamFiles,
                               metadata: IAM.SlamMetaData,
@@ -543,6 +803,43 @@ class InputApiClient:
         resp = self.session.post(url, json=update_json, headers=self.headers)
         self._raise_on_error(resp).json()
 
+    def _fetch_inputs(self,
+                      project: str,
+                      batch: Optional[str],
+                      external_ids: Optional[List[str]],
+                      include_invalidated: bool) -> List[IAM.Input]:
+        url = f"{self.host}/v1/inputs"
+        external_ids_query_string = ",".join(external_ids) if external_ids is not None else None
+        params = {
+            "project": project,
+            "batch": batch,
+            "externalIds": external_ids_query_string,
+            "invalidated": include_invalidated
+        }
+
+        resp = self.session.get(url, params=filter_none(params), headers=self.headers)
+        json_resp = self._unwrap_enveloped_json(self._raise_on_error(resp).json())
+        return [IAM.Input.from_json(js) for js in json_resp]
+
+    @staticmethod
+    def _chunk_external_ids(external_ids: List[str],
+                            max_query_length: int = MAX_EXTERNAL_IDS_QUERY_LENGTH) -> List[List[str]]:
+        """Splits the external ids so that each url encoded, comma separated chunk fits in a url"""
+        separator_length = len(quote(","))
+        chunks = []
+        chunk: List[str] = []
+        chunk_length = 0
+        for external_id in external_ids:
+            id_length = len(quote(external_id, safe="")) + separator_length
+            if chunk and chunk_length + id_length > max_query_length:
+                chunks.append(chunk)
+                chunk, chunk_length = [], 0
+            chunk.append(external_id)
+            chunk_length += id_length
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
     def get_inputs(self,
                    project: str,
                    batch: Optional[str] = None,
@@ -554,22 +851,141 @@ class InputApiClient:
 
         :param project: Project to filter
         :param batch: Batch to filter, if omitted inputs from all batches are included.
+        :param external_ids: External ids to filter, any number of ids can be given
         :param invalidated: If true, includes invalidated inputs in the response
         :return List: List of Inputs
         """
+        if not external_ids:
+            return self._fetch_inputs(project, batch, None, include_invalidated)
+
+        lookup = self.get_inputs_by_external_ids(project, external_ids, batch=batch,
+                                                 include_invalidated=include_invalidated)
+        return lookup.inputs
+
+    def get_inputs_by_external_ids(self,
+                                   project: str,
+                                   external_ids: List[str],
+                                   batch: Optional[str] = None,
+                                   include_invalidated: bool = False,
+                                   max_workers: int = DEFAULT_LOOKUP_WORKERS) -> IAM.InputsByExternalIds:
+        """
+        Gets the inputs with the given external ids. Large sets of ids are split into chunks that are
+        fetched in parallel, and the result is de-duplicated.
 
+        :param project: Project to filter
+        :param external_ids: External ids to get inputs for
+        :param batch: Batch to filter, if omitted inputs from all batches are included.
+        :param include_invalidated: If true, includes invalidated inputs in the response
+        :param max_workers: Max number of chunks fetched in parallel
+        :return InputsByExternalIds: Class containing the inputs, and the external ids without any input
+        """
+        unique_external_ids = list(dict.fromkeys(external_ids))
+        chunks = self._chunk_external_ids(unique_external_ids)
+
+        def _fetch(chunk: List[str]) -> List[IAM.Input]:
+            return self._fetch_inputs(project, batch, chunk, include_invalidated)
+
+        if len(chunks) <= 1:
+            results = [_fetch(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(_fetch, chunks))
+
+        inputs_by_internal_id: Dict[str, IAM.Input] = dict()
+        for inputs in results:
+            for input in inputs:
+                inputs_by_internal_id.setdefault(input.internal_id, input)
+        inputs = list(inputs_by_internal_id.values())
+
+        found_external_ids = {input.external_id for input in inputs}
+        not_found_external_ids = [external_id for external_id in unique_external_ids
+                                  if external_id not in found_external_ids]
+        return IAM.InputsByExternalIds(inputs, not_found_external_ids)
+
+    def iter_inputs(self,
+                    project: str,
+                    batch: Optional[str] = None,
+                    external_ids: Optional[List[str]] = None,
+                    include_invalidated: bool = False,
+                    page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[IAM.Input]:
+        """
+        Same as `get_inputs`, but lazily fetches the inputs one page at a time and parses each page
+        while it is being downloaded. Use this for projects with many inputs.
+
+        :param project: Project to filter
+        :param batch: Batch to filter, if omitted inputs from all batches are included.
+        :param external_ids: External ids to filter, any number of ids can be given. They are split into
+        chunks that fit in a url, and the inputs of each chunk are listed in turn.
+        :param include_invalidated: If true, includes invalidated inputs
+        :param page_size: Number of inputs fetched per request
+        :return Iterator: Iterator of Inputs
+        """
+        if not external_ids:
+            yield from self._iter_input_pages(project, batch, None, include_invalidated, page_size)
+            return
+        for chunk in self._chunk_external_ids(list(dict.fromkeys(external_ids))):
+            yield from self._iter_input_pages(project, batch, chunk, include_invalidated, page_size)
+
+    def _iter_input_pages(self,
+                          project: str,
+                          batch: Optional[str],
+                          external_ids: Optional[List[str]],
+                          include_invalidated: bool,
+                          page_size: int,
+                          offset: int = 0) -> Iterator[IAM.Input]:
         url = f"{self.host}/v1/inputs"
         external_ids_query_string = ",".join(external_ids) if external_ids is not None else None
-        params = {
-            "project": project,
-            "batch": batch,
-            "externalIds": external_ids_query_string,
-            "invalidated": include_invalidated
-        }
-
-        resp = self.session.get(url, params=filter_none(params), headers=self.headers)
-        json_resp = self._unwrap_enveloped_json(self._raise_on_error(resp).json())
-        return [IAM.Input.from_json(js) for js in json_resp]
+        previous_first_id = None
+        while True:
+            params = {
+                "project": project,
+                "batch": batch,
+                "externalIds": external_ids_query_string,
+                "invalidated": include_invalidated,
+                "offset": offset,
+                "limit": page_size
+            }
+            num_inputs = 0
+            with self.session.get(url, params=filter_none(params), headers=self.headers, stream=True) as resp:
+                self._raise_on_error(resp)
+                chunks = resp.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+                for js in iter_json_array(chunks, key=IAM.ENVELOPED_JSON_TAG):
+                    input = IAM.Input.from_json(js)
+                    if num_inputs == 0:
+                        if input.internal_id == previous_first_id:
+                            # the same page again, the server does not paginate
+                            return
+                        previous_first_id = input.internal_id
+                    num_inputs += 1
+                    yield input
+
+            # a full page might be followed by more, more than a full page means everything was returned
+            if num_inputs != page_size:
+                return
+            offset += num_inputs
+
+    def track_inputs(self,
+                     project: str,
+                     internal_ids: Iterable[str],
+                     batch: Optional[str] = None,
+                     **kwargs) -> InputStatusTracker:
+        """
+        Tracks created inputs until they have finished processing. Iterate over the tracker to get an
+        `InputStatusEvent` for each input as it completes or fails, or call `wait()` to block until all
+        are done. More inputs can be added with `track`. Inputs whose conversion fails may never be listed,
+        they are reported as timed out after `timeout` seconds, two hours by default.
+
+        e.g. `for event in client.track_inputs(project, [job.internal_id for job in jobs], timeout=3600)`
+
+        :param project: project the inputs are created in
+        :param internal_ids: internal ids of the inputs, e.g. `CreateInputJobResponse.internal_id`
+        :param batch: batch the inputs are created in
+        :param kwargs: callbacks, poll intervals and timeout, see `InputStatusTracker`
+        :return InputStatusTracker: the tracker
+        """
+        tracker = InputStatusTracker(self, **kwargs)
+        tracker.track(internal_ids, project, batch)
+        return tracker
 
     def invalidate_inputs(self,
                           input_internal_ids: List[str],
@@ -625,6 +1041,11 @@ class InputApiClient:
         :return List: A list of CalibrationNoContent if an id or external id was given, or a
         list of CalibrationWithContent otherwise.
         """
+        if id and self.calibration_cache is not None:
+            cached_calibration = self.calibration_cache.get_calibration(id)
+            if cached_calibration is not None:
+                return [cached_calibration]
+
         base_url = f"{self.host}/v1/calibrations"
         if id:
             url = base_url + f"?id={id}"
@@ -639,30 +1060,83 @@ class InputApiClient:
         if base_url == url:
             return [IAM.CalibrationNoContent.from_json(js) for js in json_resp]
         elif id is not None:
-            return [IAM.CalibrationWithContent.from_json(json_resp)]
+            calibration = IAM.CalibrationWithContent.from_json(json_resp)
+            if self.calibration_cache is not None:
+                self.calibration_cache.put_calibration(calibration)
+            return [calibration]
         else:
             return [IAM.CalibrationWithContent.from_json(js) for js in json_resp]
 
+    def _get_cached_calibration(self, calibration_spec: IAM.CalibrationSpec) -> Optional[IAM.CalibrationNoContent]:
+        """
+        Returns the calibration previously created from an identical spec, revalidating that it still
+        exists if the cache entry has expired.
+        """
+        cache = self.calibration_cache
+        calibration = cache.get_created(calibration_spec)
+        if calibration is not None:
+            return calibration
+
+        calibration = cache.get_created(calibration_spec, include_expired=True)
+        if calibration is None:
+            return None
+
+        if not self._calibration_exists(calibration.id):
+            log.info(f"Cached calibration with id={calibration.id} no longer exists")
+            cache.discard_calibration(calibration.id)
+            cache.discard_created(calibration_spec)
+            return None
+
+        cache.put_created(calibration_spec, calibration)
+        return calibration
+
+    def _calibration_exists(self, id: int) -> bool:
+        """
+        Fetches the calibration, bypassing the calibration cache, and caches it again. Only a 404 means
+        that it does not exist, any other error is raised and leaves the cache as it was.
+        """
+        resp = self.session.get(f"{self.host}/v1/calibrations?id={id}", headers=self.headers)
+        if resp.status_code == 404:
+            return False
+        json_resp = self._unwrap_enveloped_json(self._raise_on_error(resp).json())
+        self.calibration_cache.put_calibration(IAM.CalibrationWithContent.from_json(json_resp))
+        return True
+
     def create_calibration_data(
         self, calibration_spec: IAM.CalibrationSpec
     ) -> IAM.CalibrationNoContent:
         """
-        Creates a new calibration, given the CalibrationSpec
+        Creates a new calibration, given the CalibrationSpec. With a `calibration_cache`, the calibration
+        created from an identical spec is returned instead of creating a duplicate.
         :param calibration_spec: A CalibrationSpec instance containing everything to
         create a calibration.
         :return CalibrationNoContent: Class containing the calibration id, external id and
         time of creation.
         """
+        if self.calibration_cache is not None:
+            cached_calibration = self._get_cached_calibration(calibration_spec)
+            if cached_calibration is not None:
+                log.info(f"Using existing calibration with id={cached_calibration.id}")
+                return cached_calibration
+
         url = f"{self.host}/v1/inputs/calibration-data"
         resp = self.session.post(url, json=calibration_spec.to_dict(), headers=self.headers)
         json_resp = self._raise_on_error(resp).json()
-        return IAM.CalibrationNoContent.from_json(json_resp)
+        calibration = IAM.CalibrationNoContent.from_json(json_resp)
+        if self.calibration_cache is not None:
+            self.calibration_cache.put_created(calibration_spec, calibration)
+        return calibration
+
+    @staticmethod
+    def _parse_export_annotations(js: dict) -> List[IAM.ExportAnnotation]:
+        return [IAM.ExportAnnotation.from_json(annotation_js) for annotation_js in js.values()]
 
     def download_annotations(
         self, internal_ids: List[str]
     ) -> Dict[str, List[IAM.ExportAnnotation]]:
         """
         Returns the export ready annotations for each input (via the internal id).
+        For many inputs, use `iter_annotations` instead.
 
         :param internal_ids: List with internal ids
         :return Dict: A dictionary, with each key corresponding internal_id, and value
@@ -674,12 +1148,51 @@ class InputApiClient:
         json_resp = self._raise_on_error(resp).json()
 
         for k, v in json_resp.items():
-            inner_list = list()
-            for kk, vv in v.items():
-                inner_list.append(IAM.ExportAnnotation.from_json(vv))
-            json_resp[k] = inner_list
+            json_resp[k] = self._parse_export_annotations(v)
         return json_resp
 
+    def _download_annotations_batch(
+        self, internal_ids: List[str]
+    ) -> List[Tuple[str, List[IAM.ExportAnnotation]]]:
+        url = f"{self.host}/v1/inputs/export"
+        with self.session.get(url, json=internal_ids, headers=self.headers, stream=True) as resp:
+            self._raise_on_error(resp)
+            chunks = resp.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            return [(internal_id, self._parse_export_annotations(js))
+                    for (internal_id, js) in iter_json_object(chunks)]
+
+    def iter_annotations(
+        self, internal_ids: Iterable[str],
+        batch_size: int = DEFAULT_EXPORT_BATCH_SIZE,
+        max_workers: int = DEFAULT_EXPORT_WORKERS
+    ) -> Iterator[Tuple[str, List[IAM.ExportAnnotation]]]:
+        """
+        Like `download_annotations`, but fetches the annotations in batches of inputs, in parallel, and
+        yields them as soon as a batch has been parsed. At most `max_workers` batches are held in memory
+        at a time, independent of the number of inputs.
+
+        :param internal_ids: Internal ids, can be a lazy iterable
+        :param batch_size: Number of inputs per request
+        :param max_workers: Max number of batches fetched in parallel
+        :return Iterator: (internal_id, list of annotations) for each input, in the order the batches complete
+        """
+        internal_ids = iter(internal_ids)
+
+        def _next_batch() -> List[str]:
+            return list(islice(internal_ids, batch_size))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            batch = _next_batch()
+            while batch or pending:
+                while batch and len(pending) < max_workers:
+                    pending.add(executor.submit(self._download_annotations_batch, batch))
+                    batch = _next_batch()
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+
     def get_view_links(self, internal_ids: List[str]) -> Dict[str, str]:
         """
         For each given internal id returns an URL where the input can be viewed in the web app.
@@ -1,9 +1,10 @@
 """API MODEL."""
+import re
 from typing import List, Mapping, Dict, Optional, Union, Any
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import dateutil.parser
 
-from .model.abstract_models import RequestCall, Response
+from .model.abstract_models import RequestCall, Response, LazyResponse, LazyField
 from .model.enums import InputBatchStatus, InvalidatedReasonInput, InputStatus
 # To preserve old import statements
 from .model.enums import CameraType
@@ -13,8 +14,27 @@ from .model.calibration import CameraCalibrationExplicit, LidarCalibrationExplic
 ENVELOPED_JSON_TAG = "data"
 
 
+# the timestamps of the api, e.g. 2021-03-01T12:30:00.123456Z or 2021-03-01T12:30:00+01:00
+_ISO_TIMESTAMP = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,9}))?(Z|[+-]\d{2}:?\d{2})?$"
+)
+
+
 def ts_to_dt(date_string: str) -> datetime:
-    return dateutil.parser.parse(date_string)
+    """Parses an ISO 8601 timestamp directly, and other formats with dateutil"""
+    match = _ISO_TIMESTAMP.match(date_string)
+    if match is None:
+        return dateutil.parser.parse(date_string)
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    tz = None
+    if offset == "Z":
+        tz = timezone.utc
+    elif offset is not None:
+        sign = -1 if offset[0] == "-" else 1
+        offset_minutes = int(offset[1:3]) * 60 + int(offset[-2:])
+        tz = timezone(timedelta(minutes=sign * offset_minutes))
+    microsecond = int(fraction[:6].ljust(6, "0")) if fraction else 0
+    return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), microsecond, tzinfo=tz)
 
 
 #
@@ -292,18 +312,16 @@ class Trajectory(RequestCall):
 #
 
 
-class CalibrationNoContent(Response):
+class CalibrationNoContent(LazyResponse):
+    id = LazyField("id", int)
+    external_id = LazyField("externalId")
+    created = LazyField("created", ts_to_dt)
+
     def __init__(self, id: int, external_id: str, created: datetime):
         self.id = id
         self.external_id = external_id
         self.created = created
 
-    @staticmethod
-    def from_json(js: dict):
-        return CalibrationNoContent(
-            int(js["id"]), js["externalId"], ts_to_dt(js["created"])
-        )
-
     def __repr__(self):
         return f"<CalibrationNoContent(" + \
             f"id={self.id}, " + \
@@ -311,7 +329,12 @@ class CalibrationNoContent(Response):
             f"created={self.created})>"
 
 
-class CalibrationWithContent(Response):
+class CalibrationWithContent(LazyResponse):
+    id = LazyField("id", int)
+    external_id = LazyField("externalId")
+    created = LazyField("created", ts_to_dt)
+    calibration = LazyField("calibration")
+
     def __init__(self, id: int, external_id: str, created: datetime,
                  calibration: Mapping[str, dict]):
         self.id = id
@@ -319,11 +342,6 @@ class CalibrationWithContent(Response):
         self.created = created
         self.calibration = calibration
 
-    @staticmethod
-    def from_json(js: dict):
-        return CalibrationWithContent(int(js["id"]), js["externalId"],
-                                      ts_to_dt(js["created"]), js["calibration"])
-
     def __repr__(self):
         return f"<CalibrationWithContent(" + \
             f"id={self.id}, " + \
@@ -332,18 +350,18 @@ class CalibrationWithContent(Response):
             f"calibration={{...}})>"
 
 
-class InputList(Response):
+class InputList(LazyResponse):
+    id = LazyField("id", int)
+    project_id = LazyField("projectId", int)
+    name = LazyField("name")
+    created = LazyField("created", ts_to_dt)
+
     def __init__(self, id: int, project_id: int, name: str, created: datetime):
         self.id = id
         self.project_id = project_id
         self.name = name
         self.created = created
 
-    @staticmethod
-    def from_json(js: dict):
-        return InputList(int(js["id"]), int(js["projectId"]), js["name"],
-                         ts_to_dt(js["created"]))
-
     def __repr__(self):
         return f"<InputList(" + \
             f"id={self.id}, " + \
@@ -352,7 +370,13 @@ class InputList(Response):
             f"created={self.created})>"
 
 
-class InputBatch(Response):
+class InputBatch(LazyResponse):
+    external_id = LazyField("externalId")
+    title = LazyField("title")
+    status = LazyField("status")
+    created = LazyField("created", ts_to_dt)
+    updated = LazyField("updated", ts_to_dt)
+
     def __init__(self, external_id: str, title: str, status: InputBatchStatus,
                  created: datetime, updated: datetime):
         self.external_id = external_id
@@ -361,11 +385,6 @@ class InputBatch(Response):
         self.created = created
         self.updated = updated
 
-    @staticmethod
-    def from_json(js: dict):
-        return InputBatch(js["externalId"], js["title"], js["status"],
-                          ts_to_dt(js["created"]), ts_to_dt(js["updated"]))
-
     def __repr__(self):
         return f"<InputBatch(" + \
             f"external_id={self.external_id}, " + \
@@ -375,7 +394,13 @@ class InputBatch(Response):
             f"updated={self.updated})>"
 
 
-class Project(Response):
+class Project(LazyResponse):
+    created = LazyField("created", ts_to_dt)
+    title = LazyField("title")
+    description = LazyField("description")
+    status = LazyField("status")
+    external_id = LazyField("externalId")
+
     def __init__(self, created: datetime, title: str, description: str,
                  status: str, external_id: str):
         self.created = created
@@ -384,11 +409,6 @@ class Project(Response):
         self.status = status
         self.external_id = external_id
 
-    @staticmethod
-    def from_json(js: dict):
-        return Project(ts_to_dt(js["created"]), js["title"],
-                       js["description"], js["status"], js["externalId"])
-
     def __repr__(self):
         return f"<Project(" + \
             f"created={self.created}, " + \
@@ -398,7 +418,16 @@ class Project(Response):
             f"external_id={self.external_id})>"
 
 
-class Request(Response):
+class Request(LazyResponse):
+    id = LazyField("id", int)
+    created = LazyField("created", ts_to_dt)
+    project_id = LazyField("projectId", int)
+    title = LazyField("title")
+    description = LazyField("description")
+    input_list_id = LazyField("inputListId", int)
+    input_batch_id = LazyField("inputBatchId", int)
+    external_id = LazyField("externalId")
+
     def __init__(self, id: int, created: datetime, project_id: int, title: str, description: str,
                  input_list_id: int, input_batch_id: int, external_id: str):
         self.id = id
@@ -410,12 +439,6 @@ class Request(Response):
         self.input_batch_id = input_batch_id
         self.external_id = external_id
 
-    @staticmethod
-    def from_json(js: dict):
-        return Request(int(js["id"]), ts_to_dt(js["created"]), int(js["projectId"]),
-                       js["title"], js["description"], int(js["inputListId"]),
-                       int(js["inputBatchId"]), js["externalId"])
-
     def __repr__(self):
         return f"<Request(" + \
             f"id={self.id}, " + \
@@ -428,22 +451,29 @@ class Request(Response):
             f"external_id={self.external_id})>"
 
 
-class ExportAnnotation(Response):
+class ExportAnnotation(LazyResponse):
+    annotation_id = LazyField("annotationId", int)
+    export_content = LazyField("exportContent")
+
     def __init__(self, annotation_id: int, export_content: dict):
         self.annotation_id = annotation_id
         self.export_content = export_content
 
-    @staticmethod
-    def from_json(js: dict):
-        return ExportAnnotation(int(js["annotationId"]), js["exportContent"])
-
     def __repr__(self):
         return f"<ExportAnnotation(" + \
             f"annotation_id={self.annotation_id}, " + \
             f"export_content={{...}})>"
 
 
-class InputJob(Response):
+class InputJob(LazyResponse):
+    id = LazyField("id", int)
+    internal_id = LazyField("jobId")
+    external_id = LazyField("externalId")
+    filename = LazyField("filename")
+    status = LazyField("status", str)
+    added = LazyField("added", ts_to_dt)
+    error_message = LazyField("errorMessage", default=None)
+
     def __init__(self, id: int, internal_id: str, external_id: str, filename: str,
                  status: str, added: datetime, error_message: Optional[str]):
         self.id = id
@@ -454,11 +484,6 @@ class InputJob(Response):
         self.added = added
         self.error_message = error_message
 
-    @staticmethod
-    def from_json(js: dict):
-        return InputJob(int(js["id"]), js["jobId"], js["externalId"], js["filename"],
-                        str(js["status"]), ts_to_dt(js["added"]), js.get("errorMessage"))
-
     def __repr__(self):
         return f"<InputJob(" + \
             f"id={self.id}, " + \
@@ -470,35 +495,29 @@ class InputJob(Response):
             f"error_message={self.error_message})>"
 
 
-class CreateInputJobResponse(Response):
+class CreateInputJobResponse(LazyResponse):
+    internal_id = LazyField("internalId")
+
     def __init__(self, internal_id: int):
         self.internal_id = internal_id
 
-    @staticmethod
-    def from_json(js: dict):
-        return CreateInputJobResponse(js["internalId"])
-
     def __repr__(self):
         return f"<CreateInputJobResponse(" + \
                f"internal_id={self.internal_id})>"
 
 
-class Data(Response):
+class Data(LazyResponse):
+    id = LazyField("id", int)
+    external_id = LazyField("externalId", str, default=None)
+    source = LazyField("source", default=None)
+    created = LazyField("created", ts_to_dt)
+
     def __init__(self, id, external_id: str, source: Optional[str], created: datetime):
         self.id = id
         self.external_id = external_id
         self.source = source
         self.created = created
 
-    @staticmethod
-    def from_json(js: dict):
-        return Data(
-            int(js["id"]),
-            str(js.get("externalId")),
-            js.get("source"),
-            ts_to_dt(js["created"])
-        )
-
     def __repr__(self):
         return f"<Data(" + \
             f"id={self.id}, " + \
@@ -507,7 +526,14 @@ class Data(Response):
             f"created={self.created})>"
 
 
-class Input(Response):
+class Input(LazyResponse):
+    internal_id = LazyField("internalId")
+    external_id = LazyField("externalId")
+    batch = LazyField("batchId")
+    input_type = LazyField("inputType")
+    status = LazyField("status", default=None)
+    error_message = LazyField("errorMessage", default=None)
+
     def __init__(
         self,
         internal_id: str,
@@ -524,17 +550,6 @@ class Input(Response):
         self.status = status
         self.error_message = error_message
 
-    @staticmethod
-    def from_json(js: dict):
-        return Input(
-            js["internalId"],
-            js["externalId"],
-            js["batchId"],
-            js["inputType"],
-            js.get("status"),
-            js.get("errorMessage")
-        )
-
     def __repr__(self):
         return f"<Input(" + \
             f"internal_id={self.internal_id}, " + \
@@ -544,19 +559,28 @@ class Input(Response):
             f"status={self.status})>"
 
 
-class InvalidatedInputsResponse(Response):
+class InputsByExternalIds:
+    def __init__(self, inputs: List[Input], not_found_external_ids: List[str]):
+        self.inputs = inputs
+        self.not_found_external_ids = not_found_external_ids
+
+    def __repr__(self):
+        return f"<InputsByExternalIds(" + \
+               f"inputs=[...{len(self.inputs)} inputs], " + \
+               f"not_found_external_ids={self.not_found_external_ids})>"
+
+
+class InvalidatedInputsResponse(LazyResponse):
+    invalidated_input_ids = LazyField("invalidatedInputIds")
+    not_found_input_ids = LazyField("notFoundInputIds")
+    already_invalidated_input_ids = LazyField("alreadyInvalidatedInputIds")
+
     def __init__(self, invalidated_input_ids: List[int], not_found_input_ids: List[int],
                  already_invalidated_input_ids: List[int]):
         self.invalidated_input_ids = invalidated_input_ids
         self.not_found_input_ids = not_found_input_ids
         self.already_invalidated_input_ids = already_invalidated_input_ids
 
-    @staticmethod
-    def from_json(js: dict):
-        return InvalidatedInputsResponse(js["invalidatedInputIds"],
-                                         js["notFoundInputIds"],
-                                         js["alreadyInvalidatedInputIds"])
-
     def __repr__(self):
         return f"<InvalidatedInputsResponse(" + \
                f"invalidated_input_ids={self.invalidated_input_ids}, " + \
@@ -564,19 +588,17 @@ class InvalidatedInputsResponse(Response):
                f"already_invalidated_input_ids={self.already_invalidated_input_ids})>"
 
 
-class RemovedInputsResponse(Response):
+class RemovedInputsResponse(LazyResponse):
+    removed_input_ids = LazyField("removedInputIds")
+    not_found_input_ids = LazyField("notFoundInputIds")
+    already_removed_input_ids = LazyField("alreadyRemovedInputIds")
+
     def __init__(self, removed_input_ids: List[int], not_found_input_ids: List[int],
                  already_removed_input_ids: List[int]):
         self.removed_input_ids = removed_input_ids
         self.not_found_input_ids = not_found_input_ids
         self.already_removed_input_ids = already_removed_input_ids
 
-    @staticmethod
-    def from_json(js: dict):
-        return InvalidatedInputsResponse(js["removedInputIds"],
-                                         js["notFoundInputIds"],
-                                         js["alreadyRemovedInputIds"])
-
     def __repr__(self):
         return f"<RemovedInputsResponse(" + \
                f"removed_input_ids={self.removed_input_ids}, " + \
@@ -584,16 +606,37 @@ class RemovedInputsResponse(Response):
                f"already_removed_input_ids={self.already_removed_input_ids})>"
 
 
-class UploadUrlsResponse(Response):
+class UploadUrlsResponse(LazyResponse):
+    files_to_url = LazyField("files")
+    internal_id = LazyField("jobId")
+
     def __init__(self, files_to_url: Dict[str, str], internal_id: int):
         self.files_to_url = files_to_url
         self.internal_id = internal_id
 
-    @staticmethod
-    def from_json(js: dict):
-        return UploadUrlsResponse(js["files"], js["jobId"])
-
     def __repr__(self):
         return f"<UploadUrlsResponse(" + \
                f"files_to_url={self.files_to_url}, " + \
                f"internal_id={self.internal_id})>"
+
+
+#
+# Exceptions
+#
+
+
+class FileUploadError(RuntimeError):
+    """Raised when one or more files could not be uploaded to cloud storage"""
+
+    def __init__(self, failed_uploads: Dict[str, Exception]):
+        self.failed_uploads = failed_uploads
+        failures = ", ".join(f"{filename}: {e}" for (filename, e) in failed_uploads.items())
+        super().__init__(f"Failed to upload {len(failed_uploads)} file(s): {failures}")
+
+
+class PointCloudError(RuntimeError):
+    """Raised when a point cloud file cannot be read, or would fail to be converted by the Input API"""
+
+    def __init__(self, path, message: str):
+        self.path = path
+        super().__init__(f"Invalid point cloud {path}: {message}")
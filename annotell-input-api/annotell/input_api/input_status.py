@@ -0,0 +1,323 @@
+"""Waiting for created inputs to finish processing, see `InputApiClient.track_inputs`"""
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from . import input_api_model as IAM
+from .model.enums import InputStatus
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MIN_POLL_INTERVAL = 2.0  # seconds
+DEFAULT_MAX_POLL_INTERVAL = 60.0
+# the poll interval grows by this factor after each poll without any finished input
+DEFAULT_POLL_BACKOFF = 1.5
+DEFAULT_TIMEOUT = 2 * 60 * 60
+DEFAULT_PAGE_SIZE = 1000
+# each poll lists at most this many pages per project and batch, and the next poll continues where it stopped
+DEFAULT_MAX_PAGES = 10
+
+_Group = Tuple[str, Optional[str]]
+
+
+class InputStatusEvent:
+    """An input that has finished processing, successfully or not, or that was not seen in time"""
+
+    def __init__(self, internal_id: str, project: str, input: Optional[IAM.Input], timed_out: bool = False):
+        """
+        :param internal_id: internal id of the input
+        :param project: project of the input
+        :param input: the input as last listed, None if it was never listed
+        :param timed_out: True if the input had not finished processing before the timeout
+        """
+        self.internal_id = internal_id
+        self.project = project
+        self.input = input
+        self.timed_out = timed_out
+
+    @property
+    def status(self) -> Optional[str]:
+        return self.input.status if self.input is not None else None
+
+    @property
+    def completed(self) -> bool:
+        return not self.timed_out and self.status == InputStatus.CREATED
+
+    @property
+    def failed(self) -> bool:
+        """True if the input finished without being created, False if it completed or timed out"""
+        return not self.timed_out and not self.completed
+
+    def __repr__(self):
+        return f"<InputStatusEvent(" + \
+               f"internal_id={self.internal_id}, " + \
+               f"project={self.project}, " + \
+               f"status={self.status}, " + \
+               f"timed_out={self.timed_out})>"
+
+
+def _is_finished(input: IAM.Input) -> bool:
+    status = input.status
+    return status == InputStatus.CREATED or status == InputStatus.FAILED or \
+        (status is not None and str(status).startswith("invalidated"))
+
+
+class _InputStatusTracking:
+    """Shared state of the sync and async trackers, without any io"""
+
+    def __init__(self,
+                 on_completed: Optional[Callable[[InputStatusEvent], None]] = None,
+                 on_failed: Optional[Callable[[InputStatusEvent], None]] = None,
+                 on_timed_out: Optional[Callable[[InputStatusEvent], None]] = None,
+                 min_interval: float = DEFAULT_MIN_POLL_INTERVAL,
+                 max_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+                 backoff: float = DEFAULT_POLL_BACKOFF,
+                 timeout: Optional[float] = DEFAULT_TIMEOUT,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 max_pages: int = DEFAULT_MAX_PAGES):
+        self.on_completed = on_completed
+        self.on_failed = on_failed
+        self.on_timed_out = on_timed_out
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.interval = min_interval
+        self.results: Dict[str, InputStatusEvent] = dict()
+        self._pending: Dict[_Group, Set[str]] = dict()
+        self._last_seen: Dict[str, IAM.Input] = dict()
+        self._tracked_at: Dict[str, float] = dict()
+        # where the listing of each group continues in the next poll
+        self._offsets: Dict[_Group, int] = dict()
+
+    def track(self, internal_ids: Iterable[str], project: str, batch: Optional[str] = None) -> None:
+        """
+        Adds inputs to wait for
+
+        :param internal_ids: internal ids of the inputs, e.g. `CreateInputJobResponse.internal_id`
+        :param project: project the inputs are created in
+        :param batch: batch the inputs are created in, narrows down the listing of the project
+        """
+        now = time.monotonic()
+        pending = self._pending.setdefault((project, batch), set())
+        for internal_id in internal_ids:
+            if internal_id not in self.results:
+                pending.add(internal_id)
+                self._tracked_at.setdefault(internal_id, now)
+        self.interval = self.min_interval
+
+    @property
+    def num_pending(self) -> int:
+        return sum(len(pending) for pending in self._pending.values())
+
+    @property
+    def done(self) -> bool:
+        return self.num_pending == 0
+
+    def _groups(self) -> List[_Group]:
+        return [group for (group, pending) in self._pending.items() if pending]
+
+    def _list_args(self, group: _Group) -> tuple:
+        """Arguments of `_iter_input_pages` of the client, listing from where the previous poll stopped"""
+        (project, batch) = group
+        return (project, batch, None, True, self.page_size, self._offsets.get(group, 0))
+
+    def _see(self, group: _Group, input: IAM.Input) -> Optional[InputStatusEvent]:
+        """The event if the input is tracked and has finished"""
+        pending = self._pending[group]
+        if input.internal_id not in pending:
+            return None
+        self._last_seen[input.internal_id] = input
+        if not _is_finished(input):
+            return None
+        pending.discard(input.internal_id)
+        return self._finish(InputStatusEvent(input.internal_id, group[0], input))
+
+    def _seen_enough(self, group: _Group, seen: Set[str], num_listed: int) -> bool:
+        """True when all pending inputs of the group have been listed, or `max_pages` pages have been"""
+        return self._pending[group] <= seen or num_listed >= self.max_pages * self.page_size
+
+    def _end_listing(self, group: _Group, seen: Set[str], num_listed: int, exhausted: bool) -> None:
+        """
+        Moves the offset of the group past the inputs listed in this poll if some tracked inputs were not
+        among them, so that every input of the project is listed within a few polls. The listing starts over
+        from the first input once the end has been reached.
+        """
+        offset = self._offsets.get(group, 0)
+        if exhausted:
+            self._offsets[group] = 0
+        elif not self._pending[group] <= seen:
+            self._offsets[group] = offset + num_listed
+            log.debug(f"Listed {num_listed} inputs of project={group[0]} batch={group[1]} from offset {offset} "
+                      f"without finding all tracked inputs, continuing from offset {offset + num_listed}")
+
+    def _expire(self) -> List[InputStatusEvent]:
+        if self.timeout is None:
+            return []
+        now = time.monotonic()
+        events = []
+        for ((project, _), pending) in self._pending.items():
+            expired = [internal_id for internal_id in pending if now - self._tracked_at[internal_id] >= self.timeout]
+            for internal_id in expired:
+                pending.discard(internal_id)
+                event = InputStatusEvent(internal_id, project, self._last_seen.get(internal_id), timed_out=True)
+                events.append(self._finish(event))
+        return events
+
+    def _finish(self, event: InputStatusEvent) -> InputStatusEvent:
+        self.results[event.internal_id] = event
+        self._last_seen.pop(event.internal_id, None)
+        if event.completed:
+            callback = self.on_completed
+        elif event.timed_out:
+            callback = self.on_timed_out
+        else:
+            callback = self.on_failed
+        if callback is not None:
+            callback(event)
+        return event
+
+    def _end_poll(self, events: List[InputStatusEvent]) -> None:
+        # poll often while inputs are finishing, and back off while nothing happens
+        if events:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        log.debug(f"{len(events)} inputs finished, {self.num_pending} pending, next poll in {self.interval:.1f}s")
+
+
+class InputStatusTracker(_InputStatusTracking):
+    """
+    Waits for inputs to finish processing, e.g. the conversion of point clouds. Each poll lists the inputs
+    of each tracked project and batch page by page, until all tracked inputs have been seen or `max_pages`
+    pages have been listed, so a poll makes at most `max_pages` requests per project and batch. When not
+    all tracked inputs were seen the next poll continues after the listed inputs, and starts over from the
+    first input once all have been listed, so inputs anywhere in a large project are found. The poll
+    interval starts at `min_interval` and grows up to `max_interval` while no input finishes.
+
+    An input has completed when its status is `created`, and has failed when its status is `failed` or
+    invalidated. Inputs that are not finished after `timeout` seconds, two hours by default, have timed
+    out, which is neither completed nor failed since the input may still be created later.
+    """
+
+    def __init__(self, client,
+                 on_completed: Optional[Callable[[InputStatusEvent], None]] = None,
+                 on_failed: Optional[Callable[[InputStatusEvent], None]] = None,
+                 on_timed_out: Optional[Callable[[InputStatusEvent], None]] = None,
+                 min_interval: float = DEFAULT_MIN_POLL_INTERVAL,
+                 max_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+                 backoff: float = DEFAULT_POLL_BACKOFF,
+                 timeout: Optional[float] = DEFAULT_TIMEOUT,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 max_pages: int = DEFAULT_MAX_PAGES):
+        """
+        :param client: the InputApiClient
+        :param on_completed: called with the event of each input that completed
+        :param on_failed: called with the event of each input that failed
+        :param on_timed_out: called with the event of each input that timed out
+        :param min_interval: seconds between polls while inputs are finishing
+        :param max_interval: max seconds between polls
+        :param backoff: factor the interval grows by after a poll where no input finished
+        :param timeout: seconds after an input was tracked until it is reported as timed out, no timeout if None
+        :param page_size: number of inputs listed per request
+        :param max_pages: max number of pages listed per project and batch in each poll
+        """
+        super().__init__(on_completed, on_failed, on_timed_out, min_interval, max_interval, backoff, timeout,
+                         page_size, max_pages)
+        self.client = client
+
+    def poll(self) -> List[InputStatusEvent]:
+        """Checks the status of the pending inputs once, and returns the events of those that finished"""
+        events = []
+        for group in self._groups():
+            seen: Set[str] = set()
+            num_listed = 0
+            exhausted = True
+            for input in self.client._iter_input_pages(*self._list_args(group)):
+                seen.add(input.internal_id)
+                num_listed += 1
+                event = self._see(group, input)
+                if event is not None:
+                    events.append(event)
+                if self._seen_enough(group, seen, num_listed):
+                    exhausted = False
+                    break
+            self._end_listing(group, seen, num_listed, exhausted)
+        events += self._expire()
+        self._end_poll(events)
+        return events
+
+    def __iter__(self) -> Iterator[InputStatusEvent]:
+        """The events of the inputs as they finish, polling until no input is pending"""
+        while True:
+            yield from self.poll()
+            if self.done:
+                return
+            time.sleep(self.interval)
+
+    def wait(self) -> Dict[str, InputStatusEvent]:
+        """Blocks until no input is pending, and returns the events by internal id"""
+        for _ in self:
+            pass
+        return self.results
+
+
+class AsyncInputStatusTracker(_InputStatusTracking):
+    """`InputStatusTracker` for the `AsyncInputApiClient`, iterate over the events with `async for`"""
+
+    def __init__(self, client,
+                 on_completed: Optional[Callable[[InputStatusEvent], None]] = None,
+                 on_failed: Optional[Callable[[InputStatusEvent], None]] = None,
+                 on_timed_out: Optional[Callable[[InputStatusEvent], None]] = None,
+                 min_interval: float = DEFAULT_MIN_POLL_INTERVAL,
+                 max_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+                 backoff: float = DEFAULT_POLL_BACKOFF,
+                 timeout: Optional[float] = DEFAULT_TIMEOUT,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 max_pages: int = DEFAULT_MAX_PAGES):
+        """See `InputStatusTracker`, with an AsyncInputApiClient as `client`"""
+        super().__init__(on_completed, on_failed, on_timed_out, min_interval, max_interval, backoff, timeout,
+                         page_size, max_pages)
+        self.client = client
+
+    async def poll(self) -> List[InputStatusEvent]:
+        """See `InputStatusTracker.poll`"""
+        events = []
+        for group in self._groups():
+            seen: Set[str] = set()
+            num_listed = 0
+            exhausted = True
+            inputs = self.client._iter_input_pages(*self._list_args(group))
+            try:
+                async for input in inputs:
+                    seen.add(input.internal_id)
+                    num_listed += 1
+                    event = self._see(group, input)
+                    if event is not None:
+                        events.append(event)
+                    if self._seen_enough(group, seen, num_listed):
+                        exhausted = False
+                        break
+            finally:
+                await inputs.aclose()
+            self._end_listing(group, seen, num_listed, exhausted)
+        events += self._expire()
+        self._end_poll(events)
+        return events
+
+    async def __aiter__(self) -> AsyncIterator[InputStatusEvent]:
+        while True:
+            for event in await self.poll():
+                yield event
+            if self.done:
+                return
+            await asyncio.sleep(self.interval)
+
+    async def wait(self) -> Dict[str, InputStatusEvent]:
+        """See `InputStatusTracker.wait`"""
+        async for _ in self:
+            pass
+        return self.results
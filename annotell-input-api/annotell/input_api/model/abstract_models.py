@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Any, Callable, Dict, Optional
 
 
 class RequestCall:
@@ -13,6 +13,88 @@ class SensorCalibration(RequestCall):
 
 
 class Response:
+    __slots__ = ()
+
     @staticmethod
     def from_json(js: dict):
         raise NotImplementedError
+
+
+_REQUIRED = object()
+
+
+class LazyField:
+    """
+    Attribute of a `LazyResponse` that is read from the json of the response, and converted with `parse`,
+    the first time it is accessed. Assigning the attribute replaces the value.
+    """
+
+    def __init__(self, key: str, parse: Optional[Callable[[Any], Any]] = None, default: Any = _REQUIRED):
+        """
+        :param key: key of the field in the json
+        :param parse: conversion of the json value, not applied to None or the default
+        :param default: value if the key is missing, the key is required if not given
+        """
+        self.key = key
+        self.parse = parse
+        self.default = default
+        # set when the class is created
+        self.name = None
+        self.slot = None
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+        self.slot = "_" + name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            return getattr(instance, self.slot)
+        except AttributeError:
+            pass
+        value = instance._js.get(self.key, self.default)
+        if value is _REQUIRED:
+            raise KeyError(f"{owner.__name__ if owner else type(instance).__name__}.{self.name}: "
+                           f"missing key {self.key} in response")
+        if self.parse is not None and value is not None and value is not self.default:
+            value = self.parse(value)
+        setattr(instance, self.slot, value)
+        return value
+
+    def __set__(self, instance, value):
+        setattr(instance, self.slot, value)
+
+
+class _LazyResponseMeta(type):
+    """Adds a slot per `LazyField` of the class, for its value once parsed, and lists the required keys"""
+
+    def __new__(mcs, name, bases, namespace):
+        slots = tuple(namespace.get("__slots__", ()))
+        required_keys = tuple(key for base in bases for key in getattr(base, "_required_keys", ()))
+        for (attribute, value) in namespace.items():
+            if isinstance(value, LazyField):
+                slots += ("_" + attribute,)
+                if value.default is _REQUIRED:
+                    required_keys += (value.key,)
+        namespace["__slots__"] = slots
+        namespace["_required_keys"] = required_keys
+        return super().__new__(mcs, name, bases, namespace)
+
+
+class LazyResponse(Response, metaclass=_LazyResponseMeta):
+    """
+    Response that keeps the json it was created from, and converts its fields on first access. Creating
+    many responses, e.g. all inputs of a project, then costs little more than decoding the json. Required
+    keys are checked when the response is created, so a missing key raises a `KeyError` in `from_json`.
+    """
+    __slots__ = ("_js",)
+
+    @classmethod
+    def from_json(cls, js: dict):
+        missing_keys = [key for key in cls._required_keys if key not in js]
+        if missing_keys:
+            raise KeyError(f"{cls.__name__}: missing keys {', '.join(missing_keys)} in response")
+        response = cls.__new__(cls)
+        response._js = js
+        return response
@@ -0,0 +1,524 @@
+"""
+Reading, validating and converting point clouds in the PCD and CSV formats accepted by the Input API,
+before they are uploaded. Requires numpy: pip install annotell-input-api[point-cloud]
+
+binary_compressed files are read with python-lzf, or a pure python LZF codec if it is not installed.
+Conversions write binary_compressed files only with python-lzf, the pure python codec is too slow.
+"""
+import logging
+import struct
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("Point cloud validation requires numpy, "
+                      "install with `pip install annotell-input-api[point-cloud]`") from e
+
+try:  # part of the point-cloud extra, much faster than the pure python codec below
+    import lzf as _lzf
+except ImportError:
+    _lzf = None
+
+from . import input_api_model as IAM
+from .input_api_model import PointCloudError
+
+log = logging.getLogger(__name__)
+
+PCD_ASCII = "ascii"
+PCD_BINARY = "binary"
+PCD_BINARY_COMPRESSED = "binary_compressed"
+CSV = "csv"
+
+PCD_DATA_FORMATS = [PCD_ASCII, PCD_BINARY, PCD_BINARY_COMPRESSED]
+REQUIRED_FIELDS = ["x", "y", "z"]
+
+MAX_PCD_HEADER_LINES = 64
+# max error of storing a CSV column as float32 rather than float64, e.g. 0.1 mm for coordinates in metres
+FLOAT32_TOLERANCE = 1e-4
+
+_PCD_TYPES = {"F": "f", "I": "i", "U": "u"}
+_PCD_SIZES = {"F": (4, 8), "I": (1, 2, 4, 8), "U": (1, 2, 4, 8)}
+_INTEGER_TYPES = [np.dtype("<u1"), np.dtype("<u2"), np.dtype("<i4"), np.dtype("<i8")]
+_LZF_HEADER = struct.Struct("<II")
+_LZF_MAX_OFFSET = 1 << 13
+_LZF_MAX_MATCH = 264
+_LZF_MAX_LITERAL = 32
+
+
+class PointCloudData:
+    """The points of a point cloud file, as a structured array with one field per point field"""
+
+    def __init__(self, points: "np.ndarray", data_format: str, width: Optional[int] = None, height: int = 1,
+                 viewpoint: Optional[List[str]] = None):
+        """
+        :param points: structured array of the points
+        :param data_format: format the points were read from, `csv` or the DATA of a PCD file
+        :param width: width of an organized point cloud, the number of points if None
+        :param height: height of an organized point cloud, 1 if unorganized
+        :param viewpoint: the VIEWPOINT of a PCD file
+        """
+        self.points = points
+        self.data_format = data_format
+        self.width = width if width is not None else len(points)
+        self.height = height
+        self.viewpoint = viewpoint
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.points.dtype.names)
+
+    @property
+    def num_points(self) -> int:
+        return len(self.points)
+
+    def __repr__(self):
+        return f"<PointCloudData(" + \
+               f"num_points={self.num_points}, " + \
+               f"fields={self.fields}, " + \
+               f"data_format={self.data_format})>"
+
+
+#
+# LZF, as used by PCL for binary_compressed PCD files
+#
+
+
+def lzf_decompress(data: bytes, size: int) -> bytes:
+    """Decompresses LZF `data` to exactly `size` bytes"""
+    if _lzf is not None:
+        out = _lzf.decompress(bytes(data), size) if size else b""
+        if out is None or len(out) != size:
+            raise ValueError(f"LZF data does not decompress to {size} bytes")
+        return out
+
+    out = bytearray()
+    i = 0
+    n = len(data)
+    while i < n:
+        ctrl = data[i]
+        i += 1
+        if ctrl < 32:  # a run of ctrl + 1 literal bytes
+            length = ctrl + 1
+            if i + length > n:
+                raise ValueError("LZF literal run past the end of the data")
+            out += data[i:i + length]
+            i += length
+        else:  # a back reference, to a match of length + 2 bytes
+            length = ctrl >> 5
+            if length == 7:
+                if i >= n:
+                    raise ValueError("LZF back reference past the end of the data")
+                length += data[i]
+                i += 1
+            length += 2
+            if i >= n:
+                raise ValueError("LZF back reference past the end of the data")
+            ref = len(out) - ((ctrl & 0x1F) << 8) - data[i] - 1
+            i += 1
+            if ref < 0:
+                raise ValueError("LZF back reference before the start of the data")
+            if ref + length <= len(out):
+                out += out[ref:ref + length]
+            else:  # the match overlaps the bytes it produces
+                for k in range(length):
+                    out.append(out[ref + k])
+        if len(out) > size:
+            break
+    if len(out) != size:
+        raise ValueError(f"LZF data decompresses to {len(out)} bytes, expected {size}")
+    return bytes(out)
+
+
+def _append_literals(out: bytearray, literals: bytes) -> None:
+    for start in range(0, len(literals), _LZF_MAX_LITERAL):
+        run = literals[start:start + _LZF_MAX_LITERAL]
+        out.append(len(run) - 1)
+        out += run
+
+
+def lzf_compress(data: bytes) -> bytes:
+    """Compresses `data` with LZF, which `lzf_decompress` and PCL read"""
+    if _lzf is not None and data:
+        # the output of incompressible data is at most 1/32 larger than the input
+        out = _lzf.compress(bytes(data), len(data) + len(data) // _LZF_MAX_LITERAL + 1)
+        if out is not None:
+            return out
+
+    out = bytearray()
+    table: Dict[bytes, int] = dict()
+    n = len(data)
+    literal_start = 0
+    i = 0
+    while i < n - 2:
+        key = data[i:i + 3]
+        ref = table.get(key)
+        table[key] = i
+        if ref is None or i - ref > _LZF_MAX_OFFSET:
+            i += 1
+            continue
+        length = 3
+        max_length = min(_LZF_MAX_MATCH, n - i)
+        while length < max_length and data[ref + length] == data[i + length]:
+            length += 1
+        _append_literals(out, data[literal_start:i])
+        offset = i - ref - 1
+        encoded_length = length - 2
+        if encoded_length < 7:
+            out.append((encoded_length << 5) | (offset >> 8))
+        else:
+            out.append((7 << 5) | (offset >> 8))
+            out.append(encoded_length - 7)
+        out.append(offset & 0xFF)
+        i += length
+        literal_start = i
+    _append_literals(out, data[literal_start:])
+    return bytes(out)
+
+
+#
+# Reading
+#
+
+
+def _read_pcd_header(file: BinaryIO, path: Path) -> Dict[str, List[str]]:
+    header = dict()
+    for _ in range(MAX_PCD_HEADER_LINES):
+        line = file.readline()
+        if not line:
+            break
+        tokens = line.decode("ascii", errors="replace").split()
+        if not tokens or tokens[0].startswith("#"):
+            continue
+        header[tokens[0].upper()] = tokens[1:]
+        if tokens[0].upper() == "DATA":
+            return header
+    raise PointCloudError(path, "no DATA line in the header, not a PCD file")
+
+
+def _header_ints(header: Dict[str, List[str]], key: str, path: Path) -> List[int]:
+    try:
+        return [int(value) for value in header[key]]
+    except ValueError:
+        raise PointCloudError(path, f"{key} must be integers, not {' '.join(header[key])}")
+
+
+def _pcd_dtype(header: Dict[str, List[str]], path: Path) -> "np.dtype":
+    fields = header.get("FIELDS")
+    if not fields:
+        raise PointCloudError(path, "no FIELDS in the header")
+    for key in ["SIZE", "TYPE"]:
+        if key not in header:
+            raise PointCloudError(path, f"no {key} in the header")
+    sizes = _header_ints(header, "SIZE", path)
+    types = header["TYPE"]
+    counts = _header_ints(header, "COUNT", path) if "COUNT" in header else [1] * len(fields)
+    if not len(sizes) == len(types) == len(counts) == len(fields):
+        raise PointCloudError(path, f"{len(fields)} FIELDS but {len(sizes)} SIZE, {len(types)} TYPE "
+                                    f"and {len(counts)} COUNT")
+
+    dtype = []
+    for (index, (name, size, type, count)) in enumerate(zip(fields, sizes, types, counts)):
+        type = type.upper()
+        if size not in _PCD_SIZES.get(type, ()):
+            raise PointCloudError(path, f"field {name} has unsupported TYPE {type} and SIZE {size}")
+        if count < 1:
+            raise PointCloudError(path, f"field {name} has COUNT {count}")
+        if name == "_":  # padding, which PCL may repeat
+            name = f"_{index}"
+        field_dtype = np.dtype(f"<{_PCD_TYPES[type]}{size}")
+        dtype.append((name, field_dtype, (count,)) if count > 1 else (name, field_dtype))
+    try:
+        return np.dtype(dtype)
+    except ValueError as e:
+        raise PointCloudError(path, f"invalid FIELDS {' '.join(fields)}: {e}")
+
+
+def _read_ascii(data: bytes, dtype: "np.dtype", num_points: int, path: Path) -> "np.ndarray":
+    values_per_point = sum(int(np.prod(dtype[name].shape)) for name in dtype.names)
+    try:
+        values = np.array(data.split(), dtype=np.float64)
+    except ValueError as e:
+        raise PointCloudError(path, f"non-numeric ascii data: {e}")
+    if len(values) != num_points * values_per_point:
+        raise PointCloudError(path, f"has {len(values)} values, expected {num_points} points "
+                                    f"of {values_per_point} values")
+    values = values.reshape(num_points, values_per_point)
+    points = np.empty(num_points, dtype=dtype)
+    column = 0
+    for name in dtype.names:
+        count = int(np.prod(dtype[name].shape))
+        field_values = values[:, column:column + count]
+        points[name] = field_values.reshape(points[name].shape)
+        column += count
+    return points
+
+
+def _read_binary_compressed(data: bytes, dtype: "np.dtype", num_points: int, path: Path) -> "np.ndarray":
+    if len(data) < _LZF_HEADER.size:
+        raise PointCloudError(path, "compressed data is truncated")
+    compressed_size, size = _LZF_HEADER.unpack_from(data)
+    if size != num_points * dtype.itemsize:
+        raise PointCloudError(path, f"compressed data is {size} bytes uncompressed, "
+                                    f"expected {num_points * dtype.itemsize}")
+    compressed = data[_LZF_HEADER.size:_LZF_HEADER.size + compressed_size]
+    if len(compressed) != compressed_size:
+        raise PointCloudError(path, "compressed data is truncated")
+    try:
+        raw = lzf_decompress(compressed, size)
+    except ValueError as e:
+        raise PointCloudError(path, f"corrupt compressed data: {e}")
+
+    # the points are stored field by field rather than point by point
+    points = np.empty(num_points, dtype=dtype)
+    offset = 0
+    for name in dtype.names:
+        field_dtype = dtype[name]
+        field = np.frombuffer(raw, dtype=field_dtype.base, count=num_points * int(np.prod(field_dtype.shape)),
+                              offset=offset)
+        points[name] = field.reshape(points[name].shape)
+        offset += num_points * field_dtype.itemsize
+    return points
+
+
+def read_pcd(path: Union[str, Path]) -> PointCloudData:
+    """Reads a PCD file, in any of the ascii, binary and binary_compressed formats"""
+    path = Path(path)
+    with path.open("rb") as file:
+        header = _read_pcd_header(file, path)
+        data = file.read()
+
+    dtype = _pcd_dtype(header, path)
+    width = _header_ints(header, "WIDTH", path)[0] if header.get("WIDTH") else None
+    height = _header_ints(header, "HEIGHT", path)[0] if header.get("HEIGHT") else 1
+    if header.get("POINTS"):
+        num_points = _header_ints(header, "POINTS", path)[0]
+    elif width is not None:
+        num_points = width * height
+    else:
+        raise PointCloudError(path, "neither POINTS nor WIDTH in the header")
+    if width is not None and width * height != num_points:
+        raise PointCloudError(path, f"WIDTH {width} and HEIGHT {height} do not match POINTS {num_points}")
+
+    data_format = header["DATA"][0].lower() if header["DATA"] else None
+    if data_format == PCD_ASCII:
+        points = _read_ascii(data, dtype, num_points, path)
+    elif data_format == PCD_BINARY:
+        if len(data) < num_points * dtype.itemsize:
+            raise PointCloudError(path, f"binary data is {len(data)} bytes, "
+                                        f"expected {num_points * dtype.itemsize}")
+        points = np.frombuffer(data, dtype=dtype, count=num_points)
+    elif data_format == PCD_BINARY_COMPRESSED:
+        points = _read_binary_compressed(data, dtype, num_points, path)
+    else:
+        raise PointCloudError(path, f"unsupported DATA {data_format}, expected one of {', '.join(PCD_DATA_FORMATS)}")
+
+    return PointCloudData(points, data_format, width=width, height=height, viewpoint=header.get("VIEWPOINT"))
+
+
+def _compact_dtype(name: str, values: "np.ndarray") -> "np.dtype":
+    """The smallest type that holds the values of a CSV column, coordinates are always floats"""
+    finite = values[np.isfinite(values)]
+    if name not in REQUIRED_FIELDS and len(finite) == len(values) and np.array_equal(finite, np.rint(finite)):
+        low, high = (finite.min(), finite.max()) if len(finite) else (0, 0)
+        for dtype in _INTEGER_TYPES:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return dtype
+    if len(finite) == 0 or np.abs(finite.astype(np.float32) - finite).max() <= FLOAT32_TOLERANCE:
+        return np.dtype("<f4")
+    return np.dtype("<f8")
+
+
+def read_csv(path: Union[str, Path]) -> PointCloudData:
+    """Reads a CSV point cloud, with a header row of field names and one point per row"""
+    path = Path(path)
+    with path.open(newline="") as file:
+        names = [name.strip().strip('"') for name in file.readline().split(",")]
+        try:
+            values = np.loadtxt(file, delimiter=",", dtype=np.float64, ndmin=2)
+        except ValueError as e:
+            raise PointCloudError(path, f"invalid CSV data: {e}")
+    if values.size == 0:
+        values = values.reshape(0, len(names))
+    if values.shape[1] != len(names):
+        raise PointCloudError(path, f"the header has {len(names)} fields but the rows have {values.shape[1]}")
+    if any(not name for name in names) or len(set(names)) != len(names):
+        raise PointCloudError(path, f"invalid header {','.join(names)}, the fields must have unique names")
+
+    dtype = np.dtype([(name, _compact_dtype(name, values[:, index])) for (index, name) in enumerate(names)])
+    points = np.empty(len(values), dtype=dtype)
+    for (index, name) in enumerate(names):
+        points[name] = values[:, index]
+    return PointCloudData(points, CSV)
+
+
+def validate_point_cloud(cloud: PointCloudData, path: Union[str, Path]) -> None:
+    """Raises a `PointCloudError` if the point cloud cannot be converted by the Input API"""
+    missing = [name for name in REQUIRED_FIELDS if name not in cloud.fields]
+    if missing:
+        raise PointCloudError(path, f"missing the fields {', '.join(missing)}, it has {', '.join(cloud.fields)}")
+    for name in REQUIRED_FIELDS:
+        if cloud.points.dtype[name].shape != ():
+            raise PointCloudError(path, f"field {name} must have COUNT 1")
+    if cloud.num_points == 0:
+        raise PointCloudError(path, "has no points")
+
+    finite = np.ones(cloud.num_points, dtype=bool)
+    for name in REQUIRED_FIELDS:
+        finite &= np.isfinite(cloud.points[name])
+    num_finite = int(finite.sum())
+    if num_finite == 0:
+        raise PointCloudError(path, "has no points with finite x, y and z")
+    if num_finite < cloud.num_points:
+        log.info(f"Point cloud {path} has {cloud.num_points - num_finite} points without finite x, y and z")
+
+
+def read_point_cloud(path: Union[str, Path], validate: bool = True) -> PointCloudData:
+    """
+    Reads a .pcd or .csv point cloud
+
+    :param path: path to the point cloud file
+    :param validate: if True, raises a `PointCloudError` if the point cloud is not valid
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    try:
+        if suffix == ".pcd":
+            cloud = read_pcd(path)
+        elif suffix == ".csv":
+            cloud = read_csv(path)
+        else:
+            raise PointCloudError(path, f"unsupported file type {suffix}, expected .pcd or .csv")
+    except (OSError, UnicodeDecodeError) as e:
+        raise PointCloudError(path, f"could not be read: {e}")
+    if validate:
+        validate_point_cloud(cloud, path)
+    return cloud
+
+
+#
+# Writing
+#
+
+
+def _pcd_field(name: str, dtype: "np.dtype") -> Tuple[str, int, str, int]:
+    """The FIELDS, SIZE, TYPE and COUNT of a field"""
+    base = dtype.base
+    pcd_type = {"f": "F", "i": "I", "u": "U", "b": "U"}.get(base.kind)
+    if pcd_type is None:
+        raise ValueError(f"Field {name} of type {dtype} cannot be written to PCD")
+    count = int(np.prod(dtype.shape))
+    return ("_" if name.startswith("_") else name), base.itemsize, pcd_type, count
+
+
+def write_pcd(cloud: PointCloudData, path: Union[str, Path], data_format: str = PCD_BINARY_COMPRESSED) -> None:
+    """Writes the point cloud to a binary or binary_compressed PCD file"""
+    if data_format not in [PCD_BINARY, PCD_BINARY_COMPRESSED]:
+        raise ValueError(f"Unsupported PCD data format {data_format}, "
+                         f"expected {PCD_BINARY} or {PCD_BINARY_COMPRESSED}")
+    points = cloud.points
+    little_endian = np.dtype([(name, points.dtype[name].newbyteorder("<")) for name in points.dtype.names])
+    points = np.ascontiguousarray(points, dtype=little_endian)
+    fields = [_pcd_field(name, points.dtype[name]) for name in points.dtype.names]
+    viewpoint = cloud.viewpoint or ["0", "0", "0", "1", "0", "0", "0"]
+    header = "\n".join([
+        "# .PCD v0.7 - Point Cloud Data file format",
+        "VERSION 0.7",
+        "FIELDS " + " ".join(field[0] for field in fields),
+        "SIZE " + " ".join(str(field[1]) for field in fields),
+        "TYPE " + " ".join(field[2] for field in fields),
+        "COUNT " + " ".join(str(field[3]) for field in fields),
+        f"WIDTH {cloud.width}",
+        f"HEIGHT {cloud.height}",
+        "VIEWPOINT " + " ".join(viewpoint),
+        f"POINTS {cloud.num_points}",
+        f"DATA {data_format}",
+    ]) + "\n"
+
+    with Path(path).open("wb") as file:
+        file.write(header.encode("ascii"))
+        if data_format == PCD_BINARY:
+            file.write(points.tobytes())
+        else:
+            raw = b"".join(np.ascontiguousarray(points[name]).tobytes() for name in points.dtype.names)
+            compressed = lzf_compress(raw)
+            file.write(_LZF_HEADER.pack(len(compressed), len(raw)))
+            file.write(compressed)
+
+
+class PointCloudConversion:
+    """
+    Converts point clouds to binary PCD files before they are uploaded, in a temporary directory. CSV and ascii
+    PCD files are converted, and binary PCD files if the conversion is to binary_compressed. The filenames of
+    the converted point clouds are changed to the .pcd suffix until the conversion is closed, which removes
+    the converted files. Without python-lzf, point clouds are converted to binary instead of binary_compressed.
+    """
+
+    def __init__(self, data_format: str = PCD_BINARY_COMPRESSED):
+        """
+        :param data_format: `binary` or `binary_compressed`
+        """
+        if data_format not in [PCD_BINARY, PCD_BINARY_COMPRESSED]:
+            raise ValueError(f"Unsupported point cloud format {data_format}, "
+                             f"expected {PCD_BINARY} or {PCD_BINARY_COMPRESSED}")
+        if data_format == PCD_BINARY_COMPRESSED and _lzf is None:
+            log.warning(f"Converting point clouds to {PCD_BINARY} rather than {PCD_BINARY_COMPRESSED}, "
+                        f"install python-lzf to compress them")
+            data_format = PCD_BINARY
+        self.data_format = data_format
+        # converted filename -> converted file
+        self.paths: Dict[str, Path] = dict()
+        self._renamed: List[Tuple[IAM.PointCloud, str]] = []
+        self._directory: Optional[tempfile.TemporaryDirectory] = None
+
+    def needs_conversion(self, cloud: PointCloudData) -> bool:
+        if cloud.data_format in [CSV, PCD_ASCII]:
+            return True
+        return cloud.data_format == PCD_BINARY and self.data_format == PCD_BINARY_COMPRESSED
+
+    def convert(self, cloud: PointCloudData, point_cloud: IAM.PointCloud) -> None:
+        """Writes the point cloud as PCD and renames `point_cloud` to the converted file"""
+        if self._directory is None:
+            self._directory = tempfile.TemporaryDirectory(prefix="annotell-point-clouds-")
+        filename = str(Path(point_cloud.filename).with_suffix(".pcd"))
+        # the filename may be absolute or contain "..", the file is named by its index to stay in the directory
+        path = Path(self._directory.name, f"{len(self.paths)}-{Path(filename).name}")
+        write_pcd(cloud, path, self.data_format)
+        log.debug(f"Converted point cloud {point_cloud.filename} from {cloud.data_format} to {self.data_format}")
+        self.paths[filename] = path
+        self._renamed.append((point_cloud, point_cloud.filename))
+        point_cloud.filename = filename
+
+    def check_filenames(self, point_clouds: List[IAM.PointCloud]) -> None:
+        """
+        Raises a ValueError if two of the point clouds would be uploaded with the same filename, e.g. a.csv
+        that is converted to a.pcd in the same scene as a.pcd
+        """
+        sources = {id(point_cloud): filename for (point_cloud, filename) in self._renamed}
+        # uploaded filename -> filename of the source point cloud
+        uploaded: Dict[str, str] = dict()
+        for point_cloud in point_clouds:
+            source = sources.get(id(point_cloud), point_cloud.filename)
+            other = uploaded.setdefault(point_cloud.filename, source)
+            if other != source:
+                raise ValueError(f"Point clouds {other} and {source} would both be uploaded as "
+                                 f"{point_cloud.filename}, rename one of them")
+
+    def close(self) -> None:
+        """Restores the filenames of the converted point clouds and removes the converted files"""
+        for (point_cloud, filename) in reversed(self._renamed):
+            point_cloud.filename = filename
+        self._renamed = []
+        self.paths = dict()
+        if self._directory is not None:
+            self._directory.cleanup()
+            self._directory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
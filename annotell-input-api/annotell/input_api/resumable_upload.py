@@ -0,0 +1,95 @@
+"""Resumable uploads to cloud storage, following the GCS resumable upload protocol"""
+import logging
+import os
+import re
+from typing import BinaryIO, Dict, Optional, Union
+
+import requests
+
+from .upload_body import UploadBody
+
+log = logging.getLogger(__name__)
+
+# GCS requires every chunk but the last to be a multiple of 256 KiB
+CHUNK_SIZE_GRANULARITY = 256 * 1024
+DEFAULT_CHUNK_SIZE = 32 * CHUNK_SIZE_GRANULARITY  # 8 MiB
+
+RESUME_INCOMPLETE = 308
+_RANGE_PATTERN = re.compile(r"bytes=0-(\d+)")
+
+
+class ResumableUpload:
+    """
+    Uploads a file in chunks to a resumable upload session. After a failed chunk the upload
+    continues from the last byte acknowledged by the server, instead of from the start of the file.
+    Not thread safe, use one instance per file.
+    """
+
+    def __init__(self, session, upload_url: str, file: Union[BinaryIO, UploadBody], headers: Dict[str, str],
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        :param session: session used for the requests to cloud storage
+        :param upload_url: signed url to upload the file to
+        :param file: file opened in binary mode, or an UploadBody whose chunks are sent without copying them
+        :param headers: headers for the upload, e.g. Content-Type
+        :param chunk_size: bytes sent per request, rounded down to a multiple of 256 KiB
+        """
+        if chunk_size < CHUNK_SIZE_GRANULARITY:
+            raise ValueError(f"Chunk size must be at least {CHUNK_SIZE_GRANULARITY} bytes")
+
+        self.session = session
+        self.upload_url = upload_url
+        self.file = file
+        self.headers = headers
+        self.chunk_size = chunk_size - chunk_size % CHUNK_SIZE_GRANULARITY
+        self.total_size = file.size if isinstance(file, UploadBody) else os.fstat(file.fileno()).st_size
+        self.offset = 0
+        self.session_url: Optional[str] = None
+        self.complete = False
+
+    def initiate(self) -> None:
+        """Starts a resumable upload session on the signed url"""
+        headers = {**self.headers, "x-goog-resumable": "start", "Content-Length": "0"}
+        resp = self.session.post(self.upload_url, headers=headers)
+        resp.raise_for_status()
+        self.session_url = resp.headers["Location"]
+        self.offset = 0
+        self.complete = False
+        log.debug(f"Started resumable upload of file={self.file.name}")
+
+    def sync_offset(self) -> int:
+        """Asks the server how many bytes it has persisted, and continues from there"""
+        headers = {"Content-Range": f"bytes */{self.total_size}", "Content-Length": "0"}
+        resp = self.session.put(self.session_url, headers=headers)
+        self._handle_response(resp)
+        return self.offset
+
+    def upload_next_chunk(self) -> None:
+        """Sends the chunk starting at the current offset"""
+        if self.session_url is None:
+            raise RuntimeError("Resumable upload has not been initiated")
+
+        if isinstance(self.file, UploadBody):
+            chunk = self.file.view(self.offset, self.offset + self.chunk_size)
+        else:
+            self.file.seek(self.offset)
+            chunk = self.file.read(self.chunk_size)
+        end = self.offset + len(chunk) - 1
+        if chunk:
+            content_range = f"bytes {self.offset}-{end}/{self.total_size}"
+        else:
+            content_range = f"bytes */{self.total_size}"
+
+        headers = {"Content-Range": content_range, "Content-Length": str(len(chunk))}
+        resp = self.session.put(self.session_url, data=chunk, headers=headers)
+        self._handle_response(resp)
+
+    def _handle_response(self, resp: requests.Response) -> None:
+        if resp.status_code == RESUME_INCOMPLETE:
+            match = _RANGE_PATTERN.match(resp.headers.get("Range", ""))
+            self.offset = int(match.group(1)) + 1 if match else 0
+            log.debug(f"Uploaded {self.offset}/{self.total_size} bytes of file={self.file.name}")
+        else:
+            resp.raise_for_status()
+            self.offset = self.total_size
+            self.complete = True
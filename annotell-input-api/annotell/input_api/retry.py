@@ -0,0 +1,259 @@
+"""Retry handling for uploads to cloud storage, shared by all uploads of an `InputApiClient`"""
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+
+import requests
+
+log = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = [408, 429, 500, 501, 502, 503,
+                          504, 505, 506, 507, 508, 509, 510, 511, 598, 599]
+
+
+@dataclass
+class RetryMetrics:
+    attempts: int = 0
+    retries: int = 0
+    sleep_time: float = 0.0
+    budget_exhausted: int = 0
+    circuit_opened: int = 0
+    circuit_wait_time: float = 0.0
+
+
+class RetryBudget:
+    """
+    Token bucket limiting the number of retries across all uploads. Each retry takes a token,
+    and tokens are refilled at a fixed rate. When the bucket is empty uploads fail instead of retrying.
+    """
+
+    def __init__(self, capacity: float = 100, refill_rate: float = 1.0):
+        """
+        :param capacity: Max number of retries that can be made in a burst
+        :param refill_rate: Number of retries per second that can be sustained
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._tokens = capacity
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._refilled_at) * self.refill_rate)
+            self._refilled_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Pauses all uploads after `failure_threshold` consecutive retryable failures. After `reset_timeout`
+    seconds a single upload is let through, if it succeeds all uploads continue, otherwise the pause starts over.
+    If the outcome of that upload is never recorded, another one is let through after `reset_timeout` seconds.
+    Failures that say nothing about the health of storage, like a 403, leave the state as it is.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 10, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        # when the upload testing if storage has recovered was let through, None if there is none
+        self._probe_started_at: Optional[float] = None
+        self._condition = threading.Condition()
+
+    def _try_acquire(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN and self._opened_at + self.reset_timeout <= now:
+            log.info("Letting one upload through to test if storage has recovered")
+            self.state = self.HALF_OPEN
+            self._probe_started_at = now
+            return True
+        elif self.state == self.HALF_OPEN and self._probe_started_at is None:
+            self._probe_started_at = now
+            return True
+        elif self.state == self.HALF_OPEN and self._probe_started_at + self.reset_timeout <= now:
+            log.warning("Got no outcome of the upload testing if storage has recovered, letting another one through")
+            self._probe_started_at = now
+            return True
+        return False
+
+    def try_acquire(self) -> bool:
+        """Returns True if an attempt may be made now, without blocking"""
+        with self._condition:
+            return self._try_acquire()
+
+    def acquire(self) -> float:
+        """Blocks until an attempt may be made. Returns the number of seconds waited."""
+        started_at = time.monotonic()
+        with self._condition:
+            while not self._try_acquire():
+                if self.state == self.OPEN:
+                    self._condition.wait(self._opened_at + self.reset_timeout - time.monotonic())
+                else:
+                    self._condition.wait(self._probe_started_at + self.reset_timeout - time.monotonic())
+        return time.monotonic() - started_at
+
+    def record_success(self) -> None:
+        with self._condition:
+            self._failures = 0
+            if self.state != self.CLOSED:
+                log.info("Storage has recovered, resuming uploads")
+                self.state = self.CLOSED
+                self._condition.notify_all()
+
+    def record_inconclusive(self) -> None:
+        """
+        Records an attempt that failed for a reason that says nothing about the health of storage, like a 403.
+        The state is left as it is, but if the attempt was testing if storage has recovered, the next one does.
+        """
+        with self._condition:
+            if self.state == self.HALF_OPEN and self._probe_started_at is not None:
+                self._probe_started_at = None
+                self._condition.notify_all()
+
+    def record_failure(self) -> bool:
+        """Returns True if the failure opened the circuit"""
+        with self._condition:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or \
+                    (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                log.warning(f"Got {self._failures} failed uploads in a row, "
+                            f"pausing uploads for {self.reset_timeout} seconds")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._condition.notify_all()
+                return True
+            return False
+
+
+class RetryPolicy:
+    """
+    Decides if and when an upload is retried. Using similar retry strategy as gsutil
+    https://cloud.google.com/storage/docs/gsutil/addlhelp/RetryHandlingStrategy
+    with a `Retry-After` header taking precedence when it asks for a longer wait.
+    Thread safe, one instance is shared by all uploads of a client.
+    """
+
+    def __init__(self,
+                 max_attempts: int = 23,
+                 max_wait_time: float = 60,
+                 budget: Optional[RetryBudget] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None):
+        """
+        :param max_attempts: Max number of attempts to upload a file
+        :param max_wait_time: Max wait time in seconds between two attempts, unless asked for more by `Retry-After`
+        :param budget: Retry budget shared by all uploads, defaults to a `RetryBudget()`
+        :param circuit_breaker: Circuit breaker shared by all uploads, defaults to a `CircuitBreaker()`
+        """
+        self.max_attempts = max_attempts
+        self.max_wait_time = max_wait_time
+        self.budget = budget if budget is not None else RetryBudget()
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self._metrics = RetryMetrics()
+        self._lock = threading.Lock()
+
+    @property
+    def metrics(self) -> RetryMetrics:
+        with self._lock:
+            return replace(self._metrics)
+
+    def _add_metrics(self, **increments) -> None:
+        with self._lock:
+            for (name, increment) in increments.items():
+                setattr(self._metrics, name, getattr(self._metrics, name) + increment)
+
+    def before_attempt(self) -> None:
+        """Call before each attempt, waits while uploads are paused by the circuit breaker"""
+        waited = self.circuit_breaker.acquire()
+        self.record_attempt(circuit_wait_time=waited)
+
+    def record_attempt(self, circuit_wait_time: float = 0.0) -> None:
+        """For callers that wait for the circuit breaker themselves, instead of calling `before_attempt`"""
+        self._add_metrics(attempts=1, circuit_wait_time=circuit_wait_time)
+
+    def record_success(self) -> None:
+        self.circuit_breaker.record_success()
+
+    def record_failure(self, status_code: Optional[int] = None) -> None:
+        """
+        Call after each failed attempt. Failures that are not retryable, like a 403, neither count
+        towards opening the circuit nor close it.
+        """
+        if status_code is not None and status_code not in RETRYABLE_STATUS_CODES:
+            self.circuit_breaker.record_inconclusive()
+        elif self.circuit_breaker.record_failure():
+            self._add_metrics(circuit_opened=1)
+
+    def should_retry(self, attempt: int, status_code: Optional[int] = None) -> bool:
+        """
+        :param attempt: the number of the attempt that failed, starting at 1
+        :param status_code: the status code of the failed attempt, None for connection errors
+        """
+        if status_code is not None and status_code not in RETRYABLE_STATUS_CODES:
+            return False
+        if attempt >= self.max_attempts:
+            return False
+        if not self.budget.try_acquire():
+            log.error("Retry budget exhausted, too many uploads are failing")
+            self._add_metrics(budget_exhausted=1)
+            return False
+        return True
+
+    def get_wait_time(self, attempt: int, resp: Optional[requests.Response] = None) -> float:
+        """
+        Calculates the wait time before attempting another file upload to GCS
+
+        :param attempt: How many attempts to upload that have been made
+        :param resp: The response of the failed attempt, if any
+        :return: float: The time to wait before retrying upload
+        """
+        max_wait_time = pow(2, attempt - 1)
+        wait_time = min(random.random() * max_wait_time, self.max_wait_time)
+        retry_after = _parse_retry_after(resp) if resp is not None else None
+        if retry_after is not None and retry_after > wait_time:
+            wait_time = retry_after
+        return wait_time
+
+    def sleep_before_retry(self, attempt: int, resp: Optional[requests.Response] = None) -> None:
+        wait_time = self.get_wait_time(attempt, resp)
+        log.info(f"Waiting {int(wait_time)} seconds before retrying")
+        time.sleep(wait_time)
+        self.record_retry(wait_time)
+
+    def record_retry(self, wait_time: float) -> None:
+        """For callers that sleep themselves, instead of calling `sleep_before_retry`"""
+        self._add_metrics(retries=1, sleep_time=wait_time)
+
+
+def _parse_retry_after(resp: requests.Response) -> Optional[float]:
+    """Retry-After is either a number of seconds or an HTTP date"""
+    retry_after = resp.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,83 @@
+"""Request bodies for uploads, backed by the memory mapped file"""
+import logging
+import mmap
+import os
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Union
+
+log = logging.getLogger(__name__)
+
+# smaller files are read into memory, which is cheaper than mapping them
+DEFAULT_MMAP_THRESHOLD = 1024 * 1024
+
+
+class UploadBody:
+    """
+    The content of a file, as a buffer that is sent without copying it to Python objects. Large files
+    are memory mapped, so the pages of the file are written to the socket directly and read on demand
+    by the kernel. The body can be sent again, e.g. on retries, and slices of it can be sent as chunks,
+    without reading the file again. Close it when done, or use it as a context manager.
+    """
+
+    def __init__(self, file: BinaryIO, mmap_threshold: int = DEFAULT_MMAP_THRESHOLD):
+        """
+        :param file: file opened in binary mode, which must not change while the body is used
+        :param mmap_threshold: files of at least this many bytes are memory mapped, smaller ones are read
+        """
+        self.name = getattr(file, "name", None)
+        self.size = os.fstat(file.fileno()).st_size
+        self._file = file
+        self._owns_file = False
+        self._views: List[memoryview] = []
+        self._mmap: Optional[mmap.mmap] = None
+        if self.size >= max(mmap_threshold, 1):
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+            self._buffer: Union[mmap.mmap, bytes] = self._mmap
+        else:
+            file.seek(0)
+            self._buffer = file.read()
+        self._view = memoryview(self._buffer)
+
+    @staticmethod
+    def open(path: Union[str, Path], mmap_threshold: int = DEFAULT_MMAP_THRESHOLD) -> "UploadBody":
+        """The body of the file at `path`, the file is closed with the body"""
+        file = open(path, "rb")
+        try:
+            body = UploadBody(file, mmap_threshold)
+        except BaseException:
+            file.close()
+            raise
+        body._owns_file = True
+        return body
+
+    @property
+    def is_mapped(self) -> bool:
+        return self._mmap is not None
+
+    def view(self, start: int = 0, end: Optional[int] = None) -> memoryview:
+        """The bytes from `start` to `end`, or to the end of the file, without copying them"""
+        view = self._view[start:end]
+        self._views.append(view)
+        return view
+
+    def close(self) -> None:
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._view.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # a view is still referenced elsewhere, the mapping is closed when it is garbage collected
+                log.debug(f"Could not close the memory map of file={self.name}, it is still in use")
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
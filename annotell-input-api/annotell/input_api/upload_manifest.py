@@ -0,0 +1,197 @@
+"""Local record of uploaded files, see `InputApiClient(upload_manifest=...)`"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+log = logging.getLogger(__name__)
+
+# signed upload urls expire, jobs older than this get new urls
+DEFAULT_UPLOAD_URL_TTL = 6 * 60 * 60  # seconds
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class FileFingerprint:
+    """Identifies the content of a file, by size, modification time and MD5 hash"""
+
+    def __init__(self, size: int, mtime_ns: int, md5: str):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.md5 = md5
+
+    @staticmethod
+    def of(path: Path) -> "FileFingerprint":
+        stat = path.stat()
+        md5 = hashlib.md5()
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                md5.update(chunk)
+        return FileFingerprint(stat.st_size, stat.st_mtime_ns, md5.hexdigest())
+
+    def matches(self, path: Path) -> bool:
+        """
+        True if the file still has this content. The file is only hashed again if its size is the
+        same but its modification time is not, e.g. when it has been copied.
+        """
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return False
+        if stat.st_size != self.size:
+            return False
+        if stat.st_mtime_ns == self.mtime_ns:
+            return True
+        return FileFingerprint.of(path).md5 == self.md5
+
+    def to_dict(self) -> dict:
+        return dict(size=self.size, mtimeNs=self.mtime_ns, md5=self.md5)
+
+    @staticmethod
+    def from_dict(js: dict) -> "FileFingerprint":
+        return FileFingerprint(js["size"], js["mtimeNs"], js["md5"])
+
+
+class _Job:
+    def __init__(self, internal_id: str, scene_key: str, files_to_url: Dict[str, str], created_at: float):
+        self.internal_id = internal_id
+        self.scene_key = scene_key
+        self.files_to_url = files_to_url
+        self.created_at = created_at
+        self.uploaded: Dict[str, FileFingerprint] = dict()
+
+
+class UploadManifest:
+    """
+    Remembers the upload urls of each input job, and which files have been uploaded to them. When an input
+    is created again for the same files after a failure, e.g. of the final request that creates the input,
+    the upload urls of the earlier attempt are reused and the files that were uploaded and have not changed
+    since are skipped. Once the input has been created its job is forgotten.
+
+    The manifest is a file of json lines, appended to as files are uploaded, so it is kept up to date
+    if the process is killed. Thread safe, but it should not be shared by processes running at the same time.
+    """
+
+    def __init__(self, path: Union[str, Path], url_ttl: float = DEFAULT_UPLOAD_URL_TTL):
+        """
+        :param path: the manifest file, created if it does not exist
+        :param url_ttl: seconds that the upload urls of a job are reused for
+        """
+        self.path = Path(path).expanduser()
+        self.url_ttl = url_ttl
+        self._jobs: Dict[str, _Job] = dict()
+        self._jobs_by_scene: Dict[str, str] = dict()
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._load()
+        self._compact()
+
+    @staticmethod
+    def scene_key(folder: Path, filenames: List[str]) -> str:
+        """Hash of the paths of the files of a scene, independent of their order"""
+        paths = sorted(str(folder.joinpath(filename).expanduser().resolve()) for filename in filenames)
+        return hashlib.sha256("\n".join(paths).encode("utf-8")).hexdigest()
+
+    def _apply(self, record: dict) -> None:
+        internal_id = record["job"]
+        if "filesToUrl" in record:
+            self._add(_Job(internal_id, record["scene"], record["filesToUrl"], record["createdAt"]))
+            return
+        job = self._jobs.get(internal_id)
+        if job is None:
+            return
+        if record.get("completed"):
+            self._forget(job)
+        elif "file" in record:
+            job.uploaded[record["file"]] = FileFingerprint.from_dict(record["fingerprint"])
+
+    def _add(self, job: _Job) -> None:
+        # a new job for the same files replaces the earlier one
+        previous_id = self._jobs_by_scene.get(job.scene_key)
+        if previous_id is not None:
+            self._jobs.pop(previous_id, None)
+        self._jobs[job.internal_id] = job
+        self._jobs_by_scene[job.scene_key] = job.internal_id
+
+    def _forget(self, job: _Job) -> None:
+        self._jobs.pop(job.internal_id, None)
+        if self._jobs_by_scene.get(job.scene_key) == job.internal_id:
+            del self._jobs_by_scene[job.scene_key]
+
+    def _load(self) -> None:
+        try:
+            with self.path.open() as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError) as e:
+                        # e.g. the last line, if the process was killed while writing it
+                        log.warning(f"Ignoring corrupt upload manifest record: {e}")
+        except FileNotFoundError:
+            pass
+
+    def _job_records(self, job: _Job) -> List[dict]:
+        records = [dict(job=job.internal_id, scene=job.scene_key, filesToUrl=job.files_to_url, createdAt=job.created_at)]
+        records += [dict(job=job.internal_id, file=filename, fingerprint=fingerprint.to_dict())
+                    for (filename, fingerprint) in job.uploaded.items()]
+        return records
+
+    def _compact(self) -> None:
+        """Rewrites the manifest with only the jobs that can still be reused"""
+        for job in list(self._jobs.values()):
+            if not self._is_fresh(job):
+                self._forget(job)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w") as f:
+            for job in self._jobs.values():
+                for record in self._job_records(job):
+                    f.write(json.dumps(record) + "\n")
+        tmp_path.replace(self.path)
+
+    def _append(self, record: dict) -> None:
+        with self.path.open("a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def _is_fresh(self, job: _Job) -> bool:
+        return time.time() - job.created_at < self.url_ttl
+
+    def get_job(self, scene_key: str, filenames: List[str]) -> Optional[Tuple[str, Dict[str, str]]]:
+        """The internal id and upload urls of an earlier job for the same files, if they can be reused"""
+        with self._lock:
+            internal_id = self._jobs_by_scene.get(scene_key)
+            job = self._jobs.get(internal_id) if internal_id is not None else None
+            if job is None or not self._is_fresh(job) or set(job.files_to_url) != set(filenames):
+                return None
+            return job.internal_id, dict(job.files_to_url)
+
+    def add_job(self, scene_key: str, internal_id: str, files_to_url: Dict[str, str]) -> None:
+        job = _Job(internal_id, scene_key, dict(files_to_url), time.time())
+        with self._lock:
+            self._add(job)
+            self._append(self._job_records(job)[0])
+
+    def is_uploaded(self, internal_id: str, filename: str, path: Path) -> bool:
+        """True if the file has been uploaded for the job and has not changed since"""
+        with self._lock:
+            job = self._jobs.get(internal_id)
+            fingerprint = job.uploaded.get(filename) if job is not None else None
+        return fingerprint is not None and fingerprint.matches(path)
+
+    def add_upload(self, internal_id: str, filename: str, fingerprint: FileFingerprint) -> None:
+        with self._lock:
+            job = self._jobs.get(internal_id)
+            if job is None:
+                return
+            job.uploaded[filename] = fingerprint
+            self._append(dict(job=internal_id, file=filename, fingerprint=fingerprint.to_dict()))
+
+    def complete_job(self, internal_id: str) -> None:
+        """Forgets the job once its input has been created, its upload urls cannot be used again"""
+        with self._lock:
+            job = self._jobs.get(internal_id)
+            if job is None:
+                return
+            self._forget(job)
+            self._append(dict(job=internal_id, completed=True))
@@ -1,22 +1,18 @@
 """Utility functions for Input API """
 
+import codecs
+import json
 import mimetypes
 from collections.abc import Mapping
-from datetime import datetime
-from pathlib import Path
-from PIL import Image as PILImage
-import dateutil.parser
+from typing import Any, Iterable, Iterator, Optional
 from urllib3.util import Url, parse_url
 
-
-GCS_SCHEME = "gs"
+from . import image_dimensions
+# ts_to_dt was defined here before
+from .input_api_model import ts_to_dt  # noqa: F401
 
 
-def ts_to_dt(date_string: str) -> datetime:
-    """
-    Parse string datetime into datetime
-    """
-    return dateutil.parser.parse(date_string)
+GCS_SCHEME = "gs"
 
 
 def filter_none(js: dict) -> dict:
@@ -43,7 +39,130 @@ def get_resource_id(signed_url: str) -> str:
 
 
 def get_image_dimensions(image_path: str) -> dict:
-    fi = Path(image_path).expanduser()
-    with PILImage.open(fi) as im:
-        width, height = im.size
-        return {"width": width, "height": height}
\ No newline at end of file
+    width, height = image_dimensions.get_image_dimensions(image_path)
+    return {"width": width, "height": height}
+
+
+class JsonStreamReader:
+    """
+    Parses a JSON document from a stream of byte chunks, one value at a time, so that large
+    arrays can be consumed without holding the whole document in memory.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Reads another chunk into the buffer, returns False at the end of the stream"""
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            text = self._utf8_decoder.decode(b"", final=True)
+        else:
+            text = self._utf8_decoder.decode(chunk)
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Returns the next non whitespace character without consuming it, or "" at the end of the stream"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\n\r":
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, characters: str) -> str:
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f"Expected one of '{characters}' in JSON stream, got '{character}'")
+        self._pos += 1
+        return character
+
+    def value(self) -> Any:
+        """Parses the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                value, end = None, None
+
+            # a number at the end of the buffer might continue in the next chunk
+            if end is not None and (end < len(self._buffer) or self._eof):
+                self._pos = end
+                return value
+
+            # grow the buffer geometrically, so large values are not re-parsed for every chunk
+            target_size = 2 * (len(self._buffer) - self._pos) + 1
+            filled = False
+            while len(self._buffer) - self._pos < target_size and self._fill():
+                filled = True
+            if not filled:
+                if end is not None:
+                    self._pos = end
+                    return value
+                raise ValueError("Unexpected end of JSON stream")
+
+    def array_items(self) -> Iterator[Any]:
+        """Yields each item of the array starting at the current position"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.expect("]")
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+    def object_items(self) -> Iterator[tuple]:
+        """Yields each (key, value) of the object starting at the current position"""
+        self.expect("{")
+        if self.peek() == "}":
+            self.expect("}")
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key, self.value()
+            if self.expect(",}") == "}":
+                return
+
+
+def iter_json_array(chunks: Iterable[bytes], key: Optional[str] = None) -> Iterator[Any]:
+    """
+    Yields the items of a JSON array as they are parsed from the chunks. The array is either the
+    whole document, or the value of `key` in the top level object, e.g. an enveloped response.
+    """
+    reader = JsonStreamReader(chunks)
+    if reader.peek() != "{":
+        yield from reader.array_items()
+        return
+
+    if key is None:
+        raise ValueError("Got a JSON object, but no key to read the array from")
+    reader.expect("{")
+    while reader.peek() != "}":
+        member = reader.value()
+        reader.expect(":")
+        if member == key:
+            yield from reader.array_items()
+            return
+        reader.value()
+        if reader.peek() == ",":
+            reader.expect(",")
+    raise KeyError(f"Missing key {key} in JSON response")
+
+
+def iter_json_object(chunks: Iterable[bytes]) -> Iterator[tuple]:
+    """Yields the (key, value) pairs of a top level JSON object as they are parsed from the chunks"""
+    yield from JsonStreamReader(chunks).object_items()
@@ -36,7 +36,7 @@ setup(
     download_url='%s/tarball/%s' % (URL, version),
     keywords=['API', 'Annotell'],
     install_requires=[
-        'annotell-auth>=1.5.0,<2',
+        'annotell-auth>=1.6.0,<2',
         'annotell-cloud-storage>=0.3.0',
         'click>=7.1.1',
         'Pillow>=7.0.0',
@@ -45,6 +45,10 @@ setup(
         'python-dateutil',
         "dataclasses;python_version<'3.7'"
     ],
+    extras_require={
+        'async': ['annotell-auth[async]>=1.6.0,<2'],
+        'point-cloud': ['numpy', 'python-lzf']
+    },
     python_requires='>=3.6',
     include_package_data=True,
     package_data={
@@ -0,0 +1,227 @@
+import os
+import struct
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from annotell.input_api import input_api_model as IAM  # noqa: E402
+from annotell.input_api import point_cloud as PC  # noqa: E402
+from annotell.input_api.input_api_model import PointCloudError  # noqa: E402
+
+ASCII_PCD = """# .PCD v0.7 - Point Cloud Data file format
+VERSION 0.7
+FIELDS x y z intensity
+SIZE 4 4 4 1
+TYPE F F F U
+COUNT 1 1 1 1
+WIDTH 3
+HEIGHT 1
+VIEWPOINT 0 0 0 1 0 0 0
+POINTS 3
+DATA ascii
+1.5 2 3 10
+-1 0.25 nan 255
+4 5 6 0
+"""
+
+
+@pytest.fixture(params=["python", "python-lzf"])
+def lzf_codec(request, monkeypatch):
+    """Runs a test with the pure python LZF codec, and with python-lzf if it is installed"""
+    if request.param == "python":
+        monkeypatch.setattr(PC, "_lzf", None)
+    elif PC._lzf is None:
+        pytest.skip("python-lzf is not installed")
+    return request.param
+
+
+def _cloud(num_points: int = 100) -> PC.PointCloudData:
+    dtype = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("intensity", "<u1"), ("ring", "<u2")])
+    points = np.zeros(num_points, dtype=dtype)
+    points["x"] = np.linspace(-10, 10, num_points)
+    points["y"] = np.arange(num_points) % 7
+    points["z"] = 1.5
+    points["intensity"] = np.arange(num_points) % 256
+    points["ring"] = np.arange(num_points) // 10
+    return PC.PointCloudData(points, PC.PCD_BINARY)
+
+
+def _assert_same_points(expected: "np.ndarray", actual: "np.ndarray"):
+    assert expected.dtype.names == actual.dtype.names
+    for name in expected.dtype.names:
+        np.testing.assert_array_equal(expected[name], actual[name])
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"a",
+    b"abcabcabcabcabcabcabcabc",
+    bytes(range(256)) * 40,
+    os.urandom(5000),
+])
+def test_lzf_round_trip(lzf_codec, data):
+    compressed = PC.lzf_compress(data)
+    assert PC.lzf_decompress(compressed, len(data)) == data
+
+
+def test_lzf_decompresses_overlapping_matches(lzf_codec):
+    data = b"a" * 1000
+    compressed = PC.lzf_compress(data)
+    assert len(compressed) < 100
+    assert PC.lzf_decompress(compressed, len(data)) == data
+
+
+@pytest.mark.parametrize("cut", [1, 2, 10])
+def test_lzf_truncated_stream(lzf_codec, cut):
+    data = bytes(range(256)) * 8 + os.urandom(300)
+    compressed = PC.lzf_compress(data)
+    with pytest.raises(ValueError):
+        PC.lzf_decompress(compressed[:-cut], len(data))
+
+
+def test_lzf_wrong_size(lzf_codec):
+    data = b"abcdefgh" * 10
+    with pytest.raises(ValueError):
+        PC.lzf_decompress(PC.lzf_compress(data), len(data) + 1)
+
+
+def test_read_ascii_pcd(tmp_path):
+    path = tmp_path / "cloud.pcd"
+    path.write_text(ASCII_PCD)
+    cloud = PC.read_pcd(path)
+    assert cloud.data_format == PC.PCD_ASCII
+    assert cloud.fields == ["x", "y", "z", "intensity"]
+    assert cloud.num_points == 3
+    np.testing.assert_array_equal(cloud.points["x"], [1.5, -1, 4])
+    assert np.isnan(cloud.points["z"][1])
+    np.testing.assert_array_equal(cloud.points["intensity"], [10, 255, 0])
+
+
+@pytest.mark.parametrize("data_format", [PC.PCD_BINARY, PC.PCD_BINARY_COMPRESSED])
+def test_pcd_round_trip(tmp_path, lzf_codec, data_format):
+    cloud = _cloud()
+    path = tmp_path / "cloud.pcd"
+    PC.write_pcd(cloud, path, data_format)
+    read = PC.read_pcd(path)
+    assert read.data_format == data_format
+    assert read.width == cloud.num_points
+    assert read.height == 1
+    _assert_same_points(cloud.points, read.points)
+
+
+@pytest.mark.parametrize("data_format", [PC.PCD_BINARY, PC.PCD_BINARY_COMPRESSED])
+def test_ascii_pcd_converted_round_trip(tmp_path, lzf_codec, data_format):
+    source = tmp_path / "cloud.pcd"
+    source.write_text(ASCII_PCD)
+    cloud = PC.read_pcd(source)
+    path = tmp_path / "converted.pcd"
+    PC.write_pcd(cloud, path, data_format)
+    _assert_same_points(cloud.points, PC.read_pcd(path).points)
+
+
+def test_truncated_compressed_pcd(tmp_path, lzf_codec):
+    path = tmp_path / "cloud.pcd"
+    PC.write_pcd(_cloud(), path, PC.PCD_BINARY_COMPRESSED)
+    data = path.read_bytes()
+    path.write_bytes(data[:-5])
+    with pytest.raises(PointCloudError, match="truncated"):
+        PC.read_pcd(path)
+
+
+def test_corrupt_compressed_pcd(tmp_path, lzf_codec):
+    path = tmp_path / "cloud.pcd"
+    PC.write_pcd(_cloud(), path, PC.PCD_BINARY_COMPRESSED)
+    data = path.read_bytes()
+    header_end = data.index(b"DATA binary_compressed\n") + len(b"DATA binary_compressed\n")
+    compressed_size, size = struct.unpack_from("<II", data, header_end)
+    # claim that the data decompresses to fewer bytes than the points need
+    path.write_bytes(data[:header_end] + struct.pack("<II", compressed_size, size - 4) + data[header_end + 8:])
+    with pytest.raises(PointCloudError):
+        PC.read_pcd(path)
+
+
+def test_truncated_binary_pcd(tmp_path):
+    path = tmp_path / "cloud.pcd"
+    PC.write_pcd(_cloud(), path, PC.PCD_BINARY)
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(PointCloudError):
+        PC.read_pcd(path)
+
+
+def test_read_csv_with_header(tmp_path):
+    path = tmp_path / "cloud.csv"
+    path.write_text('"x", "y", "z",intensity,ts\n1.5,2,3,10,1600000000123\n-1,0.25,4,255,1600000000124\n')
+    cloud = PC.read_csv(path)
+    assert cloud.data_format == PC.CSV
+    assert cloud.fields == ["x", "y", "z", "intensity", "ts"]
+    # coordinates are always floats, other columns get the smallest type that holds them
+    assert cloud.points.dtype["x"] == np.dtype("<f4")
+    assert cloud.points.dtype["intensity"] == np.dtype("<u1")
+    assert cloud.points.dtype["ts"] == np.dtype("<i8")
+    np.testing.assert_array_equal(cloud.points["y"], [2, 0.25])
+    np.testing.assert_array_equal(cloud.points["ts"], [1600000000123, 1600000000124])
+
+
+@pytest.mark.parametrize("data_format", [PC.PCD_BINARY, PC.PCD_BINARY_COMPRESSED])
+def test_csv_converted_round_trip(tmp_path, lzf_codec, data_format):
+    path = tmp_path / "cloud.csv"
+    path.write_text("x,y,z,intensity\n" + "".join(f"{i / 3},{-i},{i * 2},{i % 200}\n" for i in range(500)))
+    cloud = PC.read_point_cloud(path)
+    converted = tmp_path / "cloud.pcd"
+    PC.write_pcd(cloud, converted, data_format)
+    _assert_same_points(cloud.points, PC.read_pcd(converted).points)
+
+
+@pytest.mark.parametrize("content, message", [
+    ("x,y\n1,2\n", "missing the fields z"),
+    ("x,y,z\n", "has no points"),
+    ("x,y,z\n1,2\n", "the header has 3 fields but the rows have 2"),
+    ("x,y,z\n1,a,3\n", "invalid CSV data"),
+    ("x,x,z\n1,2,3\n", "unique names"),
+])
+def test_invalid_csv(tmp_path, content, message):
+    path = tmp_path / "cloud.csv"
+    path.write_text(content)
+    with pytest.raises(PointCloudError, match=message):
+        PC.read_point_cloud(path)
+
+
+def test_conversion_stays_in_its_directory(tmp_path, lzf_codec):
+    source = tmp_path / "a.csv"
+    source.write_text("x,y,z\n1,2,3\n")
+    point_cloud = IAM.PointCloud(str(source))
+    with PC.PointCloudConversion(PC.PCD_BINARY) as conversion:
+        conversion.convert(PC.read_point_cloud(source), point_cloud)
+        assert point_cloud.filename == str(tmp_path / "a.pcd")
+        converted = conversion.paths[point_cloud.filename]
+        assert Path(conversion._directory.name) in converted.parents
+        assert not (tmp_path / "a.pcd").exists()
+        _assert_same_points(PC.read_point_cloud(source).points, PC.read_pcd(converted).points)
+    assert point_cloud.filename == str(source)
+    assert not converted.exists()
+
+
+def test_conversion_filename_collision(tmp_path):
+    (tmp_path / "a.csv").write_text("x,y,z\n1,2,3\n")
+    PC.write_pcd(_cloud(), tmp_path / "a.pcd", PC.PCD_BINARY)
+    point_clouds = [IAM.PointCloud("a.csv"), IAM.PointCloud("a.pcd")]
+    with PC.PointCloudConversion(PC.PCD_BINARY) as conversion:
+        for point_cloud in point_clouds:
+            cloud = PC.read_point_cloud(tmp_path / point_cloud.filename)
+            if conversion.needs_conversion(cloud):
+                conversion.convert(cloud, point_cloud)
+        with pytest.raises(ValueError, match="a.pcd and a.csv|a.csv and a.pcd"):
+            conversion.check_filenames(point_clouds)
+
+
+def test_conversion_without_collision(tmp_path):
+    (tmp_path / "a.csv").write_text("x,y,z\n1,2,3\n")
+    (tmp_path / "b.csv").write_text("x,y,z\n1,2,3\n")
+    point_clouds = [IAM.PointCloud("a.csv"), IAM.PointCloud("b.csv")]
+    with PC.PointCloudConversion(PC.PCD_BINARY) as conversion:
+        for point_cloud in point_clouds:
+            conversion.convert(PC.read_point_cloud(tmp_path / point_cloud.filename), point_cloud)
+        conversion.check_filenames(point_clouds)
+        assert sorted(conversion.paths) == ["a.pcd", "b.pcd"]
@@ -0,0 +1,253 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from annotell.input_api import retry
+from annotell.input_api.retry import CircuitBreaker, RetryBudget, RetryPolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(retry.time, "monotonic", clock)
+    return clock
+
+
+def _open(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def _response(status_code: int, headers: dict = None) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.headers.update(headers or {})
+    return resp
+
+
+#
+# RetryBudget
+#
+
+
+def test_budget_allows_a_burst_of_capacity(clock):
+    budget = RetryBudget(capacity=3, refill_rate=1.0)
+    assert [budget.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+
+def test_budget_refills_at_the_refill_rate(clock):
+    budget = RetryBudget(capacity=3, refill_rate=0.5)
+    for _ in range(3):
+        assert budget.try_acquire()
+    clock.advance(1)
+    assert not budget.try_acquire()
+    clock.advance(1)
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+
+
+def test_budget_refills_up_to_capacity(clock):
+    budget = RetryBudget(capacity=2, refill_rate=10)
+    budget.try_acquire()
+    clock.advance(3600)
+    assert [budget.try_acquire() for _ in range(3)] == [True, True, False]
+
+
+def test_budget_is_shared_by_threads():
+    budget = RetryBudget(capacity=100, refill_rate=0)
+    acquired = []
+
+    def _acquire():
+        acquired.extend(budget.try_acquire() for _ in range(50))
+
+    threads = [threading.Thread(target=_acquire) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(acquired) == 100
+
+
+#
+# CircuitBreaker
+#
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.try_acquire()
+    assert breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.try_acquire()
+
+
+def test_breaker_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_lets_one_attempt_through_after_reset_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.advance(29)
+    assert not breaker.try_acquire()
+    clock.advance(1)
+    assert breaker.try_acquire()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.try_acquire()
+
+
+def test_breaker_closes_when_the_half_open_attempt_succeeds(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.advance(30)
+    assert breaker.try_acquire()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.try_acquire()
+    assert breaker.try_acquire()
+
+
+def test_breaker_opens_again_when_the_half_open_attempt_fails(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.advance(30)
+    assert breaker.try_acquire()
+    assert breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.try_acquire()
+    clock.advance(30)
+    assert breaker.try_acquire()
+
+
+def test_breaker_lets_another_attempt_through_if_the_half_open_outcome_is_lost(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.advance(30)
+    assert breaker.try_acquire()
+    clock.advance(29)
+    assert not breaker.try_acquire()
+    clock.advance(1)
+    assert breaker.try_acquire()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_breaker_inconclusive_failure_leaves_the_state(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_inconclusive()
+    assert breaker.state == CircuitBreaker.CLOSED
+    # the failure count is not reset either
+    assert breaker.record_failure()
+
+    breaker.record_inconclusive()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.try_acquire()
+
+
+def test_breaker_inconclusive_half_open_attempt_lets_the_next_through(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.advance(30)
+    assert breaker.try_acquire()
+    breaker.record_inconclusive()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.try_acquire()
+    assert not breaker.try_acquire()
+
+
+def test_breaker_acquire_waits_until_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+    breaker.record_failure()
+    waited = breaker.acquire()
+    assert 0.15 <= waited < 2
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_breaker_acquire_wakes_up_when_the_circuit_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+    breaker.record_failure()
+    breaker.acquire()  # the half open attempt
+    waited = []
+    thread = threading.Thread(target=lambda: waited.append(breaker.acquire()))
+    thread.start()
+    time.sleep(0.05)
+    breaker.record_success()
+    thread.join(timeout=2)
+    assert waited and waited[0] < 0.2
+
+
+#
+# RetryPolicy
+#
+
+
+def test_policy_non_retryable_failure_does_not_close_an_open_breaker(clock):
+    policy = RetryPolicy(circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30))
+    policy.record_failure(503)
+    policy.record_failure(503)
+    assert policy.circuit_breaker.state == CircuitBreaker.OPEN
+    policy.record_failure(403)
+    assert policy.circuit_breaker.state == CircuitBreaker.OPEN
+
+    clock.advance(30)
+    assert policy.circuit_breaker.try_acquire()
+    policy.record_failure(404)
+    assert policy.circuit_breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_policy_counts_connection_errors_as_failures(clock):
+    policy = RetryPolicy(circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30))
+    policy.record_failure()
+    policy.record_failure()
+    assert policy.circuit_breaker.state == CircuitBreaker.OPEN
+    assert policy.metrics.circuit_opened == 1
+
+
+def test_policy_should_retry(clock):
+    policy = RetryPolicy(max_attempts=3, budget=RetryBudget(capacity=10, refill_rate=0))
+    assert policy.should_retry(1)
+    assert policy.should_retry(1, 503)
+    assert not policy.should_retry(1, 403)
+    assert policy.should_retry(2, 429)
+    assert not policy.should_retry(3, 503)
+
+
+def test_policy_stops_retrying_when_the_budget_is_exhausted(clock):
+    policy = RetryPolicy(budget=RetryBudget(capacity=2, refill_rate=0))
+    assert policy.should_retry(1, 503)
+    assert policy.should_retry(1, 503)
+    assert not policy.should_retry(1, 503)
+    assert policy.metrics.budget_exhausted == 1
+
+
+def test_policy_wait_time(monkeypatch):
+    monkeypatch.setattr(retry.random, "random", lambda: 1.0)
+    policy = RetryPolicy(max_wait_time=10)
+    assert policy.get_wait_time(1) == 1
+    assert policy.get_wait_time(3) == 4
+    assert policy.get_wait_time(10) == 10
+    assert policy.get_wait_time(1, _response(429, {"Retry-After": "7"})) == 7
+    assert policy.get_wait_time(10, _response(429, {"Retry-After": "3"})) == 10
+    assert policy.get_wait_time(1, _response(503, {"Retry-After": "soon"})) == 1
@@ -4,7 +4,7 @@ import inspect
 import json
 import os
 import uuid
-from typing import BinaryIO
+from typing import BinaryIO, Optional
 
 from annotell.kpi import conf
 from annotell.kpi.events import EventManager
@@ -43,7 +43,8 @@ class ExecutionManager:
         ```
     """
 
-    def __init__(self, project_id, dataset_id, kpi_host=conf.KPI_MANAGER_HOST, auth_host=DEFAULT_AUTH_HOST):
+    def __init__(self, project_id, dataset_id, kpi_host=conf.KPI_MANAGER_HOST, auth_host=DEFAULT_AUTH_HOST,
+                 auth_session: Optional[AuthSession] = None):
         parser.add_argument('--job-id', type=str, help='Job ID')
         parser.add_argument('--organization-id', type=str, help='Organization ID')
         parser.add_argument("--project-id", type=str, help="Enables overriding project_id via arguments")
@@ -90,8 +91,12 @@ class ExecutionManager:
             self.job_id = get_emr_job_id(sc.getConf())
         log.info(f"[job_id              ] {self.job_id}")
 
-        # Determine if credentials are to be used from arguments or environment variables
-        if self.client_secret:
+        # Determine if credentials are to be used from arguments or environment variables,
+        # unless an authenticated session is shared with the script
+        if auth_session is not None:
+            log.info("[authentication      ] using shared auth session")
+            self.oauth_session = auth_session
+        elif self.client_secret:
             log.info(f"[authentication      ] using submitted credentials")
             self.oauth_session = AuthSession(host=auth_host, client_id=self.client_id, client_secret=self.client_secret)
         else:
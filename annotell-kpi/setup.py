@@ -43,7 +43,7 @@ setup(
     keywords=['KPI', 'Annotell', 'SDK'],
     install_requires=[
         'pyspark<3.0.0',
-        'annotell-auth>=1.4.0,<2',
+        'annotell-auth>=1.6.0,<2',
         'mongoengine'
     ],
     python_requires='~=3.6',
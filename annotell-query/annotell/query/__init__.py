@@ -1,2 +1,2 @@
-__version__ = "2.2.0"
+__version__ = "2.3.0"
 
@@ -0,0 +1,104 @@
+"""
+Columnar query results, as Arrow tables or pandas DataFrames. Requires the `arrow` extra:
+pip install annotell-query[arrow]
+"""
+from typing import Iterable, Iterator, List, Optional, Union
+
+try:
+    import pyarrow as pa
+except ImportError as e:
+    raise ImportError("Arrow output requires pyarrow, install with `pip install annotell-query[arrow]`") from e
+
+# items converted to columns at a time, only this many are held as dicts
+DEFAULT_ARROW_BATCH_SIZE = 10000
+
+
+def projected_columns(includes: Union[List[str], str, None]) -> Optional[List[str]]:
+    """
+    One column per included field, nested fields are named by their path, e.g. `metadata.speed`.
+    None if the columns cannot be known from `includes`, when it is empty or has wildcards.
+    """
+    if not includes:
+        return None
+    if isinstance(includes, str):
+        includes = [includes]
+    if any("*" in field for field in includes):
+        return None
+    return list(includes)
+
+
+def _get_path(item, path: List[str]):
+    for key in path:
+        if not isinstance(item, dict):
+            return None
+        item = item.get(key)
+    return item
+
+
+def to_record_batch(items: List[dict], columns: Optional[List[str]] = None) -> pa.RecordBatch:
+    """Items as a record batch with the given columns, or with the top level fields of any item if None"""
+    if columns is None:
+        columns = list(dict.fromkeys(key for item in items for key in item))
+        return pa.RecordBatch.from_pydict({column: [item.get(column) for item in items] for column in columns})
+    paths = [column.split(".") for column in columns]
+    return pa.RecordBatch.from_pydict({
+        column: [_get_path(item, path) for item in items]
+        for (column, path) in zip(columns, paths)
+    })
+
+
+def iter_record_batches(batches: Iterable[List[dict]],
+                        includes: Union[List[str], str, None] = None) -> Iterator[pa.RecordBatch]:
+    """
+    Converts each batch of items to a record batch. When the columns are not given by `includes`,
+    they are inferred per batch, so the schemas of the batches may differ.
+    """
+    columns = projected_columns(includes)
+    for items in batches:
+        if items:
+            yield to_record_batch(items, columns)
+
+
+def to_table(record_batches: Iterable[pa.RecordBatch],
+             includes: Union[List[str], str, None] = None) -> pa.Table:
+    """
+    Combines the record batches into one table, without copying them. Columns missing in some
+    batches are filled with nulls, and types are widened where batches disagree, e.g. int to float.
+    Raises `pyarrow.ArrowInvalid` if the types of a column cannot be widened, e.g. int and string.
+    """
+    tables = [pa.Table.from_batches([record_batch]) for record_batch in record_batches]
+    if not tables:
+        columns = projected_columns(includes) or []
+        return pa.table({column: pa.array([], type=pa.null()) for column in columns})
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except TypeError:
+        # pyarrow < 14, where promote=True only fills in missing columns
+        return _concat_tables_widened(tables)
+
+
+def _widen(name: str, types: List[pa.DataType]) -> pa.DataType:
+    """The type of a column that has the given types in different batches"""
+    types = [type for type in dict.fromkeys(types) if not pa.types.is_null(type)]
+    if not types:
+        return pa.null()
+    if len(types) == 1:
+        return types[0]
+    if all(pa.types.is_integer(type) or pa.types.is_floating(type) for type in types):
+        return pa.float64() if any(pa.types.is_floating(type) for type in types) else pa.int64()
+    raise pa.ArrowInvalid(f"Column {name} has incompatible types {', '.join(str(type) for type in types)}")
+
+
+def _concat_tables_widened(tables: List[pa.Table]) -> pa.Table:
+    """`concat_tables` with `promote_options="permissive"` for numbers and nulls, for pyarrow < 14"""
+    types = dict()
+    for table in tables:
+        for field in table.schema:
+            types.setdefault(field.name, []).append(field.type)
+    schema = pa.schema([(name, _widen(name, column_types)) for (name, column_types) in types.items()])
+    widened = []
+    for table in tables:
+        columns = [table.column(field.name) if field.name in table.column_names
+                   else pa.nulls(table.num_rows, type=field.type) for field in schema]
+        widened.append(pa.Table.from_arrays(columns, names=schema.names).cast(schema))
+    return pa.concat_tables(widened)
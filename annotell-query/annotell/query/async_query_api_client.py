@@ -0,0 +1,182 @@
+"""
+asyncio client for the Query API, with the same arguments as `QueryApiClient`. Requires the `async` extra:
+pip install annotell-query[async]
+"""
+import logging
+from typing import AsyncIterator, List, Optional
+
+from annotell.auth.authsession import DEFAULT_HOST as DEFAULT_AUTH_HOST
+from annotell.auth.async_authsession import httpx, AsyncAuthSession, resolve_async_auth_session
+
+from . import __version__
+from .query_api_client import (
+    QueryApiClient, DEFAULT_HOST, DEFAULT_LIMIT, FIELDS_TYPE, AGGREGATES_TYPE
+)
+from .query_model import AbstractQueryResponse, QueryResponse, QueryException
+from .util import StreamingItemsDecoder, STREAM_CHUNK_SIZE, DEFAULT_BATCH_SIZE
+
+log = logging.getLogger(__name__)
+
+
+class AsyncStreamingQueryResponse(AbstractQueryResponse):
+    """
+    Iterate over the items with `async for item in response.items()`. The connection is released when
+    all items have been read, call `aclose()` to release it before that.
+    """
+
+    def __init__(self, response: httpx.Response, includes=None):
+        self.raw_response = response
+        self.status_code = response.status_code
+        self.includes = includes
+
+    async def _iter_decoded_chunks(self) -> AsyncIterator[List[dict]]:
+        decoder = StreamingItemsDecoder()
+        try:
+            async for chunk in self.raw_response.aiter_bytes(STREAM_CHUNK_SIZE):
+                items = decoder.feed(chunk)
+                if items:
+                    yield items
+            items = decoder.close()
+            if items:
+                yield items
+        except httpx.StreamError as e:
+            raise QueryException("Got unexpected content in the streaming response from the the server") from e
+        finally:
+            await self.aclose()
+
+    async def items(self) -> AsyncIterator[dict]:
+        async for items in self._iter_decoded_chunks():
+            for item in items:
+                yield item
+
+    async def batches(self, batch_size: int = DEFAULT_BATCH_SIZE) -> AsyncIterator[List[dict]]:
+        """Lists of `batch_size` items, the last one possibly shorter"""
+        batch: List[dict] = []
+        async for items in self._iter_decoded_chunks():
+            batch.extend(items)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        if batch:
+            yield batch
+
+    async def to_arrow(self, batch_size: Optional[int] = None):
+        """See `StreamingQueryResponse.to_arrow`"""
+        from .arrow import iter_record_batches, to_table, DEFAULT_ARROW_BATCH_SIZE
+        record_batches = []
+        async for items in self.batches(batch_size or DEFAULT_ARROW_BATCH_SIZE):
+            record_batches.extend(iter_record_batches([items], self.includes))
+        return to_table(record_batches, self.includes)
+
+    async def to_pandas(self, batch_size: Optional[int] = None, **kwargs):
+        return (await self.to_arrow(batch_size)).to_pandas(**kwargs)
+
+    async def aclose(self):
+        await self.raw_response.aclose()
+
+
+class AsyncQueryApiClient:
+    """Like `QueryApiClient`, but with coroutines. Close the client with `aclose()`."""
+
+    def __init__(self, *,
+                 auth=None,
+                 host=DEFAULT_HOST,
+                 auth_host=DEFAULT_AUTH_HOST):
+        """
+        :param auth: Annotell authentication credentials,
+        see https://github.com/annotell/annotell-python/tree/master/annotell-auth,
+        or an AsyncAuthSession to share with other clients
+        :param host: Annotell api host
+        :param auth_host: authentication server host
+        """
+        self.host = host
+        self.metadata_url = "%s/v1/search/metadata/query" % self.host
+        self.judgements_query_url = "%s/v1/search/judgements/query" % self.host
+        self.kpi_query_url = "%s/v1/search/kpi/query" % self.host
+
+        self._owns_auth_session = not isinstance(auth, AsyncAuthSession)
+        self.auth_session = resolve_async_auth_session(auth=auth, host=auth_host)
+
+        self.headers = {
+            "Accept-Encoding": "gzip",
+            "Accept": "application/json",
+            "User-Agent": "annotell-query/%s" % __version__
+        }
+
+    async def aclose(self) -> None:
+        if self._owns_auth_session:
+            await self.auth_session.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def _query(self, url: str, stream: bool = False, **kwargs):
+        QueryApiClient._check_query_args(stream, **kwargs)
+        body = QueryApiClient._create_request_body(**kwargs)
+
+        params = {"stream": "true"} if stream else None
+
+        resp = await self.auth_session.post(url, json=body, headers=self.headers, params=params, stream=stream)
+        if resp.is_error:
+            msg = (await resp.aread()).decode()
+            await resp.aclose()
+            raise QueryException("Got %s error %s" % (resp.status_code, msg))
+        includes = kwargs.get("includes")
+        return AsyncStreamingQueryResponse(resp, includes) if stream else QueryResponse(resp, includes)
+
+    async def query_metadata(self,
+                             query_filter: Optional[str] = None,
+                             limit: Optional[int] = DEFAULT_LIMIT,
+                             includes: FIELDS_TYPE = None,
+                             excludes: FIELDS_TYPE = None,
+                             aggregates: AGGREGATES_TYPE = None,
+                             stream: bool = False):
+        """
+        Returns a QueryResponse or AsyncStreamingQueryResponse with result items,
+        see `QueryApiClient.query_metadata`
+        """
+        return await self._query(self.metadata_url, stream,
+                                 query_filter=query_filter,
+                                 limit=limit,
+                                 includes=includes,
+                                 excludes=excludes,
+                                 aggregates=aggregates)
+
+    async def query_kpi_data_entries(self,
+                                     query_filter: Optional[str] = None,
+                                     limit: Optional[int] = DEFAULT_LIMIT,
+                                     includes: FIELDS_TYPE = None,
+                                     excludes: FIELDS_TYPE = None,
+                                     aggregates: AGGREGATES_TYPE = None,
+                                     stream: bool = False):
+        """
+        Returns a QueryResponse or AsyncStreamingQueryResponse with result items,
+        see `QueryApiClient.query_kpi_data_entries`
+        """
+        return await self._query(self.kpi_query_url, stream,
+                                 query_filter=query_filter,
+                                 limit=limit,
+                                 includes=includes,
+                                 excludes=excludes,
+                                 aggregates=aggregates)
+
+    async def query_judgements(self,
+                               query_filter: Optional[str] = None,
+                               limit: Optional[int] = DEFAULT_LIMIT,
+                               includes: FIELDS_TYPE = None,
+                               excludes: FIELDS_TYPE = None,
+                               aggregates: AGGREGATES_TYPE = None,
+                               stream: bool = False):
+        """
+        Returns a QueryResponse or AsyncStreamingQueryResponse with result items,
+        see `QueryApiClient.query_judgements`
+        """
+        return await self._query(self.judgements_query_url, stream,
+                                 query_filter=query_filter,
+                                 limit=limit,
+                                 includes=includes,
+                                 excludes=excludes,
+                                 aggregates=aggregates)
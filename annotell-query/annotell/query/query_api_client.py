@@ -1,11 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Mapping, Union
 import requests
 import logging
 
 from annotell.auth.authsession import DEFAULT_HOST as DEFAULT_AUTH_HOST, FaultTolerantAuthRequestSession
+from annotell.auth.connection_pool import Timeout
 
 from . import __version__
-from .query_model import QueryResponse, StreamingQueryResponse, QueryException
+from .query_model import QueryResponse, StreamingQueryResponse, QueryException, QueryManyException
+from .query_cache import QueryCache
+from .sliced_query import SlicedQueryResponse, DEFAULT_SLICE_WORKERS, DEFAULT_SLICE_RETRIES
+from .resumable_query import QueryCheckpoint, ResumableQueryResponse, DEFAULT_RESUME_RETRIES
 
 DEFAULT_HOST = "https://query.annotell.com"
 
@@ -13,41 +18,107 @@ DEFAULT_HOST = "https://query.annotell.com"
 DEFAULT_LIMIT = -1
 MAX_LIMIT = 10000
 
+# the data that can be queried
+METADATA = "metadata"
+JUDGEMENTS = "judgements"
+KPI = "kpi"
+
 FIELDS_TYPE = Union[List[str], str, None]
 AGGREGATES_TYPE = Optional[Mapping[str, dict]]
 
+DEFAULT_QUERY_MANY_WORKERS = 8
+
 log = logging.getLogger(__name__)
 
 
+class QuerySpec:
+    """A query for `QueryApiClient.query_many`, with the arguments of `query_metadata` and the others"""
+
+    def __init__(self,
+                 query_type: str = METADATA,
+                 query_filter: Optional[str] = None,
+                 limit: Optional[int] = DEFAULT_LIMIT,
+                 includes: FIELDS_TYPE = None,
+                 excludes: FIELDS_TYPE = None,
+                 aggregates: AGGREGATES_TYPE = None):
+        """
+        :param query_type: METADATA, JUDGEMENTS or KPI
+        :param query_filter:
+        :param limit: set to None for no limit
+        :param includes: list
+        :param excludes: list
+        :param aggregates: dict
+        """
+        self.query_type = query_type
+        self.query_filter = query_filter
+        self.limit = limit
+        self.includes = includes
+        self.excludes = excludes
+        self.aggregates = aggregates
+
+    def __repr__(self):
+        return f"QuerySpec(query_type={self.query_type}, query_filter={self.query_filter!r})"
+
+
 class QueryApiClient:
     def __init__(self, *,
                  auth=None,
                  host=DEFAULT_HOST,
-                 auth_host=DEFAULT_AUTH_HOST):
+                 auth_host=DEFAULT_AUTH_HOST,
+                 pool_maxsize: Optional[int] = None,
+                 tcp_keepalive: bool = False,
+                 timeout: Timeout = None,
+                 query_cache: Optional[QueryCache] = None):
         """
         :param auth: Annotell authentication credentials,
-        see https://github.com/annotell/annotell-python/tree/master/annotell-auth
+        see https://github.com/annotell/annotell-python/tree/master/annotell-auth,
+        or an AuthSession to share with other clients
         :param host: Annotell api host
         :param auth_host: authentication server host
+        :param pool_maxsize: max number of connections kept open to the api, defaults to 10.
+        Set it to at least the number of threads sending queries. Not applied to an AuthSession given as `auth`,
+        whose connection pool is shared with other clients.
+        :param tcp_keepalive: send TCP keep-alive probes on idle connections
+        :param timeout: timeout for requests, in seconds or as (connect, read). For streaming queries the
+        read timeout is the max time between two received chunks. Waits forever if None.
+        :param query_cache: cache for the responses of queries that are not streamed, e.g. `QueryCache(ttl=600)`.
+        Identical queries within the ttl are answered from the cache, without a request to the api.
         """
         self.host = host
         self.metadata_url = "%s/v1/search/metadata/query" % self.host
         self.judgements_query_url = "%s/v1/search/judgements/query" % self.host
         self.kpi_query_url = "%s/v1/search/kpi/query" % self.host
+        self.query_urls = {
+            METADATA: self.metadata_url,
+            JUDGEMENTS: self.judgements_query_url,
+            KPI: self.kpi_query_url
+        }
 
-        self._auth_req_session = FaultTolerantAuthRequestSession(auth=auth, host=auth_host)
+        self._auth_req_session = FaultTolerantAuthRequestSession(auth=auth,
+                                                                 host=auth_host,
+                                                                 pool_maxsize=pool_maxsize,
+                                                                 tcp_keepalive=tcp_keepalive,
+                                                                 timeout=timeout)
 
         self.headers = {
             "Accept-Encoding": "gzip",
             "Accept": "application/json",
             "User-Agent": "annotell-query/%s" % __version__
         }
+        self.query_cache = query_cache
 
     @property
     def session(self):
         return self._auth_req_session
 
-    def _create_request_body(self, *,
+    @property
+    def _cache_identity(self) -> str:
+        """The credentials the queries are sent with, part of the query cache key"""
+        auth_session = self.session.auth_session
+        return f"{auth_session.client_id}@{auth_session.host}"
+
+    @staticmethod
+    def _create_request_body(*,
                              query_filter: Optional[str] = None,
                              limit: Optional[int] = DEFAULT_LIMIT,
                              includes: FIELDS_TYPE = None,
@@ -85,8 +156,8 @@ class QueryApiClient:
         except requests.exceptions.ChunkedEncodingError as e:
             raise QueryException("Got unexpected content in the streaming response from the the server") from e
 
-    def _query(self, url: str, stream: bool = False, **kwargs):
-
+    @staticmethod
+    def _check_query_args(stream: bool, **kwargs):
         aggs = kwargs.get("aggregates")
         if aggs and stream:
             raise ValueError("Cannot use aggregates in streaming mode")
@@ -99,7 +170,18 @@ class QueryApiClient:
             if not stream and limit > MAX_LIMIT:
                 raise ValueError(f"Use stream to get more than {MAX_LIMIT} items")
 
+    def _query(self, url: str, stream: bool = False, use_cache: bool = True, **kwargs):
+        self._check_query_args(stream, **kwargs)
         body = self._create_request_body(**kwargs)
+        includes = kwargs.get("includes")
+
+        # streaming responses are read once, and can be too large to keep
+        cache_key = None
+        if self.query_cache is not None and not stream:
+            cache_key = QueryCache.key(url, body, self._cache_identity)
+            cached = self.query_cache.get(cache_key) if use_cache else None
+            if cached is not None:
+                return QueryResponse(cached, includes)
 
         params = {"stream": "true"} if stream else None
 
@@ -111,7 +193,9 @@ class QueryApiClient:
             stream=stream
         )
         r = self._return_request_resp(resp)
-        return StreamingQueryResponse(r) if stream else QueryResponse(r)
+        if cache_key is not None:
+            self.query_cache.put(cache_key, r.content, r.headers)
+        return StreamingQueryResponse(r, includes) if stream else QueryResponse(r, includes)
 
     def query_metadata(self,
                        query_filter: Optional[str] = None,
@@ -119,7 +203,8 @@ class QueryApiClient:
                        includes: FIELDS_TYPE = None,
                        excludes: FIELDS_TYPE = None,
                        aggregates: AGGREGATES_TYPE = None,
-                       stream: bool = False):
+                       stream: bool = False,
+                       use_cache: bool = True):
         """
         Returns a QueryResponse or StreamingQueryResponse with result items
         :param query_filter:
@@ -127,9 +212,11 @@ class QueryApiClient:
         :param excludes: list
         :param includes: list
         :param stream, use stream if you want to get more than 10000 items
+        :param use_cache: False to send the query even if the response is in the query cache, and cache the new response
         :return:
         """
         return self._query(self.metadata_url, stream,
+                           use_cache=use_cache,
                            query_filter=query_filter,
                            limit=limit,
                            includes=includes,
@@ -142,7 +229,8 @@ class QueryApiClient:
                                includes: FIELDS_TYPE = None,
                                excludes: FIELDS_TYPE = None,
                                aggregates: AGGREGATES_TYPE = None,
-                               stream: bool = False):
+                               stream: bool = False,
+                               use_cache: bool = True):
         """
         Returns a QueryResponse or StreamingQueryResponse with result items
         :param query_filter:
@@ -151,9 +239,11 @@ class QueryApiClient:
         :param includes: list
         :param aggregates: dict
         :param stream, use stream if you want to get more than 10000 items
+        :param use_cache: False to send the query even if the response is in the query cache, and cache the new response
         :return:
         """
         return self._query(self.kpi_query_url,
+                           use_cache=use_cache,
                            query_filter=query_filter,
                            limit=limit,
                            includes=includes,
@@ -167,7 +257,8 @@ class QueryApiClient:
                          includes: FIELDS_TYPE = None,
                          excludes: FIELDS_TYPE = None,
                          aggregates: AGGREGATES_TYPE = None,
-                         stream: bool = False):
+                         stream: bool = False,
+                         use_cache: bool = True):
         """
         Returns a QueryResponse or StreamingQueryResponse with result items
         :param query_filter:
@@ -176,12 +267,179 @@ class QueryApiClient:
         :param includes: list
         :param aggregates: dict
         :param stream, use stream if you want to get more than 10000 items
+        :param use_cache: False to send the query even if the response is in the query cache, and cache the new response
         :return:
         """
         return self._query(self.judgements_query_url,
+                           use_cache=use_cache,
                            query_filter=query_filter,
                            limit=limit,
                            includes=includes,
                            excludes=excludes,
                            aggregates=aggregates,
                            stream=stream)
+
+    def query_many(self,
+                   queries: List[QuerySpec],
+                   max_workers: int = DEFAULT_QUERY_MANY_WORKERS,
+                   use_cache: bool = True) -> List[QueryResponse]:
+        """
+        Sends the queries concurrently, to any of the query apis, and returns their responses in the same order.
+        The queries are not streamed. All queries are run even if some of them fail, and the failures
+        are then raised together in a QueryManyException, which also has the responses of the other queries.
+
+        e.g. `query_many([QuerySpec(JUDGEMENTS, f"requestId = {r}", aggregates=...) for r in request_ids])`
+
+        :param queries: the queries
+        :param max_workers: max number of queries sent at the same time, set `pool_maxsize` of the
+        client to at least this
+        :param use_cache: see `query_metadata`
+        :return: a QueryResponse per query
+        """
+        urls = [self._query_url(spec.query_type) for spec in queries]
+
+        def _run(index: int) -> QueryResponse:
+            spec = queries[index]
+            return self._query(urls[index],
+                               use_cache=use_cache,
+                               query_filter=spec.query_filter,
+                               limit=spec.limit,
+                               includes=spec.includes,
+                               excludes=spec.excludes,
+                               aggregates=spec.aggregates)
+
+        responses: List[Optional[QueryResponse]] = [None] * len(queries)
+        errors = dict()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_run, index) for index in range(len(queries))]
+            for (index, future) in enumerate(futures):
+                try:
+                    responses[index] = future.result()
+                except Exception as e:
+                    log.error(f"Query {index} failed, {queries[index]}: {e}")
+                    errors[index] = e
+
+        if errors:
+            raise QueryManyException(errors, responses)
+        return responses
+
+    def discard_cached_query(self,
+                             query_type: str = METADATA,
+                             query_filter: Optional[str] = None,
+                             limit: Optional[int] = DEFAULT_LIMIT,
+                             includes: FIELDS_TYPE = None,
+                             excludes: FIELDS_TYPE = None,
+                             aggregates: AGGREGATES_TYPE = None) -> None:
+        """
+        Removes the response of a query from the query cache, so that it is sent to the api the next time.
+        The arguments are the same as for the query.
+
+        :param query_type: METADATA, JUDGEMENTS or KPI
+        """
+        if self.query_cache is None:
+            return
+        body = self._create_request_body(query_filter=query_filter,
+                                         limit=limit,
+                                         includes=includes,
+                                         excludes=excludes,
+                                         aggregates=aggregates)
+        self.query_cache.discard(QueryCache.key(self._query_url(query_type), body, self._cache_identity))
+
+    def clear_query_cache(self) -> None:
+        """Removes all responses from the query cache"""
+        if self.query_cache is not None:
+            self.query_cache.clear()
+
+    def _query_url(self, query_type: str) -> str:
+        if query_type not in self.query_urls:
+            raise ValueError(f"Unknown query type {query_type}, expected one of {list(self.query_urls)}")
+        return self.query_urls[query_type]
+
+    def query_sliced(self,
+                     slice_filters: List[str],
+                     query_type: str = METADATA,
+                     query_filter: Optional[str] = None,
+                     includes: FIELDS_TYPE = None,
+                     excludes: FIELDS_TYPE = None,
+                     ordered: bool = False,
+                     max_workers: int = DEFAULT_SLICE_WORKERS,
+                     max_retries: int = DEFAULT_SLICE_RETRIES) -> SlicedQueryResponse:
+        """
+        Streams a query split into slices, each slice over a connection of its own, for results too large
+        to be read fast enough over a single stream. Use `range_slice_filters` from
+        `annotell.query.sliced_query` to split the query on ranges of a field, e.g.
+        `range_slice_filters("timestamp", ["2021-01-01", "2021-02-01"])`. The slices must not overlap,
+        or items are returned more than once.
+
+        :param slice_filters: one filter per slice, each combined with `query_filter`
+        :param query_type: METADATA, JUDGEMENTS or KPI
+        :param query_filter: filter of the whole query
+        :param includes: list
+        :param excludes: list
+        :param ordered: if True all items of the first slice are returned first, then the items of the
+        second and so on. Otherwise items are returned as soon as they are received.
+        :param max_workers: max number of slices streamed at the same time, set `pool_maxsize` of the
+        client to at least this
+        :param max_retries: max number of times a slice that failed is re-issued, without progress in between
+        :return: SlicedQueryResponse, iterate over `items()` or `batches()`
+        """
+        return SlicedQueryResponse(self, self._query_url(query_type),
+                                   slice_filters=slice_filters,
+                                   query_filter=query_filter,
+                                   includes=includes,
+                                   excludes=excludes,
+                                   ordered=ordered,
+                                   max_workers=max_workers,
+                                   max_retries=max_retries)
+
+    def query_resumable(self,
+                        sort_field: str,
+                        query_type: str = METADATA,
+                        query_filter: Optional[str] = None,
+                        includes: FIELDS_TYPE = None,
+                        excludes: FIELDS_TYPE = None,
+                        checkpoint_path: Optional[str] = None,
+                        max_retries: int = DEFAULT_RESUME_RETRIES) -> ResumableQueryResponse:
+        """
+        Streams a query, keeping a checkpoint of the last value of `sort_field` read. If the connection
+        fails, the query is re-issued for the items after the checkpoint. The server must return the items
+        in increasing order of `sort_field`, and its values must be unique; this is checked while the items
+        are read, and a QueryException is raised if they are not.
+
+        :param sort_field: unique field that the items are returned in increasing order of, added to `includes`
+        :param query_type: METADATA, JUDGEMENTS or KPI
+        :param query_filter: filter of the query
+        :param includes: list
+        :param excludes: list
+        :param checkpoint_path: json file to save the checkpoint to while the items are read, to resume
+        the query later with `resume_query`
+        :param max_retries: max number of times the query is re-issued, without progress in between
+        :return: ResumableQueryResponse, iterate over `items()` or `batches()`
+        """
+        self._query_url(query_type)
+        if isinstance(includes, str):
+            includes = [includes]
+        if isinstance(excludes, str):
+            excludes = [excludes]
+        checkpoint = QueryCheckpoint(query_type=query_type,
+                                     sort_field=sort_field,
+                                     query_filter=query_filter,
+                                     includes=includes,
+                                     excludes=excludes)
+        return self.resume_query(checkpoint, checkpoint_path=checkpoint_path, max_retries=max_retries)
+
+    def resume_query(self,
+                     checkpoint: QueryCheckpoint,
+                     checkpoint_path: Optional[str] = None,
+                     max_retries: int = DEFAULT_RESUME_RETRIES) -> ResumableQueryResponse:
+        """
+        Continues a query from a checkpoint, e.g. `resume_query(QueryCheckpoint.load(path), checkpoint_path=path)`
+
+        :param checkpoint: checkpoint of a query started with `query_resumable`
+        :param checkpoint_path: json file to save the checkpoint to while the items are read
+        :param max_retries: max number of times the query is re-issued, without progress in between
+        :return: ResumableQueryResponse with the items after the checkpoint
+        """
+        return ResumableQueryResponse(self, self._query_url(checkpoint.query_type), checkpoint,
+                                      checkpoint_path=checkpoint_path,
+                                      max_retries=max_retries)
@@ -0,0 +1,204 @@
+"""Client side cache of query results, see `QueryApiClient(query_cache=...)`"""
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Mapping, Optional, Union
+
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .util import _loads
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 5 * 60  # seconds
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 64 * 2 ** 20
+
+_SUFFIX = ".query.z"
+# an entry on disk is the time it was cached and the size of the response headers, followed by the
+# headers as json and the zlib compressed response body
+_HEADER = struct.Struct(">dI")
+
+
+class CachedResponse:
+    """
+    A cached response, in place of the http response of a `QueryResponse`, with the body and headers
+    of the response that was cached
+    """
+    status_code = 200
+    ok = True
+    reason = "OK"
+
+    def __init__(self, content: bytes, headers: Optional[Mapping[str, str]] = None):
+        self.content = content
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.encoding = get_encoding_from_headers(self.headers)
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return _loads(self.content)
+
+
+class QueryCache:
+    """
+    Least recently used cache of query responses, their bodies and headers, keyed by the query url, the request body and
+    the identity of the credentials the query was sent with, so that clients with different credentials
+    sharing a cache never see each other's responses.
+    Bounded by `max_entries` and the total size `max_bytes` of the bodies in memory. Entries older
+    than `ttl` seconds are not used. Thread safe. With a `directory` the bodies are also stored on
+    disk, compressed, and can be shared between processes and runs.
+    """
+
+    def __init__(self,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: float = DEFAULT_TTL,
+                 directory: Optional[Union[str, Path]] = None):
+        """
+        :param max_entries: max number of responses kept in memory
+        :param max_bytes: max total size of the responses kept in memory
+        :param ttl: seconds until an entry expires
+        :param directory: directory to store the cache in, in memory only if None
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = Path(directory).expanduser() if directory is not None else None
+        # key -> (time cached, response body, response headers), least recently used first
+        self._entries = OrderedDict()
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(url: str, body: dict, identity: Optional[str] = None) -> str:
+        """
+        Hash of the url, the canonical JSON of the request body, independent of key order, and the identity
+
+        :param url: query url
+        :param body: request body
+        :param identity: who the query is sent as, e.g. the client id of the credentials
+        """
+        canonical = json.dumps(dict(url=url, body=body, identity=identity), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _is_fresh(self, cached_at: float) -> bool:
+        return time.time() - cached_at < self.ttl
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """The cached response, None if there is none or it has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.directory is not None:
+            entry = self._read(key)
+            if entry is not None:
+                self._remember(key, entry)
+
+        if entry is None:
+            return None
+        cached_at, content, headers = entry
+        if not self._is_fresh(cached_at):
+            self.discard(key)
+            return None
+        return CachedResponse(content, headers)
+
+    def put(self, key: str, content: bytes, headers: Optional[Mapping[str, str]] = None) -> None:
+        """
+        :param key: see `key`
+        :param content: the response body
+        :param headers: the response headers
+        """
+        entry = (time.time(), content, dict(headers or {}))
+        self._remember(key, entry)
+        if self.directory is not None:
+            self._write(key, entry)
+
+    def _remember(self, key: str, entry) -> None:
+        size = len(entry[1])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._num_bytes -= len(previous[1])
+            self._entries[key] = entry
+            self._num_bytes += size
+            while len(self._entries) > self.max_entries or self._num_bytes > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._num_bytes -= len(evicted)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._num_bytes -= len(entry[1])
+        if self.directory is not None:
+            try:
+                os.remove(self.directory / f"{key}{_SUFFIX}")
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._num_bytes = 0
+        if self.directory is not None:
+            for path in self.directory.glob(f"*{_SUFFIX}"):
+                path.unlink()
+
+    def prune(self) -> None:
+        """Removes the expired entries from disk, which are otherwise only removed when they are read"""
+        if self.directory is None:
+            return
+        for path in self.directory.glob(f"*{_SUFFIX}"):
+            try:
+                with open(path, "rb") as f:
+                    (cached_at, _) = _HEADER.unpack(f.read(_HEADER.size))
+                if not self._is_fresh(cached_at):
+                    path.unlink()
+            except (FileNotFoundError, struct.error):
+                pass
+
+    def _read(self, key: str):
+        try:
+            with open(self.directory / f"{key}{_SUFFIX}", "rb") as f:
+                data = f.read()
+            (cached_at, headers_size) = _HEADER.unpack_from(data)
+            headers_end = _HEADER.size + headers_size
+            headers = json.loads(data[_HEADER.size:headers_end].decode("utf-8"))
+            return cached_at, zlib.decompress(data[headers_end:]), headers
+        except FileNotFoundError:
+            return None
+        except (struct.error, zlib.error, ValueError) as e:
+            log.warning(f"Ignoring corrupt query cache entry {key}: {e}")
+            return None
+
+    def _write(self, key: str, entry) -> None:
+        cached_at, content, headers = entry
+        headers_json = json.dumps(headers).encode("utf-8")
+        # write to a temporary file first, so other processes never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(cached_at, len(headers_json)))
+                f.write(headers_json)
+                f.write(zlib.compress(content))
+            os.replace(tmp_path, self.directory / f"{key}{_SUFFIX}")
+        except BaseException:
+            os.remove(tmp_path)
+            raise
@@ -1,13 +1,36 @@
-from .util import iter_streaming_items
+from typing import Dict, List, Optional
+
+import requests
+
+from .util import iter_streaming_items, iter_streaming_batches, DEFAULT_BATCH_SIZE
 
 class AbstractQueryResponse(object):
     def items(self):
         raise NotImplementedError
 
+    def to_arrow(self):
+        """The items as a pyarrow Table, requires `pip install annotell-query[arrow]`"""
+        raise NotImplementedError
+
+    def to_pandas(self, **kwargs):
+        """
+        The items as a pandas DataFrame, converted from `to_arrow()`
+
+        :param kwargs: passed to `pyarrow.Table.to_pandas`
+        """
+        return self.to_arrow().to_pandas(**kwargs)
+
+
 class QueryResponse(AbstractQueryResponse):
-    def __init__(self, response):
+    def __init__(self, response, includes=None):
+        """
+        :param response: the http response, or a `CachedResponse` with the body and headers of the cached
+        response if it is from the query cache
+        :param includes: the included fields of the query, used as columns by `to_arrow`
+        """
         self.raw_response = response
         self.status_code = response.status_code
+        self.includes = includes
         self._json = None
 
     @property
@@ -39,15 +62,81 @@ class QueryResponse(AbstractQueryResponse):
     def head(self):
         return self.items()[0] if self.returned_hits > 0 else None
 
-class StreamingQueryResponse(AbstractQueryResponse):
+    def to_arrow(self):
+        from .arrow import iter_record_batches, to_table
+        return to_table(iter_record_batches([self.items()], self.includes), self.includes)
+
+class AbstractStreamingQueryResponse(AbstractQueryResponse):
+    """A response with items that are read in batches, while they are received"""
+    includes = None
+
+    def items(self):
+        for batch in self.batches():
+            yield from batch
+
+    def batches(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        raise NotImplementedError
+
+    def iter_record_batches(self, batch_size: Optional[int] = None):
+        """
+        Iterator of pyarrow RecordBatches of `batch_size` items, converted while the response is read.
+        Columns not given by `includes` are inferred per batch. Requires `pip install annotell-query[arrow]`
+        """
+        from .arrow import iter_record_batches, DEFAULT_ARROW_BATCH_SIZE
+        return iter_record_batches(self.batches(batch_size or DEFAULT_ARROW_BATCH_SIZE), self.includes)
+
+    def to_arrow(self, batch_size: Optional[int] = None):
+        """
+        The items as a pyarrow Table, built from record batches while the response is read, so that
+        at most `batch_size` items are held as dicts at a time
+        """
+        from .arrow import to_table
+        return to_table(self.iter_record_batches(batch_size), self.includes)
+
+    def to_pandas(self, batch_size: Optional[int] = None, **kwargs):
+        return self.to_arrow(batch_size).to_pandas(**kwargs)
+
+
+class StreamingQueryResponse(AbstractStreamingQueryResponse):
 
-    def __init__(self, response):
+    def __init__(self, response, includes=None):
+        """
+        :param response: the http response
+        :param includes: the included fields of the query, used as columns by `to_arrow`
+        """
         self.raw_response = response
         self.status_code = response.status_code
+        self.includes = includes
 
     def items(self):
-        return iter_streaming_items(self.raw_response)
+        return self._raise_stream_errors(iter_streaming_items(self.raw_response))
+
+    def batches(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Iterator of lists of `batch_size` items, the last one possibly shorter"""
+        return self._raise_stream_errors(iter_streaming_batches(self.raw_response, batch_size))
+
+    @staticmethod
+    def _raise_stream_errors(iterator):
+        # the connection may break while the items are read, long after the query was sent
+        try:
+            yield from iterator
+        except requests.exceptions.ChunkedEncodingError as e:
+            raise QueryException("Got unexpected content in the streaming response from the the server") from e
 
 
 class QueryException(RuntimeError):
     pass
+
+
+class QueryManyException(QueryException):
+    """Raised by `QueryApiClient.query_many` when one or more of the queries failed"""
+
+    def __init__(self, errors: Dict[int, Exception], responses: List[Optional[QueryResponse]]):
+        """
+        :param errors: the error of each failed query, by its index in the list of queries
+        :param responses: the responses in the order of the queries, None for the failed ones
+        """
+        self.errors = errors
+        self.responses = responses
+        failures = ", ".join(f"query {index}: {e}" for (index, e) in sorted(errors.items()))
+        super().__init__(f"{len(errors)} of {len(responses)} queries failed: {failures}")
@@ -0,0 +1,197 @@
+"""Streaming queries that resume where they stopped, see `QueryApiClient.query_resumable`"""
+import json
+import logging
+import os
+import time
+from typing import Any, Iterator, List, Optional
+
+from .query_model import AbstractStreamingQueryResponse, QueryException
+from .sliced_query import format_filter_value, _is_retryable
+from .util import DEFAULT_BATCH_SIZE
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RESUME_RETRIES = 5
+
+_MISSING = object()
+
+
+class QueryCheckpoint:
+    """
+    The position of a streaming query, as the last value of `sort_field` read. The query continues with
+    the items with a greater value, so the server must return the items in increasing order of the field,
+    and the field must be unique. Save it as json with `save` and resume the query with
+    `QueryApiClient.resume_query(QueryCheckpoint.load(path))`.
+    """
+
+    def __init__(self,
+                 query_type: str,
+                 sort_field: str,
+                 query_filter: Optional[str] = None,
+                 includes: Optional[List[str]] = None,
+                 excludes: Optional[List[str]] = None,
+                 last_key: Any = None,
+                 num_items: int = 0,
+                 done: bool = False):
+        """
+        :param query_type: METADATA, JUDGEMENTS or KPI
+        :param sort_field: unique field that the items are returned in increasing order of
+        :param query_filter: filter of the query
+        :param includes: fields to include
+        :param excludes: fields to exclude
+        :param last_key: value of `sort_field` of the last item read, None if no item has been read
+        :param num_items: number of items read
+        :param done: True if all items have been read
+        """
+        self.query_type = query_type
+        self.sort_field = sort_field
+        self.query_filter = query_filter
+        self.includes = includes
+        self.excludes = excludes
+        self.last_key = last_key
+        self.num_items = num_items
+        self.done = done
+
+    def resume_filter(self) -> Optional[str]:
+        """The query filter for the items after the checkpoint"""
+        if self.last_key is None:
+            return self.query_filter
+        after_checkpoint = f"{self.sort_field} > {format_filter_value(self.last_key)}"
+        if not self.query_filter:
+            return after_checkpoint
+        return f"({self.query_filter}) AND ({after_checkpoint})"
+
+    def sort_key(self, item: dict) -> Any:
+        value = item
+        for key in self.sort_field.split("."):
+            value = value.get(key, _MISSING) if isinstance(value, dict) else _MISSING
+        if value is _MISSING or value is None:
+            raise QueryException(f"Item has no value for the sort field {self.sort_field}, cannot checkpoint the query")
+        return value
+
+    def advance(self, items: List[dict]) -> None:
+        """Moves the checkpoint past the items, which must follow it in increasing order of `sort_field`"""
+        last_key = self.last_key
+        for item in items:
+            key = self.sort_key(item)
+            if last_key is not None and not key > last_key:
+                raise QueryException(f"Items are not in increasing order of {self.sort_field}, {key!r} after "
+                                     f"{last_key!r}, the query cannot be resumed from a checkpoint")
+            last_key = key
+        self.last_key = last_key
+        self.num_items += len(items)
+
+    def to_dict(self) -> dict:
+        return {
+            "queryType": self.query_type,
+            "sortField": self.sort_field,
+            "queryFilter": self.query_filter,
+            "includes": self.includes,
+            "excludes": self.excludes,
+            "lastKey": self.last_key,
+            "numItems": self.num_items,
+            "done": self.done
+        }
+
+    @staticmethod
+    def from_dict(js: dict) -> "QueryCheckpoint":
+        return QueryCheckpoint(query_type=js["queryType"],
+                               sort_field=js["sortField"],
+                               query_filter=js.get("queryFilter"),
+                               includes=js.get("includes"),
+                               excludes=js.get("excludes"),
+                               last_key=js.get("lastKey"),
+                               num_items=js.get("numItems", 0),
+                               done=js.get("done", False))
+
+    def save(self, path: str) -> None:
+        """Writes the checkpoint to a json file, replacing the previous one in a single step"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str) -> "QueryCheckpoint":
+        with open(path) as f:
+            return QueryCheckpoint.from_dict(json.load(f))
+
+    def __repr__(self):
+        return f"QueryCheckpoint(query_type={self.query_type}, sort_field={self.sort_field}, " \
+               f"last_key={self.last_key!r}, num_items={self.num_items}, done={self.done})"
+
+
+class ResumableQueryResponse(AbstractStreamingQueryResponse):
+    """
+    Streams the items of a query after its checkpoint. When the connection fails, the query is re-issued
+    from the checkpoint. `checkpoint` covers all batches yielded so far, save it after processing a batch
+    or pass `checkpoint_path` to have it saved before each following batch is read.
+    """
+
+    def __init__(self, client, url: str, checkpoint: QueryCheckpoint,
+                 checkpoint_path: Optional[str] = None,
+                 max_retries: int = DEFAULT_RESUME_RETRIES):
+        """
+        :param client: the QueryApiClient sending the queries
+        :param url: query url
+        :param checkpoint: where to start the query
+        :param checkpoint_path: json file the checkpoint is saved to while the items are read
+        :param max_retries: max number of times the query is re-issued, without progress in between
+        """
+        self.client = client
+        self.url = url
+        self.checkpoint = checkpoint
+        self.checkpoint_path = checkpoint_path
+        self.max_retries = max_retries
+
+    @property
+    def includes(self):
+        return self.checkpoint.includes
+
+    def _save_checkpoint(self) -> None:
+        if self.checkpoint_path is not None:
+            self.checkpoint.save(self.checkpoint_path)
+
+    def _includes_with_sort_field(self) -> Optional[List[str]]:
+        includes = self.checkpoint.includes
+        if not includes or self.checkpoint.sort_field in includes:
+            return includes
+        return list(includes) + [self.checkpoint.sort_field]
+
+    def _read_batches(self, batch_size: int) -> Iterator[List[dict]]:
+        attempt = 0
+        while True:
+            resp = None
+            try:
+                resp = self.client._query(self.url, stream=True,
+                                          query_filter=self.checkpoint.resume_filter(),
+                                          limit=None,
+                                          includes=self._includes_with_sort_field(),
+                                          excludes=self.checkpoint.excludes)
+                for batch in resp.batches(batch_size):
+                    yield batch
+                    attempt = 0
+                return
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                attempt += 1
+                wait_time = min(2 ** attempt, 30)
+                log.warning(f"Query failed after {self.checkpoint.num_items} items, resuming it from the checkpoint "
+                            f"in {wait_time} seconds ({attempt}/{self.max_retries}): {e}")
+                time.sleep(wait_time)
+            finally:
+                if resp is not None:
+                    resp.raw_response.close()
+
+    def batches(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[dict]]:
+        """Lists of at most `batch_size` items after the checkpoint, which is moved past each batch as it is yielded"""
+        if self.checkpoint.done:
+            return
+        for batch in self._read_batches(batch_size):
+            # the batches yielded before have been processed when the next one is asked for
+            self._save_checkpoint()
+            self.checkpoint.advance(batch)
+            yield batch
+        self.checkpoint.done = True
+        self._save_checkpoint()
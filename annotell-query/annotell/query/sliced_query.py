@@ -0,0 +1,211 @@
+"""Parallel streaming of one query split into disjoint slices, see `QueryApiClient.query_sliced`"""
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Iterator, List, Optional, Sequence
+
+import requests
+
+from .query_model import AbstractStreamingQueryResponse, QueryException
+from .util import DEFAULT_BATCH_SIZE
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SLICE_WORKERS = 4
+DEFAULT_SLICE_RETRIES = 3
+# batches buffered per slice, before the slice waits for them to be consumed
+DEFAULT_SLICE_QUEUE_SIZE = 8
+
+_DONE = object()
+
+
+def format_filter_value(value: Any) -> str:
+    """Formats a value for a query filter, strings and dates are quoted"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    return json.dumps(str(value))
+
+
+def range_slice_filters(field: str, boundaries: Sequence[Any]) -> List[str]:
+    """
+    Filters for the disjoint ranges of `field` split at the given boundaries, in increasing order.
+    The first and last ranges are open ended, so that n boundaries give n + 1 slices covering all values.
+    Items without a value for the field are not in any of the slices.
+
+    e.g. range_slice_filters("timestamp", [10, 20]) gives
+    ["timestamp < 10", "timestamp >= 10 AND timestamp < 20", "timestamp >= 20"]
+    """
+    values = [format_filter_value(boundary) for boundary in boundaries]
+    if not values:
+        raise ValueError("At least one boundary is required")
+    filters = [f"{field} < {values[0]}"]
+    filters += [f"{field} >= {lower} AND {field} < {upper}" for (lower, upper) in zip(values, values[1:])]
+    filters.append(f"{field} >= {values[-1]}")
+    return filters
+
+
+def even_boundaries(lower: float, upper: float, num_slices: int) -> List[float]:
+    """The boundaries splitting [lower, upper) into `num_slices` ranges of the same width"""
+    if num_slices < 1:
+        raise ValueError("At least one slice is required")
+    width = (upper - lower) / num_slices
+    return [lower + width * i for i in range(1, num_slices)]
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, QueryException):
+        cause = error.__cause__
+        # bad requests, like an invalid filter, fail the same way every time
+        return not (isinstance(cause, requests.HTTPError) and cause.response is not None and
+                    cause.response.status_code < 500)
+    return isinstance(error, requests.RequestException)
+
+
+class _SliceFailed:
+    def __init__(self, index: int, error: Exception):
+        self.index = index
+        self.error = error
+
+
+class SlicedQueryResponse(AbstractStreamingQueryResponse):
+    """
+    Streams the slices of a query concurrently, one connection per slice, and merges them into one
+    iterator. The slices are started when iteration starts. A slice that fails mid-stream is re-issued,
+    skipping the items already read, which relies on the server returning the items of identical
+    queries in the same order. If a slice fails for good, iteration raises a QueryException and the
+    other slices are stopped.
+    """
+
+    def __init__(self, client, url: str,
+                 slice_filters: List[str],
+                 query_filter: Optional[str] = None,
+                 includes=None,
+                 excludes=None,
+                 ordered: bool = False,
+                 max_workers: int = DEFAULT_SLICE_WORKERS,
+                 max_retries: int = DEFAULT_SLICE_RETRIES,
+                 queue_size: int = DEFAULT_SLICE_QUEUE_SIZE):
+        """
+        :param client: the QueryApiClient sending the queries
+        :param url: query url
+        :param slice_filters: disjoint filters, one per slice, combined with `query_filter`
+        :param query_filter: the filter of the whole query
+        :param includes: fields to include
+        :param excludes: fields to exclude
+        :param ordered: yield all items of the first slice, then the second and so on, instead of
+        items in the order they are received
+        :param max_workers: max number of slices streamed at the same time
+        :param max_retries: max number of times a failed slice is re-issued, without progress in between
+        :param queue_size: number of batches read ahead per slice
+        """
+        self.client = client
+        self.url = url
+        self.slice_filters = slice_filters
+        self.query_filter = query_filter
+        self.includes = includes
+        self.excludes = excludes
+        self.ordered = ordered
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.queue_size = queue_size
+
+    def _slice_query_filter(self, index: int) -> str:
+        slice_filter = self.slice_filters[index]
+        if not self.query_filter:
+            return slice_filter
+        return f"({self.query_filter}) AND ({slice_filter})"
+
+    @staticmethod
+    def _put(out: queue.Queue, message, stopped: threading.Event) -> bool:
+        """Returns False if iteration has stopped"""
+        while not stopped.is_set():
+            try:
+                out.put(message, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _stream_slice(self, index: int, batch_size: int, out: queue.Queue, stopped: threading.Event) -> None:
+        num_read = 0
+        attempt = 0
+        while not stopped.is_set():
+            skip = num_read
+            try:
+                resp = self.client._query(self.url, stream=True,
+                                          query_filter=self._slice_query_filter(index),
+                                          limit=None,
+                                          includes=self.includes,
+                                          excludes=self.excludes)
+                try:
+                    for batch in resp.batches(batch_size):
+                        if skip:
+                            # already read before the slice was re-issued
+                            num_dropped = min(skip, len(batch))
+                            batch = batch[num_dropped:]
+                            skip -= num_dropped
+                            if not batch:
+                                continue
+                        if not self._put(out, batch, stopped):
+                            return
+                        num_read += len(batch)
+                        attempt = 0
+                finally:
+                    resp.raw_response.close()
+                self._put(out, _DONE, stopped)
+                return
+            except Exception as e:
+                if stopped.is_set():
+                    return
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    self._put(out, _SliceFailed(index, e), stopped)
+                    return
+                attempt += 1
+                wait_time = min(2 ** attempt, 30)
+                log.warning(f"Slice {index} failed after {num_read} items, re-issuing it in {wait_time} seconds "
+                            f"({attempt}/{self.max_retries}): {e}")
+                time.sleep(wait_time)
+
+    def batches(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[dict]]:
+        """Lists of at most `batch_size` items, from all slices. Each iteration issues the slices again."""
+        num_slices = len(self.slice_filters)
+        if self.ordered:
+            queues = [queue.Queue(maxsize=self.queue_size) for _ in range(num_slices)]
+        else:
+            shared_queue = queue.Queue(maxsize=self.queue_size * self.max_workers)
+            queues = [shared_queue] * num_slices
+
+        stopped = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            for index in range(num_slices):
+                executor.submit(self._stream_slice, index, batch_size, queues[index], stopped)
+
+            if self.ordered:
+                for slice_queue in queues:
+                    yield from self._iter_queue(slice_queue, 1)
+            else:
+                yield from self._iter_queue(shared_queue, num_slices)
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def _iter_queue(in_queue: queue.Queue, num_slices: int) -> Iterator[List[dict]]:
+        num_done = 0
+        while num_done < num_slices:
+            message = in_queue.get()
+            if message is _DONE:
+                num_done += 1
+            elif isinstance(message, _SliceFailed):
+                raise QueryException(f"Slice {message.index} of the query failed: {message.error}") from message.error
+            else:
+                yield message
@@ -1,8 +1,80 @@
 import json
+from typing import Iterable, Iterator, List
 
-def iter_streaming_items(resp):
-    # parse each line as a json document
-    for item in resp.iter_lines():
-        if item.startswith(b"{"):
-            item = item if not item.endswith(b",") else item[:-1]
-            yield json.loads(item)
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# bytes read from the response at a time, the default of iter_lines is 512
+STREAM_CHUNK_SIZE = 256 * 1024
+DEFAULT_BATCH_SIZE = 1000
+
+
+class StreamingItemsDecoder:
+    """
+    Decodes the items of a streaming response, which has each item as a json document on its own line,
+    followed by a comma except for the last one. Takes chunks of any size, and parses all complete
+    items of a chunk with a single call to the json parser, orjson if installed.
+    """
+
+    def __init__(self):
+        self._pending: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        end = chunk.rfind(b"\n")
+        if end == -1:
+            self._pending.append(chunk)
+            return []
+        self._pending.append(chunk[:end])
+        data = b"".join(self._pending)
+        self._pending = [chunk[end + 1:]]
+        return self._decode(data)
+
+    def close(self) -> List[dict]:
+        """Decodes the last line, if the stream did not end with a newline"""
+        data = b"".join(self._pending)
+        self._pending = []
+        return self._decode(data)
+
+    @staticmethod
+    def _decode(data: bytes) -> List[dict]:
+        # skips the lines with the brackets of the surrounding array
+        lines = [line for line in data.split(b"\n") if line[:1] == b"{"]
+        if not lines:
+            return []
+        body = b"\n".join(lines).rstrip()
+        if body[-1:] == b",":
+            body = body[:-1]
+        return _loads(b"[" + body + b"]")
+
+
+def iter_decoded_chunks(chunks: Iterable[bytes]) -> Iterator[List[dict]]:
+    """The items of the streaming response, decoded one chunk at a time"""
+    decoder = StreamingItemsDecoder()
+    for chunk in chunks:
+        items = decoder.feed(chunk)
+        if items:
+            yield items
+    items = decoder.close()
+    if items:
+        yield items
+
+
+def iter_streaming_items(resp, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[dict]:
+    for items in iter_decoded_chunks(resp.iter_content(chunk_size=chunk_size)):
+        yield from items
+
+
+def iter_streaming_batches(resp, batch_size: int = DEFAULT_BATCH_SIZE,
+                           chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[List[dict]]:
+    """Like `iter_streaming_items`, but yields lists of `batch_size` items, the last one possibly shorter"""
+    batch: List[dict] = []
+    for items in iter_decoded_chunks(resp.iter_content(chunk_size=chunk_size)):
+        batch.extend(items)
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if batch:
+        yield batch
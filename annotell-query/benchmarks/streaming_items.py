@@ -0,0 +1,102 @@
+"""
+Measures how many items per second are decoded from a streaming query response, without network.
+
+    python benchmarks/streaming_items.py --items 500000
+
+Compares line by line decoding with the stdlib json parser, as done up to annotell-query 2.2.0,
+with `StreamingQueryResponse.items()` and `batches()`, using orjson if it is installed.
+"""
+import argparse
+import io
+import json
+import time
+
+from annotell.query import util
+from annotell.query.query_model import StreamingQueryResponse
+
+
+class FakeResponse:
+    """Serves a streaming response body from memory, like a requests.Response"""
+    status_code = 200
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def iter_content(self, chunk_size: int = 1):
+        stream = io.BytesIO(self.body)
+        chunk = stream.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = stream.read(chunk_size)
+
+    def iter_lines(self, chunk_size: int = 512):
+        pending = b""
+        for chunk in self.iter_content(chunk_size):
+            lines = (pending + chunk).splitlines()
+            pending = lines.pop() if lines and chunk[-1:] != b"\n" else b""
+            yield from lines
+        if pending:
+            yield pending
+
+
+def create_body(num_items: int) -> bytes:
+    items = [
+        json.dumps({
+            "id": i,
+            "externalId": f"scene-{i}",
+            "tags": ["day", "highway"],
+            "metadata": {"speed": i * 0.5, "valid": True, "location": "x" * 40}
+        }).encode("utf-8")
+        for i in range(num_items)
+    ]
+    return b"[\n" + b",\n".join(items) + b"\n]\n"
+
+
+def decode_line_by_line(resp):
+    for item in resp.iter_lines():
+        if item.startswith(b"{"):
+            item = item if not item.endswith(b",") else item[:-1]
+            yield json.loads(item)
+
+
+def count_items(resp):
+    return sum(1 for _ in StreamingQueryResponse(resp).items())
+
+
+def count_batches(resp):
+    return sum(len(batch) for batch in StreamingQueryResponse(resp).batches())
+
+
+def measure(name: str, fun, body: bytes, expected: int) -> None:
+    started_at = time.perf_counter()
+    num_items = fun(FakeResponse(body))
+    elapsed = time.perf_counter() - started_at
+    assert num_items == expected, f"{name} decoded {num_items} of {expected} items"
+    print(f"{name:<36} {num_items / elapsed:>12,.0f} items/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200000, help="number of items in the response")
+    args = parser.parse_args()
+
+    body = create_body(args.items)
+    print(f"{args.items} items, {len(body) / 2 ** 20:.1f} MiB")
+
+    measure("line by line, json", lambda resp: sum(1 for _ in decode_line_by_line(resp)), body, args.items)
+
+    fast_loads = util._loads
+    util._loads = json.loads
+    measure("items(), json", count_items, body, args.items)
+    measure("batches(), json", count_batches, body, args.items)
+    util._loads = fast_loads
+
+    if fast_loads is not json.loads:
+        measure("items(), orjson", count_items, body, args.items)
+        measure("batches(), orjson", count_batches, body, args.items)
+    else:
+        print("install orjson to measure the fast path: pip install annotell-query[fast]")
+
+
+if __name__ == "__main__":
+    main()
@@ -39,8 +39,15 @@ setup(
     keywords=['API', 'Annotell'],
     install_requires=[
         'requests>=2.20,<3',
-        'annotell-auth>=1.5.0,<2'
+        'annotell-auth>=1.6.0,<2'
     ],
+    extras_require={
+        'async': ['annotell-auth[async]>=1.6.0,<2'],
+        'fast': ['orjson>=3'],
+        # pyarrow 7 and later require python 3.7
+        'arrow': ["pyarrow>=7;python_version>='3.7'", "pyarrow>=6,<7;python_version<'3.7'"],
+        'pandas': ["pyarrow>=7;python_version>='3.7'", "pyarrow>=6,<7;python_version<'3.7'", 'pandas']
+    },
     python_requires='~=3.6',
     include_package_data=True,
     package_data={